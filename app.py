@@ -1,13 +1,14 @@
 import os
 import sys
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from datetime import datetime
+from flask import Flask, Request, g, render_template, request, jsonify, send_from_directory
+from datetime import datetime, timedelta
 import uuid
+import tempfile
+import threading
+import time
 import json
-from werkzeug.utils import secure_filename
 from flask_cors import CORS
-from io import BytesIO
-from flask import send_file  # THÊM DÒNG NÀY
+from flask import Response, stream_with_context
 
 # Add modules path
 sys.path.append('modules')
@@ -15,14 +16,44 @@ sys.path.append('modules')
 # Import modules
 from modules.db_manager import DatabaseManager
 from modules.yolo_detector import YOLODetector
-from modules.fuzzy_matcher import FuzzyMatcher
+from modules.catalog_reloader import CatalogReloader
 from modules.ocr_engine import TextDetectionOCR
+from modules.plate_engine import get_plate_engine
+from modules.lot_topology import LotTopology
+from modules.data_export import EXPORT_FORMATS, stream_export
+from modules.image_store import is_store_key
+from modules.pipeline import (
+    MAX_IMAGE_BYTES, BatchPipeline, identify_vehicle, process_result, vehicle_record,
+)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+CATALOG_POLL_SECONDS = 5  # 0 disables watching inforcar.csv
+LOT_TOPOLOGY_PATH = 'database/lot_topology.json'  # floors, zones, slots, weight limits
+BOOT_TOKEN = uuid.uuid4().hex[:8]  # ETags from a previous server run never match
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 3000  # EventSource reconnect delay
+ARCHIVE_CHECK_SECONDS = 6 * 3600  # archive old exited vehicles, drop unreferenced images; 0 disables
+IMAGE_CACHE_SECONDS = 365 * 24 * 3600  # content-addressed uploads are immutable
+# Opt-in: check-ins commit the slot claim only and vehicle rows follow from a writer thread, so
+# /api/process answers with slot['vehicle_id'] = None and the row isn't readable right away
+WRITE_BEHIND = False
+MAX_BATCH_BYTES = 512 * 1024 * 1024  # /api/process/batch only (many images / a zip)
+
+
+class UploadRequest(Request):
+    """MAX_CONTENT_LENGTH everywhere except the batch ingest endpoint"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'process_batch':
+            return MAX_BATCH_BYTES
+        return super().max_content_length
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_IMAGE_BYTES
 
 # Enable CORS (allow frontend to call API)
 CORS(app)
@@ -34,18 +65,40 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 db_manager = None
 yolo_detector = None
 ocr_engine = None
-fuzzy_matcher = None
+catalog_reloader = None
+lot_topology = None
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_topology():
+    global lot_topology
+    if lot_topology is None:
+        lot_topology = LotTopology.load(LOT_TOPOLOGY_PATH)
+    return lot_topology
+
 def get_db():
     global db_manager
     if db_manager is None:
-        db_manager = DatabaseManager()
-        db_manager.init_parking_slots()
+        # Slots are synced with the topology inside the constructor (no wipe, no second init)
+        db_manager = DatabaseManager(topology=get_topology(), write_behind=WRITE_BEHIND,
+                                     image_dir=app.config['UPLOAD_FOLDER'])
+        if ARCHIVE_CHECK_SECONDS:
+            threading.Thread(target=_archive_loop, name='vehicle-archiver', daemon=True).start()
     return db_manager
 
+def _archive_loop():
+    while True:
+        try:
+            db_manager.archive_exited()
+        except Exception as e:
+            print(f"❌ Archiving failed: {e}")
+        try:
+            db_manager.collect_images()
+        except Exception as e:
+            print(f"❌ Image cleanup failed: {e}")
+        time.sleep(ARCHIVE_CHECK_SECONDS)
+
 def get_yolo():
     global yolo_detector
     if yolo_detector is None:
@@ -58,11 +111,26 @@ def get_ocr():
         ocr_engine = TextDetectionOCR()
     return ocr_engine
 
+def get_catalog():
+    global catalog_reloader
+    if catalog_reloader is None:
+        catalog_reloader = CatalogReloader('static/models/inforcar.csv', poll_interval=CATALOG_POLL_SECONDS,
+                                           floor_classes=get_topology().floor_classes())
+        catalog_reloader.start_watching()
+    return catalog_reloader
+
 def get_fuzzy():
-    global fuzzy_matcher
-    if fuzzy_matcher is None:
-        fuzzy_matcher = FuzzyMatcher('static/models/inforcar.csv')
-    return fuzzy_matcher
+    # Each request keeps the matcher it got here, even if a reload swaps in a new one
+    if 'fuzzy' not in g:
+        g.fuzzy = get_catalog().acquire()
+    return g.fuzzy
+
+@app.teardown_request
+def release_fuzzy(exc):
+    # After a streamed response too (stream_with_context keeps the request open until then)
+    fuzzy = g.pop('fuzzy', None)
+    if fuzzy is not None:
+        get_catalog().release(fuzzy)
 
 @app.route('/')
 def index():
@@ -70,7 +138,10 @@ def index():
 
 @app.route('/api/process', methods=['POST'])
 def process_image():
+    db = filename = None
     try:
+        if request.content_length and request.content_length > MAX_IMAGE_BYTES:
+            return jsonify({'success': False, 'error': 'Image too large'}), 413
         if 'image' not in request.files:
             return jsonify({'success': False, 'error': 'No image file'}), 400
         
@@ -81,11 +152,10 @@ def process_image():
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'Invalid file type'}), 400
         
-        # Save file safely
-        safe_name = secure_filename(file.filename)
-        filename = f"{uuid.uuid4().hex}_{safe_name}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Save by content hash (ab/cd/<sha256>.jpg): the same photo is stored once
+        db = get_db()
+        filename = db.images.save(file.stream, file.filename)
+        filepath = db.images.path(filename)
         
         print("=" * 60)
         print("🚗 START PROCESSING VEHICLE")
@@ -94,271 +164,138 @@ def process_image():
         # 1. YOLO detection - Lấy brand
         yolo = get_yolo()
         yolo_result = yolo.detect(filepath)
-        brand_yolo = yolo_result.get('brand', 'unknown').capitalize()
-        yolo_confidence = yolo_result.get('confidence', 0)
-
-        print(f"🎯 YOLO Detection: {brand_yolo} (confidence: {yolo_confidence:.2%})")
 
         # 2. OCR - Lấy list các text
         ocr = get_ocr()
         result = ocr.process_image(filepath)
 
-        # 3. Process OCR results
-        ocr_texts = []
-        if result and isinstance(result, dict) and 'detections' in result:
-            for detection in result['detections']:
-                text = detection.get('text', '').strip()
-                confidence = detection.get('confidence', 0)
-                if text:
-                    ocr_texts.append({'text': text, 'confidence': confidence})
-
-        print(f"📝 OCR Raw Results: {[t['text'] for t in ocr_texts]}")
-
-        # 4. Fuzzy match các OCR texts với database để tìm model
+        # 3-11. Brand + model -> catalog info, weight, floor, plate (modules/pipeline.py)
         fuzzy = get_fuzzy()
-        selected_model = None
-        # best_score = 0
-
-        print(f"🔍 Fuzzy matching OCR texts with database (model only):")
-
-        # Tạo list các text từ OCR (loại bỏ các text quá ngắn hoặc không có ý nghĩa)
-        candidate_texts = []
-        for text_item in ocr_texts:
-            text = text_item['text'].upper().strip()
-            confidence = text_item['confidence']
-            candidate_texts.append(text)
-            print(f"   Candidate: '{text}' (OCR confidence: {confidence:.2f})")
-
-        all_matches = []
-        # Fuzzy match mỗi candidate với database
-        for candidate in candidate_texts:
-            # Thử fuzzy match với database (chỉ model)
-            match_result = fuzzy.fuzzy_match_model(candidate)
-            
-            if match_result:
-                model_name = match_result.get('model')
-                match_score = match_result.get('score', 0)
-                print(f"   '{candidate}' → Matched: {model_name} (score: {match_score:.2f})")
-
-                all_matches.append((match_score, model_name, candidate))
-
-                # if match_score > best_score:
-                #     best_score = match_score
-                #     selected_model = model_name
-
-        if all_matches:
-             # Sắp xếp theo score giảm dần
-            all_matches.sort(reverse=True)
-            best_score, selected_model, best_candidate = all_matches[0]
+        identified = identify_vehicle(fuzzy, get_plate_engine(), yolo_result, result)
 
-            print(f"\n📊 Top matches:")
-            for i, (score, model, candidate) in enumerate(all_matches[:3]):  # Top 3
-                print(f"   {i+1}. '{candidate}' → {model} (score: {score:.2f})")
-            
-            print(f"\n🎯 Selected: '{best_candidate}' → {selected_model} (score: {best_score:.2f})")
-        else:
-            print("   No matches found from fuzzy matching")
-
-        # 5. Nếu không tìm được model bằng fuzzy match, thử tìm bằng keyword matching
-        if not selected_model:
-            print(f"⚠️ No fuzzy match found, trying keyword matching...")
-            
-            # Danh sách các model phổ biến để keyword matching
-            common_models = ['LANCER', 'COROLLA', 'CAMRY', 'CIVIC', 'ACCORD', 'OUTLANDER', 
-                            'PAJERO', 'CX-5', 'CR-V', 'RAV4', 'RANGER', 'EVEREST', 'VF8', 'VF9']
-            
-            for candidate in candidate_texts:
-                for model in common_models:
-                    # Kiểm tra nếu model có trong candidate (case-insensitive)
-                    if model.upper() in candidate.upper():
-                        selected_model = model
-                        print(f"   Keyword match: '{candidate}' contains '{model}'")
-                        break
-                if selected_model:
-                    break
-
-        # 6. Kết hợp brand từ YOLO và model từ OCR
-        final_brand = brand_yolo
-        final_model = selected_model
-
-        print(f"\n🎯 FINAL RESULT:")
-        print(f"   Brand (from YOLO): {final_brand}")
-        print(f"   Model (from OCR fuzzy): {final_model}")
-
-        # 7. Tìm thông tin xe đầy đủ từ database
-        if final_model:
-            car_info = fuzzy.find_car_info_by_brand_model(final_brand, final_model)
-        else:
-            # Nếu không có model, chỉ tìm bằng brand
-            car_info = fuzzy.find_car_info_by_brand(final_brand)
-
-        if not car_info:
-            print("❌ No match found in database, trying fallback...")
-            
-            # Fallback 1: Thử tìm chỉ bằng brand
-            car_info = fuzzy.find_car_info_by_brand(final_brand)
-            
-            # Fallback 2: Dùng thông tin mặc định
-            if not car_info:
-                print("⚠️ Using default car info")
-                car_info = {
-                    'Brand': final_brand if final_brand != 'unknown' else 'Unknown',
-                    'Model': final_model or 'Unknown',
-                    'Kerb Weight (kg)': '000',  # Trọng lượng trung bình
-                    'Year': 'Unknown',
-                    'Length (mm)': 'Unknown',
-                    'Width (mm)': 'Unknown',
-                    'Height (mm)': 'Unknown'
-                }
-
-        print(f"✅ Database Match Found:")
-        print(f"   Brand: {car_info.get('Brand', 'Unknown')}")
-        print(f"   Model: {car_info.get('Model', 'Unknown')}")
-        print(f"   Weight: {car_info.get('Kerb Weight (kg)', 'Unknown')} kg")
-        
-        # 8. Parse trọng lượng và xác định tầng
-        weight = fuzzy.parse_weight(car_info['Kerb Weight (kg)'])
-        floor = 1 if weight < 1000 else 2 if weight <= 2000 else 3
-        
-        print(f"⚖️ Weight Analysis:")
-        print(f"   Raw weight: {car_info['Kerb Weight (kg)']}")
-        print(f"   Parsed weight: {car_info['Kerb Weight (kg)']}")
-        print(f"   Assigned floor: {floor}")
-        
-        # 9. Tìm chỗ đỗ
-        db = get_db()
-        slot = db.find_available_slot(floor)
-        if not slot:
-            slot = db.find_any_available_slot()
-            if slot:
-                floor = slot['floor']
-                print(f"   Floor fallback assigned to floor {slot['floor']}")
+        # 12. Chọn slot và lưu xe trong cùng một transaction (không thể double-book)
+        vehicle_data = vehicle_record(identified, filename)
+        floor = identified['floor']
         
+        slot = db.allocate_and_park(vehicle_data, floor)
         if not slot:
+            db.release_image(filename)
             return jsonify({'success': False, 'error': 'Parking lot is full'}), 400
         
-        print(f"🅿️ Assigned parking: {slot['slot_code']} (Floor {floor})")
-        
-        # 10. Extract license plate (if present)
-        license_plate = None
-        for text_item in ocr_texts:
-            text = text_item['text'].upper().replace(' ', '')
-            import re
-            plate_pattern = r'\d{2}[A-Z]{1,2}\d{4,5}'
-            match = re.search(plate_pattern, text)
-            if match:
-                license_plate = match.group()
-                break
+        if slot['floor'] != floor:
+            print(f"   Floor fallback assigned to floor {slot['floor']}")
+        print(f"🅿️ Assigned parking: {slot['slot_code']} (Floor {slot['floor']})")
         
-        # # 11. Lấy model_raw từ OCR (nếu có)
-        # model_raw = None
-        # if ocr_texts:
-        #     # Lấy text có độ dài vừa phải, không quá ngắn
-        #     for text_item in ocr_texts:
-        #         text = text_item['text'].strip()
-        #         if 3 <= len(text) <= 20:
-        #             model_raw = text
-        #             break
-        model_raw = None
-        model_corrected = selected_model  # Đã được fuzzy matching
-
-        # Tìm OCR text tương ứng với selected_model
-        if all_matches and selected_model:
-            for score, matched_model, ocr_text in all_matches:
-                if matched_model == selected_model:
-                    model_raw = ocr_text  # Lấy OCR text gốc
-                    break
-            
-            # Nếu không tìm thấy, lấy candidate đầu tiên
-            if not model_raw and all_matches:
-                model_raw = all_matches[0][2]  # candidate từ match đầu tiên
-
-        print(f"📝 OCR → Fuzzy matching:")
-        print(f"   '{model_raw}' → '{model_corrected}'")
-
-
-        # 12. Save vehicle
-        vehicle_data = {
-            'license_plate': license_plate or f"UNK_{str(uuid.uuid4())[:6]}",
-            'brand_raw': brand_yolo,
-            'brand_corrected': car_info.get('Brand', 'Unknown'),
-            'model_raw': model_raw or 'Unknown',
-            'model_corrected': car_info.get('Model', 'Unknown'),
-            'weight': weight,
-            'detected_floor': floor,
-            'assigned_slot': slot['slot_code'],
-            'image_path': filename,
-            'entry_time': datetime.now()
-        }
-        
-        vehicle_id = db.add_vehicle(vehicle_data, slot['id'])
-        
-        print(f"💾 Saved to database with ID: {vehicle_id}")
+        if slot['vehicle_id']:
+            print(f"💾 Saved to database with ID: {slot['vehicle_id']}")
+        else:
+            print("💾 Slot claimed, vehicle record queued for the database writer")
         print("=" * 60)
         print("✅ PROCESSING COMPLETED SUCCESSFULLY")
         print("=" * 60)
         
         return jsonify({
             'success': True,
-            'data': {
-                'detection': {
-                    'brand_before': brand_yolo,
-                    'brand_after': car_info.get('Brand', 'Unknown'),
-                    'model_before': model_raw or 'Unknown',
-                    'model_after': car_info.get('Model', 'Unknown'),
-                    'yolo_confidence': yolo_confidence,
-                    'ocr_texts': [t['text'] for t in ocr_texts]
-                },
-                'vehicle': {
-                    'license_plate': vehicle_data['license_plate'],
-                    'weight': f"{car_info['Kerb Weight (kg)']} kg",
-                    'weight_range': car_info.get('Kerb Weight (kg)', 'Unknown')
-                },
-                'parking': {
-                    'floor': floor,
-                    'slot': slot['slot_code'],
-                    'slot_code': slot['slot_code']
-                },
-                'image_url': f'/static/uploads/{filename}',
-                'entry_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
+            'data': process_result(identified, vehicle_data, slot, filename, fuzzy.version)
         })
         
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         import traceback
         traceback.print_exc()
+        if filename:
+            try:
+                # Stored but no vehicle uses it: let collect_images() remove it
+                db.release_image(filename)
+            except Exception as release_error:
+                print(f"❌ Could not release image {filename}: {release_error}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/process/batch', methods=['POST'])
+def process_batch():
+    """
+    Nhiều ảnh một request (gate replay backlog): field 'images' (nhiều file) và/hoặc file .zip.
+    Trả về NDJSON: một dòng mỗi ảnh ({'record': 'image', 'index', 'file', 'success', 'data'|'error'})
+    theo thứ tự upload, rồi một dòng {'record': 'summary'}.
+    """
+    try:
+        if request.content_length and request.content_length > MAX_BATCH_BYTES:
+            return jsonify({'success': False, 'error': f'Batch larger than {MAX_BATCH_BYTES // (1024 * 1024)} MB'}), 413
+        files = [f for f in request.files.getlist('images') + request.files.getlist('image') if f.filename]
+        if not files:
+            return jsonify({'success': False, 'error': 'No image files'}), 400
+        
+        pipeline = BatchPipeline(get_yolo(), get_ocr(), get_fuzzy(), get_plate_engine(), get_db(),
+                                 get_db().images, ALLOWED_EXTENSIONS)
+        
+        def generate():
+            started = time.perf_counter()
+            processed = parked = 0
+            for result in pipeline.run(files):
+                processed += 1
+                parked += result['success']
+                yield json.dumps(result, default=str, ensure_ascii=False) + '\n'
+            elapsed = time.perf_counter() - started
+            print(f"📦 Batch: {parked}/{processed} images parked in {elapsed:.1f}s")
+            yield json.dumps({'record': 'summary', 'processed': processed, 'parked': parked,
+                              'failed': processed - parked, 'elapsed_ms': round(elapsed * 1000, 1)}) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/status', methods=['GET'])
 def parking_status():
     try:
         db = get_db()
-        status_raw = db.get_parking_status()  # whatever structure DB returns
-        # Normalize status to keys 1,2,3 with expected fields
-        status = {}
-        for floor_idx in [1,2,3]:
-            raw = status_raw.get(floor_idx) if isinstance(status_raw, dict) else None
-            # support string keys
-            if raw is None and isinstance(status_raw, dict):
-                raw = status_raw.get(str(floor_idx))
-            if raw is None:
-                # fallback empty structure
-                status[floor_idx] = {
-                    'occupied': 0,
-                    'available': 20,
-                    'total': 20,
-                    'occupied_slots': []
-                }
-            else:
-                # Make sure fields exist
-                status[floor_idx] = {
-                    'occupied': int(raw.get('occupied', 0)),
-                    'available': int(raw.get('available', max(0, raw.get('total',20)-raw.get('occupied',0)))),
-                    'total': int(raw.get('total', 20)),
-                    'occupied_slots': raw.get('occupied_slots', [])
-                }
-        return jsonify({'success': True, 'data': status})
+        # Unchanged since the client's last poll: answer 304 without touching SQLite
+        etag = f"{BOOT_TOKEN}-{db.occupancy.version}"
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            version, status = db.status_snapshot()  # {floor: {...}} for every floor of the topology
+            response = jsonify({'success': True, 'data': status})
+            etag = f"{BOOT_TOKEN}-{version}"
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'  # always revalidate
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/events', methods=['GET'])
+def events_stream():
+    """Server-sent events: vehicle_entry / vehicle_exit / vehicle_deleted / reset / resync"""
+    db = get_db()
+    # 'token-N' from this run; anything else gets a resync (see EventBus.subscribe)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or None
+
+    def stream():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        for event in db.events.subscribe(last_event_id, heartbeat=SSE_HEARTBEAT_SECONDS):
+            if event is None:
+                yield ": heartbeat\n\n"
+                continue
+            payload = json.dumps(event['data'], default=str, ensure_ascii=False)
+            yield f"id: {db.events.event_id(event)}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # don't let a reverse proxy buffer the stream
+    })
+
+@app.route('/api/topology', methods=['GET'])
+def lot_topology_info():
+    """Floors, zones, weight limits and slot codes (the dashboard builds its grids from this)"""
+    try:
+        topology = get_topology()
+        data = topology.to_dict()
+        slot_codes = {}
+        for code, floor, _ in topology.slots():
+            slot_codes.setdefault(floor, []).append(code)
+        for floor in data['floors']:
+            floor['slot_codes'] = slot_codes.get(floor['floor'], [])
+        data['total_slots'] = topology.total_slots()
+        return jsonify({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -380,18 +317,96 @@ def vehicle_exit():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/exit/image', methods=['POST'])
+def vehicle_exit_by_image():
+    """
+    Xe ra bằng ảnh: chỉ đọc biển số (không YOLO, fuzzy model hay cấp slot) rồi so với
+    biển số các xe đang đỗ (exact hoặc ký tự dễ nhầm; ?max_distance=1 cho phép lệch 1 ký tự)
+    """
+    try:
+        if request.content_length and request.content_length > MAX_IMAGE_BYTES:
+            return jsonify({'success': False, 'error': 'Image too large'}), 413
+        if 'image' not in request.files:
+            return jsonify({'success': False, 'error': 'No image file'}), 400
+        
+        file = request.files['image']
+        if file.filename == '':
+            return jsonify({'success': False, 'error': 'No selected file'}), 400
+        if not allowed_file(file.filename):
+            return jsonify({'success': False, 'error': 'Invalid file type'}), 400
+        
+        max_distance = min(max(request.args.get('max_distance', 0, type=int), 0), 2)
+        
+        started = time.perf_counter()
+        # Exit photos are not kept: read from a temp file and drop it
+        suffix = '.' + file.filename.rsplit('.', 1)[1].lower()
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+            file.save(tmp)
+        try:
+            result = get_ocr().process_plates(tmp.name)
+        finally:
+            os.remove(tmp.name)
+        
+        detections = (result or {}).get('detections', [])
+        ocr_texts = [d['text'].strip() for d in detections if d.get('text', '').strip()]
+        candidates = get_plate_engine().candidates(detections)
+        
+        db = get_db()
+        db.flush()  # check-ins still queued by the write-behind writer aren't in parked_plates yet
+        # Plate engine readings first (best score first), then the raw OCR texts
+        match = db.parked_plates.match(candidates + ocr_texts, max_distance)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        print(f"🚪 Exit read {ocr_texts} -> {match['license_plate'] if match else None} ({elapsed_ms} ms)")
+        
+        if not match:
+            return jsonify({
+                'success': False,
+                'error': 'No parked vehicle matches the plate',
+                'data': {'ocr_texts': ocr_texts, 'candidates': [c['plate'] for c in candidates],
+                         'elapsed_ms': elapsed_ms}
+            }), 404
+        
+        vehicle = db.get_vehicle_by_id(match['vehicle_id'])
+        if not db.vehicle_exit(match['license_plate'], match['vehicle_id']):
+            return jsonify({'success': False, 'error': 'Vehicle not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'message': 'Vehicle exited successfully',
+            'data': {
+                'vehicle_id': match['vehicle_id'],
+                'license_plate': match['license_plate'],
+                'read': match['read'],
+                'match': match['match'],
+                'slot_code': vehicle['assigned_slot'] if vehicle else None,
+                'ocr_texts': ocr_texts,
+                'elapsed_ms': elapsed_ms
+            }
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/recent', methods=['GET'])
 def recent_vehicles():
     try:
         db = get_db()
-        vehicles = db.get_recent_vehicles(10)
-        return jsonify({'success': True, 'data': vehicles})
+        page = db.list_vehicles(limit=request.args.get('limit', 10, type=int),
+                                cursor=request.args.get('cursor'))
+        return jsonify({'success': True, 'data': page['items'], 'next_cursor': page['next_cursor']})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/static/uploads/<filename>')
+@app.route('/static/uploads/<path:filename>')
 def serve_upload(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    if not is_store_key(filename):
+        # Flat uuid_name.jpg uploads from before the content-addressed store
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=IMAGE_CACHE_SECONDS)
+    # The name is the content hash: the bytes behind this URL never change
+    response.headers['Cache-Control'] = f'public, max-age={IMAGE_CACHE_SECONDS}, immutable'
+    return response
 
 # ====== CÁC ROUTES MỚI CHO QUẢN LÝ ======
 
@@ -427,34 +442,94 @@ def reset_system():
 
 @app.route('/api/export-data', methods=['GET'])
 def export_data():
-    """Xuất dữ liệu"""
+    """
+    Xuất dữ liệu (streaming). ?format=json|ndjson|csv, ?from=YYYY-MM-DD, ?to=YYYY-MM-DD
+    (inclusive), ?status=parked|exited
+    """
     try:
-        db = get_db()
-        data = db.export_all_data()
-        
-        # Tạo file JSON
-        json_data = json.dumps(data, indent=2, default=str, ensure_ascii=False)
-        bytes_io = BytesIO(json_data.encode('utf-8'))
+        export_format = request.args.get('format', 'json').lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'success': False, 'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+        start = _parse_date_arg(request.args.get('from'))
+        end = _parse_date_arg(request.args.get('to'), inclusive_end=True)
+        status = request.args.get('status') or None
         
-        filename = f'parking_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+        db = get_db()
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        filename = f'parking_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
         
-        return send_file(
-            bytes_io,
-            mimetype='application/json',
-            as_attachment=True,
-            download_name=filename
+        chunks = stream_export(db, export_format, start=start, end=end, status=status)
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _parse_date_arg(value, inclusive_end=False):
+    """'2024-05-01' or ISO datetime -> 'YYYY-MM-DD HH:MM:SS' bound (date-only 'to' covers the whole day)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+    if inclusive_end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
 @app.route('/api/all-vehicles', methods=['GET'])
 def get_all_vehicles():
-    """Lấy tất cả xe đang đỗ"""
+    """Xe đang đỗ, từng trang (?limit=, ?cursor= từ next_cursor của trang trước)"""
     try:
         db = get_db()
-        vehicles = db.get_all_parked_vehicles()
-        return jsonify({'success': True, 'data': vehicles})
+        page = db.list_vehicles(status='parked',
+                                limit=request.args.get('limit', 100, type=int),
+                                cursor=request.args.get('cursor'))
+        return jsonify({'success': True, 'data': page['items'], 'next_cursor': page['next_cursor']})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/vehicles', methods=['GET'])
+def list_vehicles():
+    """
+    Lịch sử xe, mới nhất trước, phân trang theo cursor.
+    ?limit=50 ?cursor= ?floor=2 ?brand=TOYOTA ?status=parked|exited ?from=YYYY-MM-DD ?to=YYYY-MM-DD
+    """
+    try:
+        db = get_db()
+        page = db.list_vehicles(
+            limit=request.args.get('limit', 50, type=int),
+            cursor=request.args.get('cursor'),
+            floor=request.args.get('floor', type=int),
+            brand=request.args.get('brand'),
+            status=request.args.get('status') or None,
+            start=_parse_date_arg(request.args.get('from')),
+            end=_parse_date_arg(request.args.get('to'), inclusive_end=True),
+        )
+        return jsonify({'success': True, 'data': page['items'],
+                        'next_cursor': page['next_cursor'], 'has_more': page['has_more']})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/vehicles/search', methods=['GET'])
+def search_vehicles():
+    """Tìm xe theo biển số gần đúng trên toàn bộ lịch sử (?plate=51A12&limit=20)"""
+    try:
+        plate = request.args.get('plate', '').strip()
+        if not plate:
+            return jsonify({'success': False, 'error': 'plate required'}), 400
+        db = get_db()
+        results = db.search_plates(plate, limit=min(request.args.get('limit', 20, type=int), 100))
+        return jsonify({'success': True, 'data': results})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -482,6 +557,8 @@ def delete_vehicle(vehicle_id):
         
         if success:
             return jsonify({'success': True, 'message': 'Vehicle deleted successfully'})
+        elif success is None:
+            return jsonify({'success': False, 'error': 'Vehicle not found'}), 404
         else:
             return jsonify({'success': False, 'error': 'Failed to delete vehicle'}), 500
             
@@ -498,6 +575,81 @@ def get_system_stats():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/stats/occupancy', methods=['GET'])
+def occupancy_stats():
+    """
+    Chuỗi thời gian theo giờ từng tầng (?from=, ?to= YYYY-MM-DD hoặc ISO, ?floor=):
+    lượt vào/ra, số xe đang đỗ, đỉnh trong giờ. Mặc định 24 giờ gần nhất.
+    """
+    try:
+        now = datetime.now()
+        start = _parse_date_arg(request.args.get('from')) or now - timedelta(hours=23)
+        end = _parse_date_arg(request.args.get('to'), inclusive_end=True) or now + timedelta(hours=1)
+        db = get_db()
+        series = db.occupancy_series(start, end, request.args.get('floor', type=int))
+        return jsonify({'success': True, 'data': series})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/catalog/models', methods=['GET'])
+def catalog_models():
+    """Models trong catalog theo khoảng trọng lượng (vd. ?min_weight=2000)"""
+    try:
+        min_weight = request.args.get('min_weight', type=int)
+        max_weight = request.args.get('max_weight', type=int)
+        stat = request.args.get('stat', 'mid')
+        if stat not in ('min', 'max', 'mid'):
+            return jsonify({'success': False, 'error': 'stat must be min, max or mid'}), 400
+
+        models = get_fuzzy().models_in_weight_range(min_weight, max_weight, stat)
+        return jsonify({'success': True, 'count': len(models), 'data': models})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/catalog/status', methods=['GET'])
+def catalog_status():
+    """Phiên bản catalog đang dùng và thời gian reload gần nhất"""
+    try:
+        catalog = get_catalog()
+        catalog.get()
+        return jsonify({'success': True, 'data': catalog.status()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/reload-catalog', methods=['POST'])
+def reload_catalog():
+    """Reload inforcar.csv không cần restart (?wait=0 để chạy nền)"""
+    try:
+        wait = request.args.get('wait', '1') != '0'
+        status = get_catalog().reload(wait=wait)
+        if status.get('last_error'):
+            return jsonify({'success': False, 'error': status['last_error'], 'data': status}), 500
+        return jsonify({'success': True, 'data': status})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/archive', methods=['GET'])
+def archive_status():
+    """Các file archive theo tháng (số xe, khoảng thời gian)"""
+    try:
+        catalog = get_db().archive_catalog()
+        return jsonify({'success': True, 'data': list(catalog.values())})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/archive', methods=['POST'])
+def archive_now():
+    """Chuyển xe đã ra quá ?days ngày (mặc định 30) sang archive ngay"""
+    try:
+        days = request.args.get('days', type=int)
+        db = get_db()
+        moved = db.archive_exited() if days is None else db.archive_exited(older_than_days=days)
+        return jsonify({'success': True, 'data': moved})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 if __name__ == '__main__':
     print("🚀 Starting Smart Parking System...")
     print(f"📁 Upload folder: {app.config['UPLOAD_FOLDER']}")
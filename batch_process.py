@@ -0,0 +1,297 @@
+# batch_process.py - offline recognition over an image directory (no Flask, no slot changes)
+#
+#   python batch_process.py static/uploads --output results.db
+#   python batch_process.py static/uploads --output results.csv --resume --workers 4
+#
+# Every worker process loads its own YOLO + CRAFT/TrOCR + FuzzyMatcher once, then takes
+# batches of image paths. The output file is the checkpoint: with --resume, images already
+# in it are skipped, so an interrupted run (or a run after adding images) picks up where it
+# stopped. Results are written by the parent only, one commit / flush per batch.
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from modules.pipeline import identify_vehicle, quiet
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+DEFAULT_WORKERS = 2  # each worker holds all three models in memory
+BATCH_SIZE = 8  # images per YOLO / OCR call inside a worker
+IN_FLIGHT_PER_WORKER = 2  # batches queued per worker, keeps the pool busy between results
+PROGRESS_EVERY = 50  # images between progress lines
+STAGES = ('yolo', 'ocr', 'identify')
+
+RESULT_COLUMNS = (
+    'path', 'success', 'error', 'brand_yolo', 'yolo_confidence', 'brand', 'model', 'model_raw',
+    'weight', 'floor', 'license_plate', 'ocr_texts', 'catalog_version',
+    'yolo_ms', 'ocr_ms', 'identify_ms', 'processed_at',
+)
+
+RESULTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS results (
+        path TEXT PRIMARY KEY,
+        success INTEGER,
+        error TEXT,
+        brand_yolo TEXT,
+        yolo_confidence REAL,
+        brand TEXT,
+        model TEXT,
+        model_raw TEXT,
+        weight INTEGER,
+        floor INTEGER,
+        license_plate TEXT,
+        ocr_texts TEXT,
+        catalog_version TEXT,
+        yolo_ms REAL,
+        ocr_ms REAL,
+        identify_ms REAL,
+        processed_at DATETIME
+    )
+'''
+
+# Worker-process state, set once by _init_worker
+_models = {}
+
+
+def _init_worker(yolo_model, catalog_path, topology_path, threads):
+    # Imported here: the parent only walks the directory and writes results
+    import torch
+    from modules.fuzzy_matcher import FuzzyMatcher
+    from modules.lot_topology import LotTopology
+    from modules.ocr_engine import TextDetectionOCR
+    from modules.plate_engine import get_plate_engine
+    from modules.yolo_detector import YOLODetector
+
+    if threads:
+        torch.set_num_threads(threads)  # N workers x all cores each would just thrash
+    _models['yolo'] = YOLODetector(yolo_model)
+    _models['ocr'] = TextDetectionOCR()
+    _models['fuzzy'] = FuzzyMatcher(catalog_path, floor_classes=LotTopology.load(topology_path).floor_classes())
+    _models['plate_engine'] = get_plate_engine()
+
+
+def _result_row(path, identified=None, error=None, timings=None, catalog_version=None):
+    row = dict.fromkeys(RESULT_COLUMNS)
+    row.update(path=path, success=int(error is None), error=error, catalog_version=catalog_version,
+               processed_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    for stage, seconds in (timings or {}).items():
+        row[f"{stage}_ms"] = round(seconds * 1000, 2)
+    if identified:
+        car_info = identified['car_info']
+        row.update(
+            brand_yolo=identified['brand_yolo'],
+            yolo_confidence=identified['yolo_confidence'],
+            brand=car_info.get('Brand', 'Unknown'),
+            model=car_info.get('Model', 'Unknown'),
+            model_raw=identified['model_raw'],
+            weight=identified['weight'],
+            floor=identified['floor'],
+            license_plate=identified['license_plate'],
+            ocr_texts=json.dumps([t['text'] for t in identified['ocr_texts']], ensure_ascii=False),
+        )
+    return row
+
+
+def _process_batch(paths):
+    """Worker: rows for a batch of images. YOLO / OCR time is split evenly over the batch."""
+    yolo, ocr, fuzzy = _models['yolo'], _models['ocr'], _models['fuzzy']
+    try:
+        start = time.perf_counter()
+        yolo_results = yolo.detect_batch(paths)
+        yolo_time = (time.perf_counter() - start) / len(paths)
+
+        start = time.perf_counter()
+        ocr_results = ocr.process_image_batch(paths)
+        ocr_time = (time.perf_counter() - start) / len(paths)
+    except Exception as e:
+        return [_result_row(path, error=f'Detection error: {e}', catalog_version=fuzzy.version) for path in paths]
+
+    rows = []
+    for path, yolo_result, ocr_result in zip(paths, yolo_results, ocr_results):
+        timings = {'yolo': yolo_time, 'ocr': ocr_time}
+        start = time.perf_counter()
+        try:
+            identified = identify_vehicle(fuzzy, _models['plate_engine'], yolo_result, ocr_result, log=quiet)
+            error = None
+        except Exception as e:
+            identified, error = None, str(e)
+        timings['identify'] = time.perf_counter() - start
+        rows.append(_result_row(path, identified, error, timings, fuzzy.version))
+    return rows
+
+
+def iter_images(directory, recursive=True):
+    """
+    Image paths under directory (the upload store is sharded ab/cd/, so subdirectories by
+    default; hidden ones like .incoming skipped), sorted so batches and resumes are deterministic
+    """
+    if recursive:
+        paths = []
+        for root, dirs, names in os.walk(directory):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            paths.extend(os.path.join(root, name) for name in names)
+    else:
+        paths = (entry.path for entry in os.scandir(directory) if entry.is_file())
+    return sorted(path for path in paths
+                  if '.' in path and path.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS)
+
+
+class SQLiteResults:
+    """results table keyed by image path; re-processing a path replaces its row"""
+
+    def __init__(self, path, resume):
+        if not resume and os.path.exists(path):
+            os.remove(path)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(RESULTS_SCHEMA)
+
+    def done(self, failed=True):
+        where = '' if failed else ' WHERE success = 1'
+        return {path for (path,) in self.conn.execute(f'SELECT path FROM results{where}')}
+
+    def write(self, rows):
+        placeholders = ', '.join('?' * len(RESULT_COLUMNS))
+        with self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO results ({', '.join(RESULT_COLUMNS)}) "
+                                  f"VALUES ({placeholders})",
+                                  [[row[column] for column in RESULT_COLUMNS] for row in rows])
+
+    def close(self):
+        self.conn.close()
+
+
+class CSVResults:
+    """Appends one line per image, flushed after every batch"""
+
+    def __init__(self, path, resume):
+        self.path = path
+        existing = resume and os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'a' if existing else 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=RESULT_COLUMNS)
+        if not existing:
+            self.writer.writeheader()
+        self._existing = existing
+
+    def done(self, failed=True):
+        """A retried image gets a second line; the last one for a path is current"""
+        if not self._existing:
+            return set()
+        latest = {}
+        with open(self.path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('path'):
+                    latest[row['path']] = row['success'] == '1'
+        return {path for path, success in latest.items() if success or failed}
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def open_results(path, output_format=None, resume=False):
+    output_format = output_format or ('csv' if path.lower().endswith('.csv') else 'sqlite')
+    return CSVResults(path, resume) if output_format == 'csv' else SQLiteResults(path, resume)
+
+
+class RunStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.images = 0
+        self.failed = 0
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+
+    def add(self, rows):
+        for row in rows:
+            self.images += 1
+            self.failed += not row['success']
+            for stage in STAGES:
+                self.stage_seconds[stage] += (row[f"{stage}_ms"] or 0) / 1000
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.images / elapsed if elapsed else 0.0
+
+    def report(self, total):
+        elapsed = time.perf_counter() - self.start
+        print(f"\n✅ {self.images}/{total} images in {elapsed:.1f}s "
+              f"({self.rate():.2f} images/s, {self.failed} failed)")
+        if self.images:
+            stages = ', '.join(f"{stage} {self.stage_seconds[stage] / self.images * 1000:.1f}"
+                               for stage in STAGES)
+            print(f"   Per image (ms, worker time): {stages}")
+
+
+def run(directory, output, output_format=None, resume=False, retry_failed=False, workers=DEFAULT_WORKERS,
+        batch_size=BATCH_SIZE, recursive=True, yolo_model='static/models/best.pt',
+        catalog_path='static/models/inforcar.csv', topology_path='database/lot_topology.json'):
+    results = open_results(output, output_format, resume)
+    try:
+        images = iter_images(directory, recursive)
+        done = results.done(failed=not retry_failed) if resume else set()
+        pending = [path for path in images if path not in done]
+        print(f"📂 {len(images)} images in {directory}, {len(images) - len(pending)} already done, "
+              f"{len(pending)} to process with {workers} workers")
+        if not pending:
+            return
+
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        stats = RunStats()
+        next_report = PROGRESS_EVERY
+
+        # spawn: workers load CUDA / torch themselves instead of inheriting a forked state
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(yolo_model, catalog_path, topology_path, threads)) as pool:
+            queued, in_flight = iter(batches), set()
+            while True:
+                for batch in queued:
+                    in_flight.add(pool.submit(_process_batch, batch))
+                    if len(in_flight) >= workers * IN_FLIGHT_PER_WORKER:
+                        break
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    rows = future.result()
+                    results.write(rows)
+                    stats.add(rows)
+                if stats.images >= next_report:
+                    print(f"   {stats.images}/{len(pending)} images, {stats.rate():.2f} images/s")
+                    next_report += PROGRESS_EVERY
+        stats.report(len(pending))
+    finally:
+        results.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the recognition pipeline over an image directory')
+    parser.add_argument('directory', nargs='?', default='static/uploads')
+    parser.add_argument('--output', '-o', default='batch_results.db', help='.db (SQLite) or .csv')
+    parser.add_argument('--format', dest='output_format', choices=('sqlite', 'csv'),
+                        help='default: from the output extension')
+    parser.add_argument('--resume', action='store_true', help='skip images already in the output')
+    parser.add_argument('--retry-failed', action='store_true', help='with --resume, redo images that errored')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--flat', action='store_true', help='only images directly in the directory')
+    parser.add_argument('--yolo-model', default='static/models/best.pt')
+    parser.add_argument('--catalog', default='static/models/inforcar.csv')
+    parser.add_argument('--topology', default='database/lot_topology.json')
+
+    args = parser.parse_args()
+    run(args.directory, args.output, args.output_format, args.resume, args.retry_failed, max(1, args.workers),
+        max(1, args.batch_size), not args.flat, args.yolo_model, args.catalog, args.topology)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,488 @@
+# benchmark.py - micro-benchmarks for the hot paths of the parking system
+import argparse
+import os
+import tempfile
+import threading
+import difflib
+import random
+import re
+import string
+import time
+from datetime import datetime, timedelta
+
+from modules.db_manager import SCHEMA_MIGRATIONS, DatabaseManager
+from modules.edit_index import BKTree
+from modules.lot_topology import LotTopology
+from modules.plate_engine import DIGIT_LOOKALIKES, PlateEngine
+
+
+def _timed(func, repeat=1):
+    """Run func `repeat` times, return (last result, avg seconds)"""
+    start = time.perf_counter()
+    result = None
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def _random_model(rng):
+    letters = ''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(2, 6)))
+    digits = ''.join(rng.choice(string.digits) for _ in range(rng.randint(0, 3)))
+    return letters + digits
+
+
+def _mutate(rng, word):
+    """Simulate one OCR error (substitution, deletion or insertion)"""
+    pos = rng.randrange(len(word))
+    op = rng.choice('sdi')
+    char = rng.choice(string.ascii_uppercase + string.digits)
+    if op == 's':
+        return word[:pos] + char + word[pos + 1:]
+    if op == 'd' and len(word) > 1:
+        return word[:pos] + word[pos + 1:]
+    return word[:pos] + char + word[pos:]
+
+
+def bench_model_index(sizes, queries=200, seed=42):
+    """BK-tree lookup vs the old linear difflib scan over all models"""
+    rng = random.Random(seed)
+    print(f"{'models':>8} {'linear ms/q':>12} {'bktree ms/q':>12} {'speedup':>8} {'candidates':>11}")
+
+    for size in sizes:
+        models = list({_random_model(rng) for _ in range(size)})
+        samples = [_mutate(rng, rng.choice(models)) for _ in range(queries)]
+
+        def linear():
+            for query in samples:
+                max(models, key=lambda m: difflib.SequenceMatcher(None, query, m).ratio())
+
+        tree = BKTree(models)
+        visited = []
+
+        def indexed():
+            visited.clear()
+            for query in samples:
+                hits = tree.search(query, max(1, len(query) // 3))
+                visited.append(len(hits))
+                max((m for _, m in hits), default=None,
+                    key=lambda m: difflib.SequenceMatcher(None, query, m).ratio())
+
+        _, linear_time = _timed(linear)
+        _, index_time = _timed(indexed)
+        print(f"{len(models):>8} {linear_time / queries * 1000:>12.3f} "
+              f"{index_time / queries * 1000:>12.3f} {linear_time / index_time:>7.1f}x "
+              f"{sum(visited) / len(visited):>11.1f}")
+
+
+def _random_plate(rng):
+    """(canonical plate, how a camera might print it)"""
+    province = rng.randint(11, 99)
+    series = ''.join(rng.choice('ABCDEFGHKLMNPSTUVXYZ') for _ in range(rng.choice((1, 1, 1, 2))))
+    number = ''.join(rng.choice(string.digits) for _ in range(rng.choice((4, 5, 5))))
+    plate = f"{province}{series}{number}"
+    separator = rng.choice(('-', ' ', ''))
+    if len(number) == 5 and rng.random() < 0.5:
+        number = f"{number[:3]}.{number[3:]}"
+    return plate, f"{province}{series}{separator}{number}"
+
+
+def _ocr_noise(rng, text, rate):
+    """Swap digits for their letter lookalikes ('0' -> 'O', '8' -> 'B') with probability `rate`"""
+    reverse = {}
+    for letter, digit in DIGIT_LOOKALIKES.items():
+        reverse.setdefault(digit, letter)
+    return ''.join(reverse[c] if c in reverse and rng.random() < rate else c for c in text)
+
+
+def _legacy_plate(ocr_texts):
+    """The per-request loop /api/process used before the plate engine"""
+    for text_item in ocr_texts:
+        text = text_item['text'].upper().replace(' ', '')
+        match = re.search(r'\d{2}[A-Z]{1,2}\d{4,5}', text)
+        if match:
+            return match.group()
+    return None
+
+
+def bench_plates(count, noise=0.05, split=0.2, seed=42):
+    """Plate engine vs the old single-regex loop on a synthetic OCR corpus"""
+    rng = random.Random(seed)
+    distractors = ['TOYOTA', 'VIOS', 'CX-5', 'HONDA CIVIC 2024', 'WAREHOUSE', 'VF8', 'HYUNDAI']
+    corpus = []
+    for _ in range(count):
+        plate, shown = _random_plate(rng)
+        shown = _ocr_noise(rng, shown, noise)
+        if rng.random() < split:
+            cut = 4 if shown[3].isalpha() else 3
+            plate_texts = [shown[:cut], shown[cut:].strip(' -')]  # 2-line plate read as two detections
+        else:
+            plate_texts = [shown]
+        texts = rng.sample(distractors, 2) + plate_texts
+        corpus.append((plate, [{'text': t, 'confidence': round(rng.uniform(0.6, 1.0), 2)} for t in texts]))
+
+    engine = PlateEngine()
+    for name, extract in (('legacy regex', _legacy_plate), ('plate engine', engine.extract)):
+        results, seconds = _timed(lambda: [extract(texts) for _, texts in corpus])
+        correct = sum(found == plate for found, (plate, _) in zip(results, corpus))
+        print(f"{name:>13}: {seconds / count * 1e6:8.1f} us/image  accuracy {correct / count:6.1%}")
+
+
+def _vehicle(index):
+    return {
+        'license_plate': f"BENCH{index:05d}", 'brand_raw': 'TOYOTA', 'brand_corrected': 'TOYOTA',
+        'model_raw': 'VIOS', 'model_corrected': 'VIOS', 'weight': 1100, 'detected_floor': 2,
+        'assigned_slot': None, 'image_path': 'bench.jpg', 'entry_time': datetime.now(),
+    }
+
+
+def bench_parking(threads, seed=42):
+    """Many check-ins racing for the 60 slots: legacy find+add vs allocate_and_park"""
+    rng = random.Random(seed)
+
+    def legacy(db, index):
+        floor = rng.randint(1, 3)
+        slot = db.find_available_slot(floor) or db.find_any_available_slot()
+        if not slot:
+            return False
+        vehicle = _vehicle(index)
+        vehicle['assigned_slot'] = slot['slot_code']
+        db.add_vehicle(vehicle, slot['id'])
+        return True
+
+    def atomic(db, index):
+        return db.allocate_and_park(_vehicle(index), rng.randint(1, 3)) is not None
+
+    print(f"{'strategy':>17} {'parked':>7} {'slots used':>11} {'double-booked':>14} {'ms total':>9}")
+    for name, park in (('find + add', legacy), ('allocate_and_park', atomic)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+            start_gate = threading.Barrier(threads)
+            parked = []
+
+            def worker(worker_id):
+                start_gate.wait()
+                index = worker_id
+                while park(db, index):
+                    parked.append(index)
+                    index += threads
+
+            pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+            started = time.perf_counter()
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            with db.connection() as conn:
+                used = conn.execute("SELECT COUNT(DISTINCT assigned_slot) FROM vehicles").fetchone()[0]
+            db.close()
+        print(f"{name:>17} {len(parked):>7} {used:>11} {len(parked) - used:>14} {elapsed * 1000:>9.1f}")
+
+    # Deleting an exited vehicle must not free its slot, which another car may hold by now
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        index = 0
+        while atomic(db, index):
+            index += 1
+        first = _vehicle(0)['license_plate']
+        with db.connection() as conn:
+            first_id = conn.execute("SELECT id FROM vehicles WHERE license_plate = ?", (first,)).fetchone()[0]
+        db.vehicle_exit(first)
+        atomic(db, index)  # takes the only free slot, the exited vehicle's
+        db.delete_vehicle(first_id)
+        extra = atomic(db, index + 1)  # the lot is still full
+        with db.connection() as conn:
+            doubled = conn.execute('''
+                SELECT COUNT(*) FROM (SELECT assigned_slot FROM vehicles WHERE status = 'parked'
+                                      GROUP BY assigned_slot HAVING COUNT(*) > 1)
+            ''').fetchone()[0]
+        db.close()
+    print(f"exit + re-park + delete exited: extra check-in {'accepted' if extra else 'refused'}, "
+          f"{doubled} double-booked slot(s)")
+
+
+def bench_write_behind(count, threads):
+    """Check-in latency: full insert + commit per call vs slot claim + write-behind writer"""
+    per_floor = count // 3 + 1
+    topology = LotTopology({'floors': [
+        {'floor': floor, 'prefix': str(floor), 'max_weight': None,
+         'zones': [{'zone': 'A', 'slots': per_floor}]} for floor in (1, 2, 3)
+    ]})
+
+    print(f"{'mode':>13} {'avg ms':>7} {'p50 ms':>7} {'p99 ms':>7} {'check-ins/s':>12} {'saved':>6} {'linked':>7}")
+    for write_behind in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseManager(os.path.join(tmp, 'bench.db'), topology=topology, write_behind=write_behind)
+            latencies = []
+            start_gate = threading.Barrier(threads)
+
+            def worker(worker_id):
+                start_gate.wait()
+                for index in range(worker_id, count, threads):
+                    started = time.perf_counter()
+                    db.allocate_and_park(_vehicle(index), 1 + index % 3)
+                    latencies.append(time.perf_counter() - started)
+
+            pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+            started = time.perf_counter()
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+            db.flush()  # count the writer's backlog in the throughput
+            elapsed = time.perf_counter() - started
+
+            with db.connection() as conn:
+                saved = conn.execute("SELECT COUNT(*) FROM vehicles").fetchone()[0]
+                linked = conn.execute(
+                    "SELECT COUNT(*) FROM parking_slots WHERE is_occupied = 1 AND vehicle_id IS NOT NULL"
+                ).fetchone()[0]
+            db.close()
+
+        latencies.sort()
+        name = 'write-behind' if write_behind else 'synchronous'
+        print(f"{name:>13} {sum(latencies) / len(latencies) * 1000:>7.3f} "
+              f"{latencies[len(latencies) // 2] * 1000:>7.3f} {latencies[int(len(latencies) * 0.99)] * 1000:>7.3f} "
+              f"{count / elapsed:>12.0f} {saved:>6} {linked:>7}")
+
+
+def _history_rows(count, rng, days=365):
+    """Synthetic vehicles history: everything exited except the last 60 check-ins"""
+    start = datetime.now() - timedelta(days=days)
+    step = timedelta(days=days) / count
+    for index in range(count):
+        entry = start + step * index
+        parked = index >= count - 60
+        yield (
+            f"{rng.randint(11, 99)}A{rng.randint(0, 99999):05d}", 'TOYOTA', 'TOYOTA', 'VIOS', 'VIOS',
+            1100, 2, f"II.{chr(65 + index % 20)}", 'bench.jpg',
+            entry.isoformat(' '), None if parked else (entry + timedelta(hours=2)).isoformat(' '),
+            'parked' if parked else 'exited',
+        )
+
+
+def bench_history(rows, repeat=20, seed=42):
+    """Hot queries on a large vehicles table, before and after the index migration"""
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        started = time.perf_counter()
+        with db.connection() as conn:
+            conn.executemany('''
+                INSERT INTO vehicles (
+                    license_plate, brand_raw, brand_corrected, model_raw, model_corrected,
+                    weight, detected_floor, assigned_slot, image_path, entry_time, exit_time, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', _history_rows(rows, rng))
+            conn.commit()
+            plate = conn.execute("SELECT license_plate FROM vehicles ORDER BY id DESC LIMIT 1").fetchone()[0]
+        print(f"inserted {rows} rows in {time.perf_counter() - started:.1f}s")
+
+        today = datetime.now().date()
+        legacy_today = ("SELECT COUNT(*) FROM vehicles WHERE DATE(entry_time) = ?", (today.isoformat(),))
+        queries = {
+            'vehicle_exit lookup': ("SELECT id, assigned_slot FROM vehicles WHERE license_plate = ? AND status = 'parked'", (plate,)),
+            'recent vehicles': ("SELECT id FROM vehicles ORDER BY entry_time DESC LIMIT 10", ()),
+            'parked vehicles': ("SELECT id FROM vehicles WHERE status = 'parked' ORDER BY entry_time DESC", ()),
+            'today entries': ("SELECT COUNT(*) FROM vehicles WHERE entry_time >= ? AND entry_time < ?",
+                              (today.isoformat(), (today + timedelta(days=1)).isoformat())),
+        }
+        index_names = [statement.split()[5] for statement in dict(SCHEMA_MIGRATIONS)[2] if statement.startswith('CREATE')]
+
+        def run_all(conn, with_legacy):
+            timings = {}
+            for name, (sql, params) in queries.items():
+                _, timings[name] = _timed(lambda: conn.execute(sql, params).fetchall(), repeat)
+            if with_legacy:
+                _, timings['today entries (DATE())'] = _timed(
+                    lambda: conn.execute(*legacy_today).fetchall(), repeat)
+            return timings
+
+        with db.connection() as conn:
+            indexed = run_all(conn, True)
+            for name in index_names:
+                conn.execute(f"DROP INDEX {name}")
+            conn.commit()
+            plain = run_all(conn, True)
+        db.close()
+
+    print(f"{'query':>24} {'no index ms':>12} {'indexed ms':>11} {'speedup':>8}")
+    for name in plain:
+        print(f"{name:>24} {plain[name] * 1000:>12.3f} {indexed[name] * 1000:>11.3f} "
+              f"{plain[name] / max(indexed[name], 1e-9):>7.1f}x")
+
+
+def bench_plate_search(rows, queries=200, seed=42):
+    """Trigram-indexed fuzzy plate search vs LIKE '%...%' scan over a large history"""
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        plates = [_random_plate(rng)[0] for _ in range(rows)]
+        started = time.perf_counter()
+        with db.connection() as conn:
+            conn.executemany(
+                "INSERT INTO vehicles (license_plate, entry_time, status) VALUES (?, ?, 'exited')",
+                ((plate, f"2024-01-01 00:00:{i % 60:02d}") for i, plate in enumerate(plates)))
+            conn.commit()
+        print(f"inserted {rows} rows (with trigram index) in {time.perf_counter() - started:.1f}s")
+
+        targets = [rng.choice(plates) for _ in range(queries)]
+        partial = [t[rng.randint(0, 2):][:rng.randint(5, 7)] for t in targets]
+        misread = [_ocr_noise(rng, t, 0.3) for t in targets]
+        typo = [_mutate(rng, t) for t in targets]
+
+        def like_scan(items):
+            with db.connection() as conn:
+                return [conn.execute("SELECT id FROM vehicles WHERE license_plate LIKE ? LIMIT 20",
+                                     (f"%{q}%",)).fetchall() for q in items]
+
+        def indexed(items):
+            return [db.search_plates(q) for q in items]
+
+        print(f"{'query set':>16} {'LIKE ms/q':>10} {'search ms/q':>12} {'LIKE hit':>9} {'search hit':>11}")
+        for name, items in (('partial', partial), ('misread', misread), ('typo', typo)):
+            like_results, like_time = _timed(lambda: like_scan(items))
+            results, search_time = _timed(lambda: indexed(items))
+            like_hits = sum(bool(r) for r in like_results)
+            search_hits = sum(any(v['license_plate'] == t for v in r) for r, t in zip(results, targets))
+            print(f"{name:>16} {like_time / queries * 1000:>10.2f} {search_time / queries * 1000:>12.2f} "
+                  f"{like_hits / queries:>9.0%} {search_hits / queries:>11.0%}")
+        db.close()
+
+
+def bench_archive(rows, repeat=20, seed=42):
+    """Hot-table queries before and after moving a year of exited vehicles to monthly archives"""
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'bench.db'), archive_dir=os.path.join(tmp, 'archive'))
+        with db.connection() as conn:
+            conn.executemany('''
+                INSERT INTO vehicles (
+                    license_plate, brand_raw, brand_corrected, model_raw, model_corrected,
+                    weight, detected_floor, assigned_slot, image_path, entry_time, exit_time, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', _history_rows(rows, rng))
+            conn.commit()
+
+        week_ago = (datetime.now() - timedelta(days=7)).date().isoformat()
+        calls = {
+            'system statistics': db.get_system_statistics,
+            'recent vehicles': lambda: db.get_recent_vehicles(10),
+            'first page': lambda: db.list_vehicles(50),
+            'last week export': lambda: sum(1 for _ in db.iter_vehicles(start=week_ago)),
+        }
+        with db.connection() as conn:
+            # Any query without a usable index pays for every exited row still in the table
+            calls['hot table scan'] = lambda: conn.execute(
+                "SELECT COUNT(*) FROM vehicles WHERE brand_raw = 'VIOS'").fetchone()[0]
+            before = {name: _timed(call, repeat) for name, call in calls.items()}
+            hot_before = conn.execute("SELECT COUNT(*) FROM vehicles").fetchone()[0]
+
+        moved, archive_time = _timed(db.archive_exited)
+        with db.connection() as conn:
+            after = {name: _timed(call, repeat) for name, call in calls.items()}
+            hot_after = conn.execute("SELECT COUNT(*) FROM vehicles").fetchone()[0]
+        print(f"archived {sum(moved.values())} rows into {len(moved)} months in {archive_time:.1f}s "
+              f"(hot table {hot_before} -> {hot_after} rows)")
+        print(f"{'query':>20} {'before ms':>10} {'after ms':>9} {'same result':>12}")
+        for name in calls:
+            (result_before, t_before), (result_after, t_after) = before[name], after[name]
+            print(f"{name:>20} {t_before * 1000:>10.2f} {t_after * 1000:>9.2f} "
+                  f"{'-' if name == 'hot table scan' else str(result_before == result_after):>12}")
+        db.close()
+
+
+def bench_stats(rows, repeat=20, seed=42):
+    """/api/stats: four COUNT(*) over vehicles vs counters + hourly rollup"""
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        with db.connection() as conn:
+            conn.executemany('''
+                INSERT INTO vehicles (
+                    license_plate, brand_raw, brand_corrected, model_raw, model_corrected,
+                    weight, detected_floor, assigned_slot, image_path, entry_time, exit_time, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', _history_rows(rows, rng))
+            conn.commit()
+        db.rebuild_statistics()
+
+        today = datetime.now().date()
+        legacy = (
+            ("SELECT COUNT(*) FROM vehicles", ()),
+            ("SELECT COUNT(*) FROM vehicles WHERE status = 'parked'", ()),
+            ("SELECT COUNT(*) FROM parking_slots WHERE is_occupied = 0", ()),
+            ("SELECT COUNT(*) FROM vehicles WHERE DATE(entry_time) = ?", (today.isoformat(),)),
+        )
+        with db.connection() as conn:
+            counts, legacy_time = _timed(lambda: [conn.execute(sql, params).fetchone()[0] for sql, params in legacy], repeat)
+        stats, stats_time = _timed(db.get_system_statistics, repeat)
+        week_ago = datetime.now() - timedelta(days=7)
+        _, series_time = _timed(lambda: db.occupancy_series(week_ago, datetime.now()), repeat)
+        db.close()
+
+    same = counts[0] == stats['total_processed'] and counts[1] == stats['current_parked'] \
+        and counts[3] == stats['today_entries']
+    print(f"{rows} vehicles: legacy COUNT(*) x4 {legacy_time * 1000:.2f} ms, "
+          f"counters + rollup {stats_time * 1000:.2f} ms ({legacy_time / stats_time:.0f}x, same totals: {same})")
+    print(f"7-day hourly occupancy series (all floors): {series_time * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parking system micro-benchmarks')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('model-index', help='BK-tree vs linear fuzzy model lookup')
+    p.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    p.add_argument('--queries', type=int, default=200)
+
+    p = sub.add_parser('plates', help='plate engine vs legacy regex on synthetic OCR output')
+    p.add_argument('--count', type=int, default=20000)
+    p.add_argument('--noise', type=float, default=0.05, help='chance a digit is read as its lookalike letter')
+    p.add_argument('--split', type=float, default=0.2, help='share of 2-line plates (two detections)')
+
+    p = sub.add_parser('parking', help='concurrent check-ins racing for free slots')
+    p.add_argument('--threads', type=int, default=16)
+
+    p = sub.add_parser('write-behind', help='check-in latency with and without the write-behind writer')
+    p.add_argument('--count', type=int, default=3000)
+    p.add_argument('--threads', type=int, default=8)
+
+    p = sub.add_parser('history', help='hot vehicles queries on a large history table')
+    p.add_argument('--rows', type=int, default=1_000_000)
+    p.add_argument('--repeat', type=int, default=20)
+
+    p = sub.add_parser('plate-search', help='fuzzy plate search over a large history')
+    p.add_argument('--rows', type=int, default=1_000_000)
+    p.add_argument('--queries', type=int, default=200)
+
+    p = sub.add_parser('archive', help='hot-table queries before / after monthly archiving')
+    p.add_argument('--rows', type=int, default=500_000)
+    p.add_argument('--repeat', type=int, default=20)
+
+    p = sub.add_parser('stats', help='/api/stats counters vs COUNT(*) queries')
+    p.add_argument('--rows', type=int, default=1_000_000)
+    p.add_argument('--repeat', type=int, default=20)
+
+    args = parser.parse_args()
+    if args.bench == 'model-index':
+        bench_model_index(args.sizes, args.queries)
+    elif args.bench == 'plates':
+        bench_plates(args.count, args.noise, args.split)
+    elif args.bench == 'parking':
+        bench_parking(args.threads)
+    elif args.bench == 'write-behind':
+        bench_write_behind(args.count, args.threads)
+    elif args.bench == 'history':
+        bench_history(args.rows, args.repeat)
+    elif args.bench == 'plate-search':
+        bench_plate_search(args.rows, args.queries)
+    elif args.bench == 'archive':
+        bench_archive(args.rows, args.repeat)
+    elif args.bench == 'stats':
+        bench_stats(args.rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """Multi-pattern substring automaton: one linear pass finds every pattern in a text"""
+
+    def __init__(self, patterns=()):
+        # State 0 is the root; per state: transitions, failure link, (pattern, value) outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._own = [[]]  # patterns ending exactly at the state
+        self._output = [[]]  # own + those reachable through failure links (set by build)
+        self._built = False
+        self._pattern_count = 0
+        for pattern, value in patterns:
+            self.add(pattern, value)
+
+    def __len__(self):
+        return self._pattern_count
+
+    def add(self, pattern, value=None):
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+            state = next_state
+        if all(p != pattern for p, _ in self._own[state]):
+            self._own[state].append((pattern, value))
+            self._pattern_count += 1
+        self._built = False
+
+    def build(self):
+        """Compute failure links (BFS) and merge outputs along them"""
+        self._output = [list(own) for own in self._own]
+        queue = deque()
+        for next_state in self._goto[0].values():
+            self._fail[next_state] = 0
+            queue.append(next_state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+        self._built = True
+        return self
+
+    def search(self, text):
+        """Yield (start, end, pattern, value) for every occurrence; end is exclusive"""
+        if not self._built:
+            self.build()
+
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern, value in output[state]:
+                yield index + 1 - len(pattern), index + 1, pattern, value
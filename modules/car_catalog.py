@@ -0,0 +1,328 @@
+import csv
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+CATALOG_COLUMNS = [
+    'Brand', 'Model', 'Year',
+    'Length (mm)', 'Width (mm)', 'Height (mm)', 'Kerb Weight (kg)'
+]
+
+# Numeric columns parsed once at load into <key>_min / <key>_max / <key>_mid int arrays
+NUMERIC_COLUMNS = {
+    'length': 'Length (mm)',
+    'width': 'Width (mm)',
+    'height': 'Height (mm)',
+    'weight': 'Kerb Weight (kg)',
+}
+NUMERIC_STATS = ('min', 'max', 'mid')
+MISSING = -1  # numeric value for empty / unparseable cells
+
+DEFAULT_WEIGHT = 1500  # kg, used when the weight is unknown
+# (max kerb weight in kg or None for "heavier", floor): < 1000 -> 1, <= 2000 -> 2, else 3
+DEFAULT_FLOOR_CLASSES = ((999, 1), (2000, 2), (None, 3))
+
+SNAPSHOT_MAGIC = b'CARCAT01'
+SNAPSHOT_VERSION = 2
+
+
+def parse_range(value):
+    """'1550-1743' -> (1550, 1743), '857' -> (857, 857), 'Unknown' -> None"""
+    cleaned = re.sub(r'[^0-9\-]', '', str(value or ''))
+    parts = [p for p in cleaned.split('-') if p]
+    if not parts:
+        return None
+    low = int(parts[0])
+    high = int(parts[1]) if len(parts) >= 2 else low
+    return (low, high) if low <= high else (high, low)
+
+
+def floor_for_weight(weight, floor_classes=DEFAULT_FLOOR_CLASSES):
+    """Floor class for a kerb weight in kg"""
+    for max_weight, floor in floor_classes:
+        if max_weight is None or weight <= max_weight:
+            return floor
+    return floor_classes[-1][1]
+
+
+def snapshot_path_for(csv_path):
+    """static/models/inforcar.csv -> static/models/inforcar.catalog"""
+    return os.path.splitext(csv_path)[0] + '.catalog'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CarCatalog:
+    """
+    Column-oriented car catalog.
+    Every cell is an id into one pool of interned strings, so each column is
+    a flat uint32 array (array('I') when parsed, a memoryview into the
+    mmap'ed snapshot when loaded from disk). Dimensions and weight are also
+    kept as parsed int32 min/max/mid arrays, plus the floor class per row.
+    """
+
+    def __init__(self, strings, columns, numeric=None, floors=None, source=None,
+                 floor_classes=DEFAULT_FLOOR_CLASSES):
+        self.strings = strings  # list[str], id -> string
+        self.columns = columns  # {column name: sequence of string ids}
+        self.source = source or {}  # csv path / mtime / size / sha256
+        self.floor_classes = tuple(tuple(c) for c in floor_classes)
+        self._mmap = None
+        self._column_ids = [columns[name] for name in CATALOG_COLUMNS]
+        self._sorted = {}  # numeric array name -> (sorted values, row ids)
+
+        self.numeric = numeric if numeric is not None else self._parse_numeric()
+        self.floors = floors if floors is not None else self._compute_floors()
+
+    def _parse_numeric(self):
+        """Parse every dimension/weight column into int min/max/mid arrays"""
+        numeric = {}
+        for key, column in NUMERIC_COLUMNS.items():
+            arrays = {stat: array('i') for stat in NUMERIC_STATS}
+            parsed = {}  # string id -> (min, max, mid); cells are interned so parse each once
+            for sid in self.columns[column]:
+                values = parsed.get(sid)
+                if values is None:
+                    bounds = parse_range(self.strings[sid])
+                    values = parsed[sid] = (
+                        (bounds[0], bounds[1], (bounds[0] + bounds[1]) // 2) if bounds
+                        else (MISSING, MISSING, MISSING)
+                    )
+                for stat, value in zip(NUMERIC_STATS, values):
+                    arrays[stat].append(value)
+            for stat in NUMERIC_STATS:
+                numeric[f'{key}_{stat}'] = arrays[stat]
+        return numeric
+
+    def _compute_floors(self):
+        floors = array('i')
+        for weight in self.numeric['weight_mid']:
+            floors.append(floor_for_weight(weight if weight != MISSING else DEFAULT_WEIGHT,
+                                           self.floor_classes))
+        return floors
+
+    def __len__(self):
+        return len(self.columns[CATALOG_COLUMNS[0]]) if self.columns else 0
+
+    @property
+    def sha256(self):
+        return self.source.get('sha256', '')
+
+    def value(self, column, row_id):
+        return self.strings[self.columns[column][row_id]]
+
+    def row(self, row_id):
+        """One catalog row as the {column: value} dict the rest of the app uses"""
+        strings = self.strings
+        return {name: strings[ids[row_id]] for name, ids in zip(CATALOG_COLUMNS, self._column_ids)}
+
+    def iter_rows(self):
+        for row_id in range(len(self)):
+            yield self.row(row_id)
+
+    def weight(self, row_id):
+        """Mid kerb weight in kg (DEFAULT_WEIGHT when unknown)"""
+        weight = self.numeric['weight_mid'][row_id]
+        return weight if weight != MISSING else DEFAULT_WEIGHT
+
+    def floor(self, row_id):
+        return self.floors[row_id]
+
+    def range_query(self, key, low=None, high=None, stat='mid'):
+        """Row ids whose <key>_<stat> lies in [low, high], e.g. range_query('weight', low=2000)"""
+        name = f'{key}_{stat}'
+        if name not in self._sorted:
+            values = self.numeric[name]
+            order = sorted((v, i) for i, v in enumerate(values) if v != MISSING)
+            self._sorted[name] = ([v for v, _ in order], [i for _, i in order])
+
+        sorted_values, row_ids = self._sorted[name]
+        start = bisect_left(sorted_values, low) if low is not None else 0
+        end = bisect_right(sorted_values, high) if high is not None else len(sorted_values)
+        return row_ids[start:end]
+
+    # ---------- Loading ----------
+
+    @classmethod
+    def load(cls, csv_path, snapshot_path=None, floor_classes=DEFAULT_FLOOR_CLASSES):
+        """Use the binary snapshot when it matches the CSV, otherwise parse and rewrite it"""
+        snapshot_path = snapshot_path or snapshot_path_for(csv_path)
+
+        catalog = cls.from_snapshot(snapshot_path, csv_path, floor_classes)
+        if catalog is not None:
+            print(f"⚡ Car catalog memory-mapped from snapshot {snapshot_path}")
+            return catalog
+
+        catalog = cls.from_csv(csv_path, floor_classes)
+        try:
+            catalog.write_snapshot(snapshot_path)
+        except OSError as e:
+            print(f"⚠️ Could not write catalog snapshot: {e}")
+        return catalog
+
+    @classmethod
+    def from_csv(cls, csv_path, floor_classes=DEFAULT_FLOOR_CLASSES):
+        """Stream the CSV straight into interned string ids"""
+        stat = os.stat(csv_path)
+        strings = []
+        string_ids = {}
+        columns = {name: array('I') for name in CATALOG_COLUMNS}
+        appenders = [columns[name].append for name in CATALOG_COLUMNS]
+
+        with open(csv_path, 'r', encoding='utf-8', newline='') as file:
+            reader = csv.reader(file, delimiter=';')
+            header = [h.strip() for h in next(reader, [])]
+            positions = [header.index(name) if name in header else None for name in CATALOG_COLUMNS]
+
+            for record in reader:
+                if not record:
+                    continue
+                for append, pos in zip(appenders, positions):
+                    value = record[pos].strip() if pos is not None and pos < len(record) else ''
+                    sid = string_ids.get(value)
+                    if sid is None:
+                        sid = string_ids[value] = len(strings)
+                        strings.append(value)
+                    append(sid)
+
+        source = {
+            'csv_path': csv_path,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': file_sha256(csv_path),
+        }
+        return cls(strings, columns, source=source, floor_classes=floor_classes)
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path, csv_path, floor_classes=DEFAULT_FLOOR_CLASSES):
+        """Map a snapshot written for this exact CSV (same mtime, or same content hash)"""
+        if not os.path.exists(snapshot_path) or not os.path.exists(csv_path):
+            return None
+
+        try:
+            with open(snapshot_path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        view = None
+        try:
+            if mapped[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError('bad magic')
+            offset = len(SNAPSHOT_MAGIC)
+            (header_len,) = struct.unpack_from('<I', mapped, offset)
+            offset += 4
+            header = json.loads(mapped[offset:offset + header_len].decode('utf-8'))
+
+            if header.get('version') != SNAPSHOT_VERSION or header.get('byteorder') != sys.byteorder:
+                raise ValueError('incompatible snapshot')
+            if header.get('columns') != CATALOG_COLUMNS:
+                raise ValueError('column layout changed')
+
+            stat = os.stat(csv_path)
+            source = header['source']
+            same_file = source['mtime_ns'] == stat.st_mtime_ns and source['size'] == stat.st_size
+            if not same_file:
+                # Touched but maybe unchanged (git checkout, copy): compare content
+                if source['size'] != stat.st_size or source['sha256'] != file_sha256(csv_path):
+                    raise ValueError('snapshot is stale')
+
+            pool_start = header['strings_offset']
+            pool = mapped[pool_start:pool_start + header['strings_length']].decode('utf-8')
+            strings = pool.split('\0') if header['string_count'] else []
+
+            rows = header['rows']
+            arrays_offset = header['arrays_offset']
+            if arrays_offset + rows * 4 * len(header['arrays']) > len(mapped):
+                raise ValueError('truncated snapshot')
+
+            view = memoryview(mapped)
+            arrays = {}
+            for name, typecode in header['arrays']:
+                arrays[name] = view[arrays_offset:arrays_offset + rows * 4].cast(typecode)
+                arrays_offset += rows * 4
+        except (ValueError, KeyError, TypeError, struct.error, UnicodeDecodeError) as e:
+            print(f"⚠️ Ignoring catalog snapshot: {e}")
+            if view is not None:
+                view.release()
+            mapped.close()
+            return None
+
+        columns = {name: arrays.pop(f'column:{name}') for name in CATALOG_COLUMNS}
+        floors = arrays.pop('floor')
+        if [list(c) for c in floor_classes] != header.get('floor_classes'):
+            floors.release()  # weight limits changed: recompute from weight_mid
+            floors = None
+        catalog = cls(strings, columns, numeric=arrays, floors=floors,
+                      source=dict(source, csv_path=csv_path), floor_classes=floor_classes)
+        catalog._mmap = (mapped, view)
+        return catalog
+
+    def _snapshot_arrays(self):
+        """(name, typecode, array) in the order they are stored"""
+        arrays = [(f'column:{name}', 'I', self.columns[name]) for name in CATALOG_COLUMNS]
+        arrays += [(name, 'i', values) for name, values in self.numeric.items()]
+        arrays.append(('floor', 'i', self.floors))
+        return arrays
+
+    def write_snapshot(self, snapshot_path):
+        """Write magic | header length | JSON header | string pool | 4-byte int arrays"""
+        pool = '\0'.join(self.strings).encode('utf-8')
+        arrays = self._snapshot_arrays()
+        header = {
+            'version': SNAPSHOT_VERSION,
+            'byteorder': sys.byteorder,
+            'columns': CATALOG_COLUMNS,
+            'arrays': [[name, typecode] for name, typecode, _ in arrays],
+            'floor_classes': [list(c) for c in self.floor_classes],
+            'rows': len(self),
+            'string_count': len(self.strings),
+            'source': {k: self.source[k] for k in ('mtime_ns', 'size', 'sha256')},
+        }
+
+        # Offsets depend on the header size, which depends on the offsets: pad to a fixed width
+        prefix_len = len(SNAPSHOT_MAGIC) + 4
+        header.update(strings_offset=0, strings_length=len(pool), arrays_offset=0)
+        header_len = len(json.dumps(header).encode('utf-8')) + 64
+        strings_offset = prefix_len + header_len
+        arrays_offset = (strings_offset + len(pool) + 3) & ~3  # 4-byte aligned for cast()
+        header.update(strings_offset=strings_offset, arrays_offset=arrays_offset)
+        header_bytes = json.dumps(header).encode('utf-8').ljust(header_len)
+
+        tmp_path = snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack('<I', header_len))
+            f.write(header_bytes)
+            f.write(pool)
+            f.write(b'\0' * (arrays_offset - strings_offset - len(pool)))
+            for _, _, values in arrays:
+                f.write(values.tobytes())
+        os.replace(tmp_path, snapshot_path)
+        print(f"💾 Catalog snapshot written: {snapshot_path}")
+
+    def close(self):
+        """Release the snapshot mapping (columns become invalid)"""
+        if self._mmap is not None:
+            mapped, view = self._mmap
+            for _, _, values in self._snapshot_arrays():
+                if isinstance(values, memoryview):
+                    values.release()
+            view.release()
+            mapped.close()
+            self.columns, self.numeric, self.floors = {}, {}, array('i')
+            self._column_ids = []
+            self._sorted = {}
+            self._mmap = None
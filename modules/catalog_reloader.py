@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from modules.fuzzy_matcher import FuzzyMatcher
+
+
+class CatalogReloader:
+    """
+    Holds the live FuzzyMatcher and swaps in a rebuilt one when inforcar.csv changes.
+    The new matcher is built off to the side; requests that already grabbed the
+    old one keep using it until they finish (the swap is a single reference assignment).
+    Requests take the matcher with acquire() / release(): a replaced matcher's catalog
+    (the mmap'ed snapshot) is closed once its last request releases it, so the snapshot
+    file isn't held open (Windows can't replace a mapped file).
+    """
+
+    def __init__(self, csv_path, poll_interval=5.0, **matcher_kwargs):
+        self.csv_path = csv_path
+        self.poll_interval = poll_interval
+        self.matcher_kwargs = matcher_kwargs
+
+        self._matcher = None
+        self._reload_lock = threading.RLock()  # one rebuild at a time
+        self._watcher = None
+        self._file_signature = None
+        self._lease_lock = threading.Lock()
+        self._leases = {}  # matcher -> requests using it
+        self._retired = []  # replaced matchers still in use, closed on their last release()
+
+        self.loaded_at = None
+        self.reload_seconds = None
+        self.reload_count = 0
+        self.reloading = False
+        self.last_error = None
+
+    def get(self):
+        """Current matcher (built on first use)"""
+        matcher = self._matcher
+        if matcher is None:
+            with self._reload_lock:
+                if self._matcher is None:
+                    self.reload()
+            matcher = self._matcher
+        return matcher
+
+    def acquire(self):
+        """Current matcher, counted as in use until release(matcher)"""
+        self.get()
+        with self._lease_lock:
+            matcher = self._matcher
+            self._leases[matcher] = self._leases.get(matcher, 0) + 1
+        return matcher
+
+    def release(self, matcher):
+        with self._lease_lock:
+            count = self._leases.pop(matcher, 0) - 1
+            if count > 0:
+                self._leases[matcher] = count
+            elif matcher in self._retired:
+                self._retired.remove(matcher)
+                matcher.close()
+
+    def _retire(self, matcher):
+        """Close a replaced matcher now, or on the release() of its last request"""
+        with self._lease_lock:
+            if matcher in self._leases:
+                self._retired.append(matcher)
+            else:
+                matcher.close()
+
+    @property
+    def version(self):
+        matcher = self._matcher
+        return matcher.version if matcher else None
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.csv_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def reload(self, wait=True):
+        """Rebuild the matcher; with wait=False the rebuild runs in a background thread"""
+        if not wait:
+            threading.Thread(target=self.reload, name='catalog-reload', daemon=True).start()
+            return self.status()
+
+        with self._reload_lock:
+            self.reloading = True
+            signature = self._signature()
+            started = time.perf_counter()
+            try:
+                matcher = FuzzyMatcher(self.csv_path, **self.matcher_kwargs)
+            except Exception as e:
+                self._file_signature = signature  # don't retry until the file changes again
+                self.last_error = str(e)
+                print(f"❌ Catalog reload failed, keeping version {self.version}: {e}")
+                return self.status()
+            finally:
+                self.reloading = False
+
+            previous = self.version
+            if not matcher.catalog and self._matcher is not None:
+                self._file_signature = signature
+                self.last_error = f"{self.csv_path} loaded no vehicles"
+                print(f"⚠️ Catalog reload produced an empty catalog, keeping version {previous}")
+                matcher.close()
+                return self.status()
+
+            replaced, self._matcher = self._matcher, matcher  # atomic swap
+            self._file_signature = signature
+            self.reload_seconds = time.perf_counter() - started
+            self.loaded_at = datetime.now()
+            self.reload_count += 1
+            self.last_error = None
+            print(f"🔄 Catalog {previous} -> {matcher.version} in {self.reload_seconds:.3f}s")
+            if replaced is not None:
+                self._retire(replaced)
+        return self.status()
+
+    def start_watching(self):
+        """Poll the CSV's mtime/size and reload in the background when it changes"""
+        if self._watcher is not None or not self.poll_interval:
+            return
+        self._watcher = threading.Thread(target=self._watch, name='catalog-watcher', daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            signature = self._signature()
+            if signature and self._matcher is not None and signature != self._file_signature:
+                print(f"👀 {self.csv_path} changed, reloading catalog...")
+                self.reload()
+
+    def status(self):
+        matcher = self._matcher
+        return {
+            'version': matcher.version if matcher else None,
+            'vehicles': len(matcher.catalog or ()) if matcher else 0,
+            'models': len(matcher.all_models) if matcher else 0,
+            'loaded_at': self.loaded_at.strftime('%Y-%m-%d %H:%M:%S') if self.loaded_at else None,
+            'reload_seconds': round(self.reload_seconds, 4) if self.reload_seconds is not None else None,
+            'reload_count': self.reload_count,
+            'reloading': self.reloading,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from modules.vehicle_archive import VEHICLE_COLUMNS
+
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+CHUNK_BYTES = 64 * 1024  # flush to the client about every 64 KB
+
+
+def _dumps(value):
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+def _buffered(pieces):
+    """Join small strings into ~CHUNK_BYTES chunks so the response isn't one write per row"""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_summary(db, filters):
+    return {
+        'total_vehicles': db.count_vehicles(**filters),
+        'parked_vehicles': db.count_vehicles(**dict(filters, status='parked')),
+        'available_slots': db.occupancy.available(),
+        'total_slots': db.occupancy.total(),
+    }
+
+
+def _json_pieces(db, filters):
+    """One JSON document: export time, filters and summary, vehicles (newest first), parking slots"""
+    header = {
+        'export_time': datetime.now().isoformat(),
+        'filters': {key: value for key, value in filters.items() if value},
+        'summary': export_summary(db, filters),
+    }
+    yield _dumps(header)[:-1] + ', "vehicles": ['
+    for i, vehicle in enumerate(db.iter_vehicles(**filters, descending=True)):
+        yield (',\n' if i else '\n') + _dumps(vehicle)
+    yield '\n], "parking_slots": ['
+    for i, slot in enumerate(db.iter_parking_slots()):
+        yield (',\n' if i else '\n') + _dumps(slot)
+    yield '\n]}\n'
+
+
+def _ndjson_pieces(db, filters):
+    """One JSON object per line: a summary record, then vehicles, then slots"""
+    yield _dumps({'record': 'summary', 'export_time': datetime.now().isoformat(),
+                  **export_summary(db, filters)}) + '\n'
+    for vehicle in db.iter_vehicles(**filters):
+        yield _dumps({'record': 'vehicle', **vehicle}) + '\n'
+    for slot in db.iter_parking_slots():
+        yield _dumps({'record': 'slot', **slot}) + '\n'
+
+
+def _csv_pieces(db, filters):
+    """Vehicles only (one table per CSV)"""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(VEHICLE_COLUMNS)
+    for vehicle in db.iter_vehicles(**filters):
+        writer.writerow([vehicle.get(column) for column in VEHICLE_COLUMNS])
+        if out.tell() >= CHUNK_BYTES:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+
+def stream_export(db, export_format='json', start=None, end=None, status=None):
+    """Generator of text chunks for the requested format; memory stays flat with history size"""
+    filters = {'start': start, 'end': end, 'status': status}
+    if export_format == 'csv':
+        return _csv_pieces(db, filters)
+    pieces = _ndjson_pieces if export_format == 'ndjson' else _json_pieces
+    return _buffered(pieces(db, filters))
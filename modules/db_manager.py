@@ -1,123 +1,558 @@
+import atexit
+import base64
+import queue
 import sqlite3
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import json
 from pathlib import Path
 
+from modules.edit_index import substring_distance
+from modules.event_bus import EventBus
+from modules.image_store import DEFAULT_IMAGE_DIR, UNREFERENCED_GRACE_SECONDS, ImageStore, is_store_key
+from modules.lot_topology import LotTopology
+from modules.parked_plates import ParkedPlateIndex
+from modules.plate_engine import DIGIT_LOOKALIKES, PLATE_FOLD, canonical_plate
+from modules.slot_allocator import OccupancyMap
+from modules.vehicle_archive import (
+    ARCHIVE_AFTER_DAYS, ATTACH_LIMIT, DEFAULT_ARCHIVE_DIR, VEHICLE_COLUMNS, VehicleArchive,
+    history_windows, month_start, months_in_range, next_month_start,
+)
+from modules.write_behind import WriteBehindWriter
+
+# Applied once to every pooled connection
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',  # readers don't block the writer (and vice versa)
+    'PRAGMA synchronous=NORMAL',  # fsync at checkpoints only; safe with WAL
+    'PRAGMA cache_size=-8000',  # 8 MB page cache per connection
+    'PRAGMA temp_store=MEMORY',
+)
+BUSY_TIMEOUT_SECONDS = 5.0
+POOL_SIZE = 8  # idle connections kept open
+STATEMENT_CACHE_SIZE = 128  # prepared statements reused per connection
+MAX_PAGE_SIZE = 200
+MAX_SERIES_HOURS = 31 * 24  # occupancy_series range limit
+PLATE_SEARCH_CANDIDATES = 500  # trigram hits re-ranked by edit distance
+
+
+def encode_cursor(entry_time, vehicle_id):
+    """Opaque page cursor for (entry_time, id) of the last row returned"""
+    raw = json.dumps([str(entry_time), vehicle_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        entry_time, vehicle_id = json.loads(raw)
+        return str(entry_time), int(vehicle_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def _fold_plate_sql(column):
+    """SQL expression applying PLATE_FOLD (and dropping separators) to a column"""
+    expression = f"upper({column})"
+    for old, new in list(DIGIT_LOOKALIKES.items()) + [('-', ''), ('.', ''), (' ', '')]:
+        expression = f"replace({expression}, '{old}', '{new}')"
+    return expression
+
+def _fts_phrase(text):
+    """FTS5 string literal for user text (embedded double quotes doubled)"""
+    return '"' + text.replace('"', '""') + '"'
+
+def _create_plate_index(conn):
+    """
+    FTS5 trigram index over the folded plate (OCR lookalikes mapped to digits),
+    rowid = vehicles.id, kept in sync by triggers
+    """
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS vehicles_plate_fts USING fts5(plate, tokenize='trigram')")
+    except sqlite3.OperationalError as e:
+        # SQLite < 3.34 has no trigram tokenizer: search_plates falls back to a scan
+        print(f"⚠️ Plate trigram index unavailable ({e}), plate search will scan")
+        return
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS vehicles_plate_fts_ai AFTER INSERT ON vehicles BEGIN
+            INSERT INTO vehicles_plate_fts (rowid, plate) VALUES (new.id, {_fold_plate_sql('new.license_plate')});
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS vehicles_plate_fts_ad AFTER DELETE ON vehicles BEGIN
+            DELETE FROM vehicles_plate_fts WHERE rowid = old.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS vehicles_plate_fts_au AFTER UPDATE OF license_plate ON vehicles BEGIN
+            UPDATE vehicles_plate_fts SET plate = {_fold_plate_sql('new.license_plate')} WHERE rowid = new.id;
+        END
+    ''')
+    conn.execute(f'''
+        INSERT INTO vehicles_plate_fts (rowid, plate)
+        SELECT id, {_fold_plate_sql('license_plate')} FROM vehicles
+    ''')
+
+def _hour_key(timestamp):
+    """datetime / 'YYYY-MM-DD HH:MM:SS' -> 'YYYY-MM-DD HH' (hourly_stats bucket)"""
+    return str(timestamp)[:13]
+
+def _record_hour(conn, timestamp, floor, entries=0, exits=0):
+    """
+    Add entries / exits to the floor's hourly_stats bucket and store the floor's occupancy
+    after the change. Runs inside the caller's write transaction, after parking_slots changed.
+    """
+    conn.execute('''
+        INSERT INTO hourly_stats (hour, floor, entries, exits, occupied, peak_occupied)
+        SELECT ?, ?, ?, ?, COUNT(*), COUNT(*) FROM parking_slots
+        WHERE floor = ? AND is_occupied = 1
+        ON CONFLICT (floor, hour) DO UPDATE SET
+            entries = entries + excluded.entries,
+            exits = exits + excluded.exits,
+            occupied = excluded.occupied,
+            peak_occupied = MAX(COALESCE(peak_occupied, 0), excluded.occupied)
+    ''', (_hour_key(timestamp), floor, entries, exits, floor))
+
+def _bump_counters(conn, **deltas):
+    for name, delta in deltas.items():
+        conn.execute("UPDATE stats_counters SET value = value + ? WHERE name = ?", (delta, name))
+
+def _ref_image(conn, image_path, delta):
+    """images.refs += delta for a content-addressed upload (legacy flat uploads aren't counted)"""
+    if not is_store_key(image_path):
+        return
+    conn.execute('''
+        INSERT INTO images (key, refs, first_seen) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (key) DO UPDATE SET refs = refs + excluded.refs
+    ''', (image_path, delta))
+
+def _seed_statistics(conn, archived_hours=()):
+    """
+    (Re)compute stats_counters and hourly entries / exits from the vehicles table, and the
+    current hour's occupancy from parking_slots. Archived months are counted from the catalog;
+    their hourly rows come in as archived_hours [(hour, floor, entries, exits)], read by the
+    caller beforehand (archive files can't be attached inside the write transaction).
+    """
+    conn.execute("DELETE FROM stats_counters")
+    conn.execute('''
+        INSERT INTO stats_counters (name, value)
+        SELECT 'total_processed',
+               (SELECT COUNT(*) FROM vehicles) + (SELECT COALESCE(SUM(vehicles), 0) FROM vehicle_archives)
+    ''')
+    conn.execute("INSERT INTO stats_counters (name, value) SELECT 'current_parked', COUNT(*) FROM vehicles WHERE status = 'parked'")
+    conn.execute("DELETE FROM hourly_stats")
+    conn.execute('''
+        INSERT INTO hourly_stats (hour, floor, entries)
+        SELECT substr(entry_time, 1, 13), detected_floor, COUNT(*) FROM vehicles
+        WHERE entry_time IS NOT NULL AND detected_floor IS NOT NULL
+        GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO hourly_stats (hour, floor, exits)
+        SELECT substr(exit_time, 1, 13), detected_floor, COUNT(*) FROM vehicles
+        WHERE exit_time IS NOT NULL AND detected_floor IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (floor, hour) DO UPDATE SET exits = excluded.exits
+    ''')
+    conn.executemany('''
+        INSERT INTO hourly_stats (hour, floor, entries, exits) VALUES (?, ?, ?, ?)
+        ON CONFLICT (floor, hour) DO UPDATE SET
+            entries = entries + excluded.entries,
+            exits = exits + excluded.exits
+    ''', archived_hours)
+    conn.execute('''
+        INSERT INTO hourly_stats (hour, floor, occupied, peak_occupied)
+        SELECT strftime('%Y-%m-%d %H', 'now', 'localtime'), floor, SUM(is_occupied), SUM(is_occupied)
+        FROM parking_slots WHERE active = 1
+        GROUP BY floor
+        ON CONFLICT (floor, hour) DO UPDATE SET
+            occupied = excluded.occupied,
+            peak_occupied = MAX(COALESCE(peak_occupied, 0), excluded.occupied)
+    ''')
+
+# (version, statements), applied in order by init_db. A statement may also be a
+# callable taking the connection. Never edit a shipped migration; append a new one instead.
+SCHEMA_MIGRATIONS = (
+    (1, (
+        '''
+        CREATE TABLE IF NOT EXISTS vehicles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            license_plate TEXT,
+            brand_raw TEXT,
+            brand_corrected TEXT,
+            model_raw TEXT,
+            model_corrected TEXT,
+            weight INTEGER,
+            detected_floor INTEGER,
+            assigned_slot TEXT,
+            image_path TEXT,
+            entry_time DATETIME,
+            exit_time DATETIME,
+            status TEXT DEFAULT 'parked'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS parking_slots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            slot_code TEXT UNIQUE,
+            floor INTEGER,
+            is_occupied BOOLEAN DEFAULT 0,
+            vehicle_id INTEGER,
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
+        )
+        ''',
+    )),
+    (2, (
+        # vehicle_exit: WHERE license_plate = ? AND status = 'parked'
+        'CREATE INDEX IF NOT EXISTS idx_vehicles_plate_status ON vehicles (license_plate, status)',
+        # get_all_parked_vehicles / parked counts: WHERE status = ? ORDER BY entry_time
+        'CREATE INDEX IF NOT EXISTS idx_vehicles_status_entry ON vehicles (status, entry_time)',
+        # get_recent_vehicles ORDER BY entry_time, today's entries range
+        'CREATE INDEX IF NOT EXISTS idx_vehicles_entry_time ON vehicles (entry_time)',
+        'CREATE INDEX IF NOT EXISTS idx_parking_slots_floor_occupied ON parking_slots (floor, is_occupied)',
+        'ANALYZE',
+    )),
+    (3, (
+        # Lot topology (database/lot_topology.json): zones, and slots dropped from the config
+        'ALTER TABLE parking_slots ADD COLUMN zone TEXT',
+        'ALTER TABLE parking_slots ADD COLUMN active INTEGER NOT NULL DEFAULT 1',
+    )),
+    (4, (
+        # list_vehicles: keyset pages on (entry_time, id) per floor / brand
+        'CREATE INDEX IF NOT EXISTS idx_vehicles_floor_entry ON vehicles (detected_floor, entry_time)',
+        'CREATE INDEX IF NOT EXISTS idx_vehicles_brand_entry ON vehicles (brand_corrected, entry_time)',
+    )),
+    (5, (
+        _create_plate_index,
+    )),
+    (6, (
+        # Monthly archive files of exited vehicles (modules/vehicle_archive.py)
+        '''
+        CREATE TABLE IF NOT EXISTS vehicle_archives (
+            month TEXT PRIMARY KEY,
+            path TEXT,
+            vehicles INTEGER,
+            first_id INTEGER,
+            last_id INTEGER,
+            first_entry DATETIME,
+            last_entry DATETIME,
+            archived_at DATETIME
+        )
+        ''',
+        # archive_exited: WHERE status = 'exited' AND exit_time < ?
+        'CREATE INDEX IF NOT EXISTS idx_vehicles_status_exit ON vehicles (status, exit_time)',
+    )),
+    (7, (
+        # Running totals for /api/stats, kept in the same transaction as each entry / exit
+        '''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        # One row per floor and hour ('YYYY-MM-DD HH') with any traffic: entries, exits, occupancy
+        '''
+        CREATE TABLE IF NOT EXISTS hourly_stats (
+            floor INTEGER NOT NULL,
+            hour TEXT NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            exits INTEGER NOT NULL DEFAULT 0,
+            occupied INTEGER,  -- level after the hour's last change; NULL = not recorded
+            peak_occupied INTEGER,
+            PRIMARY KEY (floor, hour)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_hourly_stats_hour ON hourly_stats (hour)',
+        _seed_statistics,
+    )),
+    (8, (
+        # Content-addressed uploads (modules/image_store.py): how many vehicles, hot or
+        # archived, reference each image. refs <= 0 rows are left for collect_images()
+        '''
+        CREATE TABLE IF NOT EXISTS images (
+            key TEXT PRIMARY KEY,
+            refs INTEGER NOT NULL DEFAULT 0,
+            first_seen DATETIME
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_images_unreferenced ON images (refs) WHERE refs <= 0',
+    )),
+)
+
 class DatabaseManager:
-    def __init__(self, db_path='database/parking.db'):
+    def __init__(self, db_path='database/parking.db', pool_size=POOL_SIZE, topology=None,
+                 archive_dir=DEFAULT_ARCHIVE_DIR, write_behind=False, image_dir=DEFAULT_IMAGE_DIR):
         # Đảm bảo thư mục database tồn tại
         Path('database').mkdir(exist_ok=True)
         self.db_path = db_path
+        # Connections are opened once and reused; a request borrows one and gives it back
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self.topology = topology or LotTopology.load()
+        self.occupancy = OccupancyMap()  # free slots / counts in memory, written through to parking_slots
+        self._status_cache = None  # (occupancy version, status dict)
+        self.events = EventBus()  # occupancy deltas for /api/events
+        self._has_plate_index = None
+        self.archive = VehicleArchive(archive_dir)  # exited vehicles by entry month
+        self.parked_plates = ParkedPlateIndex()  # plate -> parked vehicle, for exit by camera
+        self.images = ImageStore(image_dir)  # uploads by content hash, refcounted in images
         self.init_db()
         self.init_parking_slots()
+        with self.connection() as conn:
+            self.parked_plates.rebuild(conn)
+        # write_behind: a check-in commits only its slot claim; the vehicle row, stats and
+        # entry event follow from a background writer in small batches (see _persist_entries)
+        self.writer = None
+        if write_behind:
+            self._release_orphan_claims()
+            self.writer = WriteBehindWriter(self._persist_entries, name='vehicle-writer')
+            atexit.register(self.close)
+    
+    def _open_connection(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False,  # pooled: used by one thread at a time, not always the same one
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; an unfinished transaction is rolled back on return"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open_connection()
+        
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    def rebuild_occupancy(self):
+        """Reload the in-memory occupancy map from parking_slots"""
+        with self.connection() as conn:
+            self.occupancy.rebuild(conn)
+        return self.occupancy
+    
+    def _publish(self, event_type, slot_code=None, **data):
+        """Send an occupancy delta (with the slot's floor counts) to /api/events subscribers"""
+        floor = self.occupancy.slot_floor.get(self.occupancy.slot_ids.get(slot_code))
+        if floor is not None:
+            total, occupied, available = self.occupancy.counts(floor)
+            data.update(slot_code=slot_code, floor=floor, total=total, occupied=occupied, available=available)
+        data['version'] = self.occupancy.version
+        self.events.publish(event_type, data)
+    
+    def _publish_entry(self, vehicle_id, vehicle_data):
+        self._publish('vehicle_entry', vehicle_data['assigned_slot'],
+                      vehicle_id=vehicle_id,
+                      license_plate=vehicle_data['license_plate'],
+                      brand_corrected=vehicle_data['brand_corrected'],
+                      model_corrected=vehicle_data['model_corrected'],
+                      weight=vehicle_data['weight'],
+                      entry_time=str(vehicle_data['entry_time']))
+    
+    def flush(self):
+        """Wait until queued (write-behind) check-ins are in the database"""
+        if self.writer is not None:
+            self.writer.flush()
+    
+    def close(self):
+        """Persist queued check-ins, then close all idle pooled connections"""
+        if self.writer is not None:
+            self.writer.close()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
     
     def init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Vehicles table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vehicles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                license_plate TEXT,
-                brand_raw TEXT,
-                brand_corrected TEXT,
-                model_raw TEXT,
-                model_corrected TEXT,
-                weight INTEGER,
-                detected_floor INTEGER,
-                assigned_slot TEXT,
-                image_path TEXT,
-                entry_time DATETIME,
-                exit_time DATETIME,
-                status TEXT DEFAULT 'parked'
-            )
-        ''')
-        
-        # Parking slots table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS parking_slots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                slot_code TEXT UNIQUE,
-                floor INTEGER,
-                is_occupied BOOLEAN DEFAULT 0,
-                vehicle_id INTEGER,
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        """Apply pending SCHEMA_MIGRATIONS; PRAGMA user_version holds the last applied one"""
+        with self.connection() as conn:
+            current = conn.execute('PRAGMA user_version').fetchone()[0]
+            for version, statements in SCHEMA_MIGRATIONS:
+                if version <= current:
+                    continue
+                conn.execute('BEGIN IMMEDIATE')
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.commit()
+                print(f"🗄️ Database migrated to schema v{version}")
     
     def init_parking_slots(self):
-        """Khởi tạo hoặc reset các slot đỗ xe"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Clear existing slots
-        cursor.execute("DELETE FROM parking_slots")
-        
-        # Create 60 slots (20 per floor)
-        slots = []
-        for floor in [1, 2, 3]:
-            floor_prefix = ['I', 'II', 'III'][floor-1]
-            for i in range(20):
-                slot_code = f"{floor_prefix}.{chr(65 + i)}"
-                slots.append((slot_code, floor, 0, None))
-        
-        cursor.executemany(
-            "INSERT INTO parking_slots (slot_code, floor, is_occupied, vehicle_id) VALUES (?, ?, ?, ?)",
-            slots
-        )
+        """
+        Đồng bộ parking_slots với lot topology. Idempotent: slot mới được thêm, slot đã có
+        giữ nguyên trạng thái; slot bị bỏ khỏi config thì xóa (nếu trống) hoặc tắt (nếu có xe).
+        """
+        wanted = list(self.topology.slots())
+        codes = {code for code, _, _ in wanted}
         
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.execute("SELECT COUNT(*) FROM parking_slots").fetchone()[0]
+            conn.executemany('''
+                INSERT OR IGNORE INTO parking_slots (slot_code, floor, zone, is_occupied, vehicle_id, active)
+                VALUES (?, ?, ?, 0, NULL, 1)
+            ''', wanted)
+            added = conn.execute("SELECT COUNT(*) FROM parking_slots").fetchone()[0] - before
+            conn.executemany('''
+                UPDATE parking_slots SET floor = ?, zone = ?, active = 1
+                WHERE slot_code = ? AND (floor IS NOT ? OR zone IS NOT ? OR active = 0)
+            ''', [(floor, zone, code, floor, zone) for code, floor, zone in wanted])
+            
+            removed = [row['slot_code'] for row in conn.execute(
+                "SELECT slot_code FROM parking_slots WHERE active = 1"
+            ) if row['slot_code'] not in codes]
+            for code in removed:
+                conn.execute("DELETE FROM parking_slots WHERE slot_code = ? AND is_occupied = 0", (code,))
+                conn.execute("UPDATE parking_slots SET active = 0 WHERE slot_code = ?", (code,))
+            
+            conn.commit()
+            self.occupancy.rebuild(conn)
+        
+        if added or removed:
+            self._publish('reset')
+            print(f"🅿️ Parking slots synced: +{added} added, -{len(removed)} removed ({len(codes)} total)")
         return True
     
     def find_available_slot(self, floor):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Để trả về dictionary
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, slot_code, floor 
-            FROM parking_slots 
-            WHERE floor = ? AND is_occupied = 0
-            LIMIT 1
-        ''', (floor,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return dict(row)
-        return None
+        return self.occupancy.next_free(floor)
     
     def find_any_available_slot(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        return self.occupancy.next_free_any()
+    
+    def add_vehicle(self, vehicle_data, slot_id):
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, slot_code, floor 
-            FROM parking_slots 
-            WHERE is_occupied = 0
-            LIMIT 1
-        ''')
+            # Add vehicle
+            cursor.execute('''
+                INSERT INTO vehicles (
+                    license_plate, brand_raw, brand_corrected, model_raw, model_corrected,
+                    weight, detected_floor, assigned_slot, image_path, entry_time, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                vehicle_data['license_plate'],
+                vehicle_data['brand_raw'],
+                vehicle_data['brand_corrected'],
+                vehicle_data['model_raw'],
+                vehicle_data['model_corrected'],
+                vehicle_data['weight'],
+                vehicle_data['detected_floor'],
+                vehicle_data['assigned_slot'],
+                vehicle_data['image_path'],
+                vehicle_data['entry_time'],
+                'parked'
+            ))
         
-        row = cursor.fetchone()
-        conn.close()
+            vehicle_id = cursor.lastrowid
         
-        if row:
-            return dict(row)
-        return None
+            # Update slot
+            cursor.execute('''
+                UPDATE parking_slots 
+                SET is_occupied = 1, vehicle_id = ?
+                WHERE id = ?
+            ''', (vehicle_id, slot_id))
+            
+            floor = self.occupancy.slot_floor.get(slot_id, vehicle_data['detected_floor'])
+            _record_hour(conn, vehicle_data['entry_time'], floor, entries=1)
+            _bump_counters(conn, total_processed=1, current_parked=1)
+            _ref_image(conn, vehicle_data['image_path'], 1)
+        
+            conn.commit()
+            self.occupancy.mark(slot_id, True)
+            self.parked_plates.add(vehicle_id, vehicle_data['license_plate'])
+            self._publish_entry(vehicle_id, vehicle_data)
+            return vehicle_id
     
-    def add_vehicle(self, vehicle_data, slot_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def allocate_and_park(self, vehicle_data, preferred_floor):
+        """
+        Claim a free slot (preferred floor first, then the other floors whose weight limit
+        fits the vehicle) and insert the vehicle
+        in one write transaction, so two concurrent requests can never get the same slot.
+        Fills vehicle_data['assigned_slot'] / ['detected_floor'] and returns
+        {'vehicle_id', 'id', 'slot_code', 'floor'}, or None when the lot is full.
+        With write_behind the transaction only claims the slot: the vehicle is inserted by
+        the background writer and 'vehicle_id' is None.
+        """
+        return self.allocate_and_park_many([(vehicle_data, preferred_floor)])[0]
+    
+    def allocate_and_park_many(self, vehicles):
+        """
+        allocate_and_park for [(vehicle_data, preferred_floor), ...] in a single write
+        transaction (batch ingest: one fsync per batch). Returns one slot dict or None
+        (lot full) per vehicle, in order.
+        """
+        queued = []  # write_behind: handed to the writer once the occupancy lock is released
+        with self.occupancy.lock, self.connection() as conn:
+            # Take the write lock up front: nobody else can claim a slot until we commit
+            conn.execute('BEGIN IMMEDIATE')
+            claimed = set()  # slots taken earlier in this transaction (map not marked yet)
+            slots = []
+            try:
+                for vehicle_data, preferred_floor in vehicles:
+                    slot = self._claim_slot(conn, vehicle_data, preferred_floor, claimed)
+                    if slot:
+                        claimed.add(slot['id'])
+                        if self.writer is None:
+                            slot['vehicle_id'] = self._insert_entry(conn, vehicle_data, slot)
+                    slots.append(slot)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                self.occupancy.rebuild(conn)
+                raise
+            
+            for (vehicle_data, _), slot in zip(vehicles, slots):
+                if not slot:
+                    continue
+                self.occupancy.mark(slot['id'], True)
+                if self.writer is None:
+                    self._entry_persisted(slot['vehicle_id'], vehicle_data)
+                else:
+                    queued.append((dict(vehicle_data), dict(slot)))
         
-        # Add vehicle
-        cursor.execute('''
+        for entry in queued:
+            self.writer.put(entry)  # blocks (outside the lock) if the writer is far behind
+        return slots
+    
+    def _claim_slot(self, conn, vehicle_data, preferred_floor, claimed):
+        """Mark a free slot occupied inside the open transaction; fills assigned_slot / detected_floor"""
+        floors = self.topology.floors_for_weight(vehicle_data.get('weight'))
+        while True:
+            slot = self.occupancy.next_free_any(preferred_floor, floors, exclude=claimed)
+            if slot is None:
+                return None
+            
+            claimed_now = conn.execute('''
+                UPDATE parking_slots
+                SET is_occupied = 1
+                WHERE id = ? AND is_occupied = 0
+            ''', (slot['id'],)).rowcount
+            if claimed_now:
+                break
+            # Another process took it: the map is stale, reload it inside our transaction
+            self.occupancy.rebuild(conn)
+        
+        vehicle_data['assigned_slot'] = slot['slot_code']
+        vehicle_data['detected_floor'] = slot['floor']
+        return {'vehicle_id': None, **dict(slot)}
+    
+    def _insert_entry(self, conn, vehicle_data, slot):
+        """Vehicle row, slot -> vehicle link and entry statistics for a claimed slot"""
+        cursor = conn.execute('''
             INSERT INTO vehicles (
                 license_plate, brand_raw, brand_corrected, model_raw, model_corrected,
                 weight, detected_floor, assigned_slot, image_path, entry_time, status
@@ -135,45 +570,80 @@ class DatabaseManager:
             vehicle_data['entry_time'],
             'parked'
         ))
-        
         vehicle_id = cursor.lastrowid
         
-        # Update slot
-        cursor.execute('''
-            UPDATE parking_slots 
-            SET is_occupied = 1, vehicle_id = ?
-            WHERE id = ?
-        ''', (vehicle_id, slot_id))
-        
-        conn.commit()
-        conn.close()
+        conn.execute("UPDATE parking_slots SET vehicle_id = ? WHERE id = ?", (vehicle_id, slot['id']))
+        _record_hour(conn, vehicle_data['entry_time'], slot['floor'], entries=1)
+        _bump_counters(conn, total_processed=1, current_parked=1)
+        _ref_image(conn, vehicle_data['image_path'], 1)
         return vehicle_id
     
-    def get_parking_status(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    def _entry_persisted(self, vehicle_id, vehicle_data):
+        self.parked_plates.add(vehicle_id, vehicle_data['license_plate'])
+        self._publish_entry(vehicle_id, vehicle_data)
+    
+    def _persist_entries(self, entries):
+        """
+        Write-behind writer: [(vehicle_data, slot)] whose slots are already claimed, in
+        one transaction. If the batch fails each entry is retried alone; an entry that
+        still can't be written gets its slot released so it isn't occupied by nobody.
+        """
+        with self.connection() as conn:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                vehicle_ids = [self._insert_entry(conn, vehicle_data, slot) for vehicle_data, slot in entries]
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                if len(entries) == 1:
+                    self._release_claim(conn, *entries[0], error=e)
+                    return
+                for entry in entries:
+                    self._persist_entries([entry])
+                return
         
-        status = {}
+        for (vehicle_data, _), vehicle_id in zip(entries, vehicle_ids):
+            self._entry_persisted(vehicle_id, vehicle_data)
+        self.occupancy.touch()  # status snapshot / ETag now include the vehicle details
+    
+    def _release_claim(self, conn, vehicle_data, slot, error):
+        print(f"❌ Could not save vehicle {vehicle_data['license_plate']} "
+              f"(slot {slot['slot_code']}): {error}; slot released")
+        with self.occupancy.lock:
+            conn.execute("UPDATE parking_slots SET is_occupied = 0 WHERE id = ? AND vehicle_id IS NULL",
+                         (slot['id'],))
+            conn.commit()
+            self.occupancy.mark(slot['id'], False)
+    
+    def _release_orphan_claims(self):
+        """Slots claimed by a write-behind check-in whose vehicle row never got written (crash)"""
+        with self.occupancy.lock, self.connection() as conn:
+            released = conn.execute(
+                "UPDATE parking_slots SET is_occupied = 0 WHERE is_occupied = 1 AND vehicle_id IS NULL"
+            ).rowcount
+            conn.commit()
+            if released:
+                print(f"⚠️ Released {released} slots claimed without a saved vehicle")
+                self.occupancy.rebuild(conn)
+    
+    def get_parking_status(self):
+        return self.status_snapshot()[1]
+    
+    def status_snapshot(self):
+        """
+        (version, {floor: {...}}). Rebuilt with a single query only when the occupancy
+        version moved, i.e. after a park / exit / delete / reset.
+        """
+        version = self.occupancy.version
+        cached = self._status_cache
+        if cached and cached[0] == version:
+            return cached
         
-        for floor in [1, 2, 3]:
-            # Get counts
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total,
-                    SUM(CASE WHEN is_occupied = 1 THEN 1 ELSE 0 END) as occupied
-                FROM parking_slots 
-                WHERE floor = ?
-            ''', (floor,))
-            
-            row = cursor.fetchone()
-            total = row['total'] if row else 0
-            occupied = row['occupied'] if row and row['occupied'] else 0
-            available = total - occupied
-            
-            # Get occupied slots details
-            cursor.execute('''
+        occupied_by_floor = {}
+        with self.connection() as conn:
+            rows = conn.execute('''
                 SELECT 
+                    ps.floor,
                     ps.slot_code,
                     v.license_plate,
                     v.brand_corrected,
@@ -182,278 +652,715 @@ class DatabaseManager:
                     v.entry_time
                 FROM parking_slots ps
                 LEFT JOIN vehicles v ON ps.vehicle_id = v.id
-                WHERE ps.floor = ? AND ps.is_occupied = 1
-            ''', (floor,))
-            
-            occupied_slots = []
-            for row in cursor.fetchall():
-                occupied_slots.append(dict(row))
-            
+                WHERE ps.is_occupied = 1 AND ps.active = 1
+                ORDER BY ps.floor, ps.id
+            ''').fetchall()
+        for row in rows:
+            slot = dict(row)
+            occupied_by_floor.setdefault(slot.pop('floor'), []).append(slot)
+        
+        status = {}
+        for floor in self.topology.floor_numbers():
+            # Counts come from the occupancy map
+            total, occupied, available = self.occupancy.counts(floor)
+            info = self.topology.floor(floor)
             status[floor] = {
-                'total': total or 20,
+                'name': info['name'],
+                'max_weight': info['max_weight'],
+                'total': total,
                 'occupied': occupied,
                 'available': available,
-                'occupied_slots': occupied_slots
+                'occupied_slots': occupied_by_floor.get(floor, [])
             }
         
-        conn.close()
-        return status
-    
-    def vehicle_exit(self, license_plate):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Find vehicle
-        cursor.execute('''
-            SELECT id, assigned_slot FROM vehicles 
-            WHERE license_plate = ? AND status = 'parked'
-        ''', (license_plate,))
-        
-        vehicle = cursor.fetchone()
-        if not vehicle:
-            conn.close()
-            return False
-        
-        vehicle_id, slot_code = vehicle
-        
-        # Update vehicle status
-        cursor.execute('''
-            UPDATE vehicles 
-            SET status = 'exited', exit_time = ?
-            WHERE id = ?
-        ''', (datetime.now(), vehicle_id))
-        
-        # Free parking slot
-        cursor.execute('''
-            UPDATE parking_slots 
-            SET is_occupied = 0, vehicle_id = NULL
-            WHERE slot_code = ?
-        ''', (slot_code,))
-        
-        conn.commit()
-        conn.close()
-        return True
+        self._status_cache = (version, status)
+        return self._status_cache
+    
+    def vehicle_exit(self, license_plate, vehicle_id=None):
+        """vehicle_id (from parked_plates) picks which one leaves when a plate is parked twice"""
+        self.flush()  # a write-behind check-in of this plate may still be queued
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            # Write lock first: two exits of the same plate (JSON + camera) must not both succeed
+            conn.execute('BEGIN IMMEDIATE')
+        
+            # Find vehicle
+            cursor.execute('''
+                SELECT id, assigned_slot, detected_floor FROM vehicles 
+                WHERE license_plate = ? AND status = 'parked' AND (? IS NULL OR id = ?)
+                ORDER BY id
+            ''', (license_plate, vehicle_id, vehicle_id))
+        
+            vehicle = cursor.fetchone()
+            if not vehicle:
+                return False
+        
+            vehicle_id, slot_code, floor = vehicle
+            exit_time = datetime.now()
+        
+            # Update vehicle status
+            cursor.execute('''
+                UPDATE vehicles 
+                SET status = 'exited', exit_time = ?
+                WHERE id = ? AND status = 'parked'
+            ''', (exit_time, vehicle_id))
+            if cursor.rowcount != 1:
+                return False  # already exited by a concurrent request
+        
+            # Free parking slot
+            cursor.execute('''
+                UPDATE parking_slots 
+                SET is_occupied = 0, vehicle_id = NULL
+                WHERE slot_code = ?
+            ''', (slot_code,))
+            
+            _record_hour(conn, exit_time, self.occupancy.slot_floor.get(
+                self.occupancy.slot_ids.get(slot_code), floor), exits=1)
+            _bump_counters(conn, current_parked=-1)
+        
+            conn.commit()
+            self.occupancy.mark_code(slot_code, False)
+            self.parked_plates.remove(vehicle_id)
+            self._publish('vehicle_exit', slot_code, vehicle_id=vehicle_id, license_plate=license_plate)
+            return True
     
     def get_recent_vehicles(self, limit=10):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                id,
-                license_plate, 
-                brand_corrected, 
-                model_corrected,
-                assigned_slot, 
-                entry_time, 
-                image_path,
-                weight,
-                detected_floor as floor
-            FROM vehicles 
-            ORDER BY entry_time DESC
-            LIMIT ?
-        ''', (limit,))
+        with self.connection() as conn:
+            cursor = conn.cursor()
+        
+            cursor.execute('''
+                SELECT 
+                    id,
+                    license_plate, 
+                    brand_corrected, 
+                    model_corrected,
+                    assigned_slot, 
+                    entry_time, 
+                    image_path,
+                    weight,
+                    detected_floor as floor
+                FROM vehicles 
+                ORDER BY entry_time DESC
+                LIMIT ?
+            ''', (limit,))
         
-        vehicles = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return vehicles
+            vehicles = [dict(row) for row in cursor.fetchall()]
+            return vehicles
     
     # ====== CÁC PHƯƠNG THỨC MỚI ======
     
     def clear_recent_history(self):
         """Xóa tất cả lịch sử xe"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.flush()  # queued check-ins would otherwise land after the wipe
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            cursor.execute("DELETE FROM vehicles")
-            cursor.execute("UPDATE parking_slots SET is_occupied = 0, vehicle_id = NULL")
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            print(f"Error clearing history: {e}")
-            return False
+            try:
+                cursor.execute("DELETE FROM vehicles")
+                cursor.execute("UPDATE parking_slots SET is_occupied = 0, vehicle_id = NULL")
+                months = self._drop_archives(conn)
+                conn.execute("UPDATE images SET refs = 0")  # every image is now unreferenced
+                _seed_statistics(conn)
+                conn.commit()
+                for month in months:
+                    self.archive.remove(month)
+                self.occupancy.rebuild(conn)
+                self.parked_plates.rebuild(conn)
+                self._publish('reset')
+                return True
+            except Exception as e:
+                conn.rollback()
+                print(f"Error clearing history: {e}")
+                return False
     
     def reset_system(self):
         """Reset toàn bộ hệ thống"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.flush()
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            # Xóa tất cả xe
-            cursor.execute("DELETE FROM vehicles")
-            # Reset tất cả slot về trạng thái trống
-            cursor.execute("UPDATE parking_slots SET is_occupied = 0, vehicle_id = NULL")
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            print(f"Error resetting system: {e}")
-            return False
-    
-    def export_all_data(self):
-        """Xuất toàn bộ dữ liệu"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Lấy tất cả xe
-        cursor.execute("SELECT * FROM vehicles ORDER BY entry_time DESC")
-        vehicles = [dict(row) for row in cursor.fetchall()]
-        
-        # Lấy tất cả slot
-        cursor.execute("SELECT * FROM parking_slots ORDER BY floor, slot_code")
-        slots = [dict(row) for row in cursor.fetchall()]
-        
-        # Lấy thống kê
-        cursor.execute("SELECT COUNT(*) as total_vehicles FROM vehicles")
-        total_vehicles = cursor.fetchone()['total_vehicles']
-        
-        cursor.execute("SELECT COUNT(*) as parked_vehicles FROM vehicles WHERE status = 'parked'")
-        parked_vehicles = cursor.fetchone()['parked_vehicles']
-        
-        cursor.execute("SELECT COUNT(*) as available_slots FROM parking_slots WHERE is_occupied = 0")
-        available_slots = cursor.fetchone()['available_slots']
-        
-        conn.close()
-        
-        export_data = {
-            'export_time': datetime.now().isoformat(),
-            'summary': {
-                'total_vehicles': total_vehicles,
-                'parked_vehicles': parked_vehicles,
-                'available_slots': available_slots,
-                'total_slots': 60
-            },
-            'vehicles': vehicles,
-            'parking_slots': slots
-        }
+            try:
+                # Xóa tất cả xe
+                cursor.execute("DELETE FROM vehicles")
+                # Reset tất cả slot về trạng thái trống
+                cursor.execute("UPDATE parking_slots SET is_occupied = 0, vehicle_id = NULL")
+                # Cả các file archive theo tháng
+                months = self._drop_archives(conn)
+                conn.execute("UPDATE images SET refs = 0")  # every image is now unreferenced
+                _seed_statistics(conn)
+                conn.commit()
+                for month in months:
+                    self.archive.remove(month)
+                self.occupancy.rebuild(conn)
+                self.parked_plates.rebuild(conn)
+                self._publish('reset')
+                return True
+            except Exception as e:
+                conn.rollback()
+                print(f"Error resetting system: {e}")
+                return False
+    
+    # ====== ARCHIVE THEO THÁNG ======
+    
+    def archive_catalog(self):
+        """{month: catalog row} of the archive files, oldest month first"""
+        with self.connection() as conn:
+            rows = conn.execute("SELECT * FROM vehicle_archives ORDER BY month").fetchall()
+        return {row['month']: dict(row) for row in rows}
+    
+    def archive_exited(self, older_than_days=ARCHIVE_AFTER_DAYS, now=None):
+        """
+        Move vehicles that exited more than `older_than_days` ago into the archive file of
+        their entry month. Safe to re-run after a crash: rows already in an archive are
+        skipped there and only deleted from the hot table. Returns {month: rows moved}.
+        """
+        cutoff = str((now or datetime.now()) - timedelta(days=older_than_days))
+        selection = "status = 'exited' AND exit_time < ? AND entry_time >= ? AND entry_time < ?"
+        moved = {}
+        with self.connection() as conn:
+            months = [row[0] for row in conn.execute('''
+                SELECT DISTINCT substr(entry_time, 1, 7) FROM vehicles
+                WHERE status = 'exited' AND exit_time < ? AND entry_time IS NOT NULL
+                ORDER BY 1
+            ''', (cutoff,))]
+            for month in months:
+                params = (cutoff, month_start(month), next_month_start(month))
+                with self.archive.attached(conn, [month]) as [(schema, _)]:
+                    conn.execute('BEGIN IMMEDIATE')
+                    self.archive.create_schema(conn, schema)
+                    if self._plate_index_ready(conn):
+                        conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.vehicles_plate_fts "
+                                     f"USING fts5(plate, tokenize='trigram')")
+                        conn.execute(f'''
+                            INSERT INTO {schema}.vehicles_plate_fts (rowid, plate)
+                            SELECT id, {_fold_plate_sql('license_plate')} FROM main.vehicles m
+                            WHERE {selection}
+                              AND NOT EXISTS (SELECT 1 FROM {schema}.vehicles a WHERE a.id = m.id)
+                        ''', params)
+                    columns = ', '.join(VEHICLE_COLUMNS)
+                    conn.execute(f'''
+                        INSERT OR IGNORE INTO {schema}.vehicles ({columns})
+                        SELECT {columns} FROM main.vehicles WHERE {selection}
+                    ''', params)
+                    moved[month] = conn.execute(f"DELETE FROM main.vehicles WHERE {selection}", params).rowcount
+                    conn.execute(f'''
+                        INSERT OR REPLACE INTO vehicle_archives
+                            (month, path, vehicles, first_id, last_id, first_entry, last_entry, archived_at)
+                        SELECT ?, ?, COUNT(*), MIN(id), MAX(id), MIN(entry_time), MAX(entry_time), ?
+                        FROM {schema}.vehicles
+                    ''', (month, self.archive.path(month), datetime.now()))
+                    conn.commit()
+        if moved:
+            print(f"📦 Archived {sum(moved.values())} exited vehicles into {len(moved)} monthly file(s)")
+        return moved
+    
+    def _drop_archives(self, conn):
+        """Forget all archive files (inside the caller's transaction); returns their months"""
+        months = [row[0] for row in conn.execute("SELECT month FROM vehicle_archives")]
+        conn.execute("DELETE FROM vehicle_archives")
+        return months
+    
+    def _history_rows(self, columns, start=None, end=None, status=None, clauses=(), params=(),
+                      descending=False, limit=None, chunk_size=1000):
+        """
+        Yield vehicle rows (dicts) from the hot table and the archive months that overlap
+        [start, end), ordered by (entry_time, id). Archives are attached a window at a time;
+        with a limit (one page) only one month at a time, as a page rarely needs more.
+        """
+        order = " DESC" if descending else ""
+        if status not in (None, 'exited'):
+            months = []  # archives only hold exited vehicles
+        else:
+            months = months_in_range(self.archive_catalog(), start, end)
+        windows = history_windows(months, start, end, 1 if limit else ATTACH_LIMIT)
+        if descending:
+            windows.reverse()
+        with self.connection() as conn:
+            for lo, hi, months in windows:
+                where, args = self._vehicle_filters(lo, hi, status)
+                conditions = ([where[len(" WHERE "):]] if where else []) + list(clauses)
+                where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+                args += list(params)
+                with self.archive.attached(conn, months) as schemas:
+                    sources = ['main'] + [schema for schema, _ in schemas]
+                    sql = " UNION ALL ".join(f"SELECT {columns} FROM {source}.vehicles{where}" for source in sources)
+                    sql += f" ORDER BY entry_time{order}, id{order}"
+                    args = args * len(sources)
+                    if limit is not None:
+                        sql += " LIMIT ?"
+                        args.append(limit)
+                    cursor = conn.execute(sql, args)
+                    try:
+                        while True:
+                            rows = cursor.fetchmany(chunk_size)
+                            if not rows:
+                                break
+                            for row in rows:
+                                yield dict(row)
+                            if limit is not None:
+                                limit -= len(rows)
+                    finally:
+                        cursor.close()
+                if limit is not None and limit <= 0:
+                    return
+    
+    def _vehicle_filters(self, start=None, end=None, status=None):
+        """WHERE clause + params for entry_time range [start, end) and status"""
+        clauses, params = [], []
+        if start:
+            clauses.append("entry_time >= ?")
+            params.append(str(start))
+        if end:
+            clauses.append("entry_time < ?")
+            params.append(str(end))
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+    
+    def count_vehicles(self, start=None, end=None, status=None):
+        """Hot table + archives; whole archived months are counted from the catalog"""
+        catalog = self.archive_catalog()
+        where, params = self._vehicle_filters(start, end, status)
+        with self.connection() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM vehicles{where}", params).fetchone()[0]
+            if status not in (None, 'exited'):
+                return total  # archives only hold exited vehicles
+            
+            partial = []
+            for month in months_in_range(catalog, start, end):
+                if (not start or str(start) <= month_start(month)) and \
+                        (not end or next_month_start(month) <= str(end)):
+                    total += catalog[month]['vehicles']
+                else:
+                    partial.append(month)
+            for i in range(0, len(partial), ATTACH_LIMIT):
+                with self.archive.attached(conn, partial[i:i + ATTACH_LIMIT]) as schemas:
+                    for schema, _ in schemas:
+                        total += conn.execute(f"SELECT COUNT(*) FROM {schema}.vehicles{where}",
+                                              params).fetchone()[0]
+            return total
+    
+    def iter_vehicles(self, start=None, end=None, status=None, descending=False, chunk_size=1000):
+        """Yield vehicle rows (dicts) oldest first (newest with descending), archives included, chunk_size at a time"""
+        return self._history_rows(', '.join(VEHICLE_COLUMNS), start, end, status,
+                                  descending=descending, chunk_size=chunk_size)
+    
+    def iter_parking_slots(self, chunk_size=1000):
+        with self.connection() as conn:
+            cursor = conn.execute("SELECT * FROM parking_slots ORDER BY floor, slot_code")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+    
+    def list_vehicles(self, limit=50, cursor=None, floor=None, brand=None, status=None,
+                      start=None, end=None):
+        """
+        One page of vehicles, newest first, keyset-paginated on (entry_time, id): each page
+        is an index range scan no matter how deep, unlike OFFSET. Pages continue into the
+        monthly archives once the hot table runs out.
+        Returns {'items', 'next_cursor', 'has_more'}.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        clauses, params = [], []
+        if floor is not None:
+            clauses.append("detected_floor = ?")
+            params.append(int(floor))
+        if brand:
+            clauses.append("brand_corrected = ?")
+            params.append(brand.upper())
+        if cursor:
+            clauses.append("(entry_time, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
         
-        return export_data
+        columns = '''
+            id,
+            license_plate,
+            brand_corrected,
+            model_corrected,
+            weight,
+            assigned_slot,
+            entry_time,
+            exit_time,
+            status,
+            image_path,
+            detected_floor as floor
+        '''
+        rows = list(self._history_rows(columns, start, end, status, clauses, params,
+                                       descending=True, limit=limit + 1))
+        
+        items = rows[:limit]
+        has_more = len(rows) > limit
+        next_cursor = encode_cursor(items[-1]['entry_time'], items[-1]['id']) if has_more else None
+        return {'items': items, 'next_cursor': next_cursor, 'has_more': has_more}
+    
+    def search_plates(self, query, limit=20, max_distance=None):
+        """
+        Partial / mis-read plate lookup over all history ('51A12', 'SIA123'), archives included.
+        The trigram index holds folded plates (O->0, I->1, S->5 ...), so lookalike
+        misreads are plain substring hits; other typos fall back to ranked trigram
+        overlap. Candidates are ranked by the fewest edits from the query to any
+        part of the plate.
+        """
+        query = canonical_plate(query)
+        if not query:
+            return []
+        folded = query.translate(PLATE_FOLD)
+        if max_distance is None:
+            max_distance = max(1, len(query) // 3)
+        
+        months = list(self.archive_catalog())
+        with self.connection() as conn:
+            rows = self._plate_candidates(conn, 'main', query, folded, limit)
+            for i in range(0, len(months), ATTACH_LIMIT):
+                with self.archive.attached(conn, months[i:i + ATTACH_LIMIT]) as schemas:
+                    for schema, _ in schemas:
+                        rows += self._plate_candidates(conn, schema, query, folded, limit)
+        
+        results = []
+        for row in rows:
+            plate = canonical_plate(row['license_plate']).translate(PLATE_FOLD)
+            distance = substring_distance(folded, plate)
+            if distance > max_distance:
+                continue
+            vehicle = dict(row)
+            vehicle['distance'] = distance
+            vehicle['score'] = round(1 - distance / len(query), 3)
+            results.append(vehicle)
+        
+        # Closest first; among equals, tighter plates (fewer extra chars), then most recent
+        results.sort(key=lambda v: str(v['entry_time'] or ''), reverse=True)
+        results.sort(key=lambda v: (v['distance'], len(v['license_plate'] or '')))
+        return results[:limit]
+    
+    def _plate_candidates(self, conn, schema, query, folded, limit):
+        """Candidate rows for search_plates from one database (main or an attached archive)"""
+        columns = '''v.id, v.license_plate, v.brand_corrected, v.model_corrected, v.assigned_slot,
+                     v.detected_floor as floor, v.entry_time, v.exit_time, v.status'''
+        if len(folded) < 3 or not self._plate_index_ready(conn, schema):
+            # Short query (or no FTS5 trigram support): substring scan
+            return conn.execute(f'''
+                SELECT {columns} FROM {schema}.vehicles v
+                WHERE v.license_plate LIKE ?
+                ORDER BY v.entry_time DESC
+                LIMIT ?
+            ''', (f"%{query}%", PLATE_SEARCH_CANDIDATES)).fetchall()
+        
+        # 1. Substring of the folded plate (trigram phrase match, no ranking needed)
+        rows = conn.execute(f'''
+            SELECT {columns}
+            FROM {schema}.vehicles_plate_fts f
+            JOIN {schema}.vehicles v ON v.id = f.rowid
+            WHERE vehicles_plate_fts MATCH ?
+            LIMIT ?
+        ''', (_fts_phrase(folded), PLATE_SEARCH_CANDIDATES)).fetchall()
+        
+        # 2. Not enough: plates sharing the most trigrams with the query
+        if len(rows) < limit and len(folded) > 3:
+            grams = sorted({folded[i:i + 3] for i in range(len(folded) - 2)})
+            seen = {row['id'] for row in rows}
+            rows += [row for row in conn.execute(f'''
+                SELECT {columns}
+                FROM {schema}.vehicles_plate_fts f
+                JOIN {schema}.vehicles v ON v.id = f.rowid
+                WHERE vehicles_plate_fts MATCH ?
+                ORDER BY f.rank
+                LIMIT ?
+            ''', (' OR '.join(_fts_phrase(gram) for gram in grams), PLATE_SEARCH_CANDIDATES))
+                if row['id'] not in seen]
+        return rows
+    
+    def _plate_index_ready(self, conn, schema='main'):
+        if schema != 'main':
+            return conn.execute(
+                f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'vehicles_plate_fts'"
+            ).fetchone() is not None
+        if self._has_plate_index is None:
+            self._has_plate_index = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'vehicles_plate_fts'"
+            ).fetchone() is not None
+        return self._has_plate_index
     
     def get_all_parked_vehicles(self):
         """Lấy tất cả xe đang đỗ"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                v.id,
-                v.license_plate,
-                v.brand_corrected,
-                v.model_corrected,
-                v.weight,
-                v.assigned_slot,
-                v.entry_time,
-                v.image_path,
-                ps.floor
-            FROM vehicles v
-            LEFT JOIN parking_slots ps ON v.assigned_slot = ps.slot_code
-            WHERE v.status = 'parked'
-            ORDER BY v.entry_time DESC
-        ''')
-        
-        vehicles = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return vehicles
+        with self.connection() as conn:
+            cursor = conn.cursor()
+        
+            cursor.execute('''
+                SELECT 
+                    v.id,
+                    v.license_plate,
+                    v.brand_corrected,
+                    v.model_corrected,
+                    v.weight,
+                    v.assigned_slot,
+                    v.entry_time,
+                    v.image_path,
+                    ps.floor
+                FROM vehicles v
+                LEFT JOIN parking_slots ps ON v.assigned_slot = ps.slot_code
+                WHERE v.status = 'parked'
+                ORDER BY v.entry_time DESC
+            ''')
+        
+            vehicles = [dict(row) for row in cursor.fetchall()]
+            return vehicles
     
     def get_vehicle_by_id(self, vehicle_id):
         """Lấy thông tin chi tiết xe theo ID"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                v.*,
-                ps.floor
-            FROM vehicles v
-            LEFT JOIN parking_slots ps ON v.assigned_slot = ps.slot_code
-            WHERE v.id = ?
-        ''', (vehicle_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return dict(row)
-        return None
+        with self.connection() as conn:
+            cursor = conn.cursor()
+        
+            cursor.execute('''
+                SELECT 
+                    v.*,
+                    ps.floor
+                FROM vehicles v
+                LEFT JOIN parking_slots ps ON v.assigned_slot = ps.slot_code
+                WHERE v.id = ?
+            ''', (vehicle_id,))
+        
+            row = cursor.fetchone()
+        
+            if row:
+                return dict(row)
+            
+            # Không có trong bảng chính: tìm trong archive có khoảng id chứa nó
+            months = [month for month, entry in self.archive_catalog().items()
+                      if entry['first_id'] <= vehicle_id <= entry['last_id']]
+            for i in range(0, len(months), ATTACH_LIMIT):
+                with self.archive.attached(conn, months[i:i + ATTACH_LIMIT]) as schemas:
+                    for schema, _ in schemas:
+                        row = conn.execute(f'''
+                            SELECT v.*, ps.floor
+                            FROM {schema}.vehicles v
+                            LEFT JOIN main.parking_slots ps ON v.assigned_slot = ps.slot_code
+                            WHERE v.id = ?
+                        ''', (vehicle_id,)).fetchone()
+                        if row:
+                            return dict(row)
+            return None
     
     def delete_vehicle(self, vehicle_id):
-        """Xóa xe khỏi hệ thống"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Xóa xe khỏi hệ thống (hot or archived); True if deleted, None if no such vehicle, False on error"""
+        self.flush()
+        with self.connection() as conn:
+            cursor = conn.cursor()
         
-        try:
-            # Lấy thông tin xe
-            cursor.execute("SELECT assigned_slot FROM vehicles WHERE id = ?", (vehicle_id,))
-            vehicle = cursor.fetchone()
+            try:
+                # Write lock first, like vehicle_exit: the status read here decides which counters move
+                conn.execute('BEGIN IMMEDIATE')
+                
+                # Lấy thông tin xe
+                cursor.execute('''
+                    SELECT assigned_slot, status, detected_floor, image_path
+                    FROM vehicles WHERE id = ?
+                ''', (vehicle_id,))
+                vehicle = cursor.fetchone()
             
-            if not vehicle:
-                conn.close()
-                return False
+                if not vehicle:
+                    conn.rollback()  # archives are attached outside a transaction
+                    return self._delete_archived(conn, vehicle_id)
             
-            slot_code = vehicle[0]
+                slot_code, status, floor, image_path = vehicle
             
-            # Xóa xe
-            cursor.execute("DELETE FROM vehicles WHERE id = ?", (vehicle_id,))
+                # Xóa xe
+                cursor.execute("DELETE FROM vehicles WHERE id = ? AND status = ?", (vehicle_id, status))
+                if cursor.rowcount != 1:
+                    conn.rollback()
+                    return False
             
-            # Giải phóng slot
-            cursor.execute('''
-                UPDATE parking_slots 
-                SET is_occupied = 0, vehicle_id = NULL 
-                WHERE slot_code = ?
-            ''', (slot_code,))
+                if status == 'parked':
+                    # Giải phóng slot (an exited vehicle's slot may already hold another car)
+                    cursor.execute('''
+                        UPDATE parking_slots 
+                        SET is_occupied = 0, vehicle_id = NULL 
+                        WHERE slot_code = ? AND vehicle_id = ?
+                    ''', (slot_code, vehicle_id))
+                    _record_hour(conn, datetime.now(), floor)
+                    _bump_counters(conn, total_processed=-1, current_parked=-1)
+                else:
+                    _bump_counters(conn, total_processed=-1)
+                _ref_image(conn, image_path, -1)
             
-            conn.commit()
-            conn.close()
-            return True
+                conn.commit()
+                if status == 'parked':
+                    self.occupancy.mark_code(slot_code, False)
+                    self.parked_plates.remove(vehicle_id)
+                self._publish('vehicle_deleted', slot_code, vehicle_id=vehicle_id)
+                return True
             
-        except Exception as e:
-            conn.rollback()
-            conn.close()
-            print(f"Error deleting vehicle: {e}")
-            return False
+            except Exception as e:
+                conn.rollback()
+                print(f"Error deleting vehicle: {e}")
+                return False
+    
+    def _delete_archived(self, conn, vehicle_id):
+        """delete_vehicle() for an id no longer in the hot table: look in the archives whose id range holds it"""
+        months = [month for month, entry in self.archive_catalog().items()
+                  if entry['first_id'] <= vehicle_id <= entry['last_id']]
+        for month in months:
+            with self.archive.attached(conn, [month]) as [(schema, _)]:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute(f"SELECT image_path FROM {schema}.vehicles WHERE id = ?",
+                                   (vehicle_id,)).fetchone()
+                if not row:
+                    conn.rollback()
+                    continue
+                conn.execute(f"DELETE FROM {schema}.vehicles WHERE id = ?", (vehicle_id,))
+                if self._plate_index_ready(conn, schema):
+                    conn.execute(f"DELETE FROM {schema}.vehicles_plate_fts WHERE rowid = ?", (vehicle_id,))
+                remaining = conn.execute(f"SELECT COUNT(*) FROM {schema}.vehicles").fetchone()[0]
+                if remaining:
+                    conn.execute(f'''
+                        UPDATE vehicle_archives SET (vehicles, first_id, last_id, first_entry, last_entry) =
+                            (SELECT COUNT(*), MIN(id), MAX(id), MIN(entry_time), MAX(entry_time) FROM {schema}.vehicles)
+                        WHERE month = ?
+                    ''', (month,))
+                else:
+                    conn.execute("DELETE FROM vehicle_archives WHERE month = ?", (month,))
+                _bump_counters(conn, total_processed=-1)
+                _ref_image(conn, row[0], -1)
+                conn.commit()
+            if not remaining:
+                self.archive.remove(month)  # detached by now
+            self._publish('vehicle_deleted', vehicle_id=vehicle_id)
+            return True
+        return None
+    
+    def release_image(self, image_path):
+        """An upload no vehicle ended up using (lot full, failed check-in): leave it to collect_images()"""
+        if not is_store_key(image_path):
+            return
+        with self.connection() as conn:
+            conn.execute("INSERT INTO images (key, refs, first_seen) VALUES (?, 0, CURRENT_TIMESTAMP) "
+                         "ON CONFLICT (key) DO NOTHING", (image_path,))
+            conn.commit()
+    
+    def collect_images(self, grace_seconds=UNREFERENCED_GRACE_SECONDS):
+        """
+        Delete stored images no vehicle references any more. A file saved (or uploaded
+        again) within grace_seconds is kept: its check-in may not be written yet.
+        """
+        self.flush()
+        with self.connection() as conn:
+            keys = [row[0] for row in conn.execute("SELECT key FROM images WHERE refs <= 0")]
+        removed = [key for key in keys
+                   if self.images.remove(key, older_than=grace_seconds, unused=self._image_unused)]
+        if removed:
+            with self.connection() as conn:
+                conn.executemany("DELETE FROM images WHERE key = ? AND refs <= 0", [(key,) for key in removed])
+                conn.commit()
+            print(f"🗑️ Removed {len(removed)} unreferenced images")
+        return len(removed)
+    
+    def _image_unused(self, key):
+        """No vehicle references the image (re-checked right before its file is deleted)"""
+        with self.connection() as conn:
+            row = conn.execute("SELECT refs FROM images WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] <= 0
     
     def get_system_statistics(self):
-        """Lấy thống kê hệ thống"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Tổng số xe đã xử lý
-        cursor.execute("SELECT COUNT(*) as total_processed FROM vehicles")
-        total_processed = cursor.fetchone()['total_processed']
-        
-        # Xe đang đỗ
-        cursor.execute("SELECT COUNT(*) as current_parked FROM vehicles WHERE status = 'parked'")
-        current_parked = cursor.fetchone()['current_parked']
-        
-        # Slot trống
-        cursor.execute("SELECT COUNT(*) as available_slots FROM parking_slots WHERE is_occupied = 0")
-        available_slots = cursor.fetchone()['available_slots']
-        
-        # Xe vào hôm nay
-        today = datetime.now().date()
-        cursor.execute('''
-            SELECT COUNT(*) as today_entries 
-            FROM vehicles 
-            WHERE DATE(entry_time) = ?
-        ''', (today,))
-        today_entries = cursor.fetchone()['today_entries']
-        
-        conn.close()
+        """Lấy thống kê hệ thống (counters + hourly rollup, no scan of vehicles)"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        with self.connection() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats_counters").fetchall())
+            
+            # Xe vào / ra hôm nay: at most 24 rows per floor
+            today_entries, today_exits = conn.execute('''
+                SELECT COALESCE(SUM(entries), 0), COALESCE(SUM(exits), 0)
+                FROM hourly_stats
+                WHERE hour >= ?
+            ''', (today,)).fetchone()
         
         return {
-            'total_processed': total_processed,
-            'current_parked': current_parked,
-            'available_slots': available_slots,
-            'today_entries': today_entries
-        }
\ No newline at end of file
+            'total_processed': counters.get('total_processed', 0),
+            'current_parked': counters.get('current_parked', 0),
+            'available_slots': self.occupancy.available(),
+            'today_entries': today_entries,
+            'today_exits': today_exits,
+        }
+    
+    def rebuild_statistics(self):
+        """
+        Recompute counters and hourly entries / exits from the tables (after bulk imports),
+        archived months included. Retried if archive_exited() moves rows in between.
+        """
+        self.flush()
+        with self.connection() as conn:
+            while True:
+                catalog = conn.execute("SELECT month, vehicles, archived_at FROM vehicle_archives").fetchall()
+                archived_hours = self._archived_hours(conn, sorted(row[0] for row in catalog))
+                conn.execute('BEGIN IMMEDIATE')
+                if conn.execute("SELECT month, vehicles, archived_at FROM vehicle_archives").fetchall() == catalog:
+                    break
+                conn.rollback()
+            _seed_statistics(conn, archived_hours)
+            conn.commit()
+    
+    def _archived_hours(self, conn, months):
+        """[(hour, floor, entries, exits)] over the archive files of `months`"""
+        hours = {}
+        for i in range(0, len(months), ATTACH_LIMIT):
+            with self.archive.attached(conn, months[i:i + ATTACH_LIMIT]) as schemas:
+                for schema, _ in schemas:
+                    for column, slot in (('entry_time', 0), ('exit_time', 1)):
+                        for hour, floor, count in conn.execute(f'''
+                            SELECT substr({column}, 1, 13), detected_floor, COUNT(*) FROM {schema}.vehicles
+                            WHERE {column} IS NOT NULL AND detected_floor IS NOT NULL
+                            GROUP BY 1, 2
+                        '''):
+                            hours.setdefault((hour, floor), [0, 0])[slot] += count
+        return [(hour, floor, entries, exits) for (hour, floor), (entries, exits) in hours.items()]
+    
+    def occupancy_series(self, start, end, floor=None):
+        """
+        Hourly [start, end) series per floor from hourly_stats: entries, exits, occupancy
+        after the hour's last change (carried over quiet hours), and the hour's peak.
+        """
+        start = datetime.strptime(_hour_key(start), '%Y-%m-%d %H')
+        end = datetime.strptime(_hour_key(end), '%Y-%m-%d %H')
+        hours = int((end - start).total_seconds() // 3600)
+        if hours <= 0:
+            raise ValueError('Empty time range')
+        if hours > MAX_SERIES_HOURS:
+            raise ValueError(f"Time range is limited to {MAX_SERIES_HOURS} hours")
+        keys = [_hour_key(start + timedelta(hours=i)) for i in range(hours)]
+        
+        floors = self.topology.floor_numbers() if floor is None else [int(floor)]
+        series = []
+        with self.connection() as conn:
+            for number in floors:
+                # Level before the range: last recorded hour (PRIMARY KEY (floor, hour) lookup)
+                previous = conn.execute('''
+                    SELECT occupied FROM hourly_stats
+                    WHERE floor = ? AND hour < ? AND occupied IS NOT NULL
+                    ORDER BY hour DESC LIMIT 1
+                ''', (number, keys[0])).fetchone()
+                level = previous[0] if previous else 0
+                rows = {row['hour']: row for row in conn.execute('''
+                    SELECT hour, entries, exits, occupied, peak_occupied FROM hourly_stats
+                    WHERE floor = ? AND hour >= ? AND hour < ?
+                ''', (number, keys[0], _hour_key(end)))}
+                
+                total = self.occupancy.counts(number)[0]
+                points = []
+                for key in keys:
+                    row = rows.get(key)
+                    peak = level
+                    if row is not None and row['occupied'] is not None:
+                        peak = max(level, row['peak_occupied'])
+                        level = row['occupied']
+                    points.append({
+                        'hour': key,
+                        'entries': row['entries'] if row else 0,
+                        'exits': row['exits'] if row else 0,
+                        'occupied': level,
+                        'peak_occupied': peak,
+                        'peak_utilization': round(peak / total, 3) if total else None,
+                    })
+                series.append({'floor': number, 'total_slots': total, 'points': points})
+        return series
@@ -0,0 +1,303 @@
+import re
+
+import numpy as np
+
+MATRIX_CHUNK_WORDS = 2048  # words per levenshtein_matrix pass (bounds its memory)
+
+
+def _pattern_masks(pattern):
+    """Bitmask of positions for every character of the pattern (Myers' Peq table)"""
+    masks = {}
+    for i, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def _bit_parallel_distance(masks, length, text):
+    """Myers/Hyyrö bit-parallel Levenshtein: one pass over text, O(len(text)) int ops"""
+    if length == 0:
+        return len(text)
+
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    pv, mv, score = full, 0, length
+
+    for char in text:
+        eq = masks.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+
+    return score
+
+
+def substring_distance(pattern, text):
+    """
+    Fewest edits turning pattern into some substring of text ('51A12' vs '51A12345' -> 0).
+    Same bit-parallel loop as above, but a match may start anywhere in text.
+    """
+    length = len(pattern)
+    if length == 0:
+        return 0
+
+    masks = _pattern_masks(pattern)
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    pv, mv, score = full, 0, length
+    best = score
+
+    for char in text:
+        eq = masks.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) & full  # no carry-in: starting a match costs nothing
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        if score < best:
+            best = score
+
+    return best
+
+
+def levenshtein(a, b):
+    """Edit distance between two strings"""
+    if a == b:
+        return 0
+    return _bit_parallel_distance(_pattern_masks(a), len(a), b)
+
+
+class BKTree:
+    """Burkhard-Keller tree for 'all words within distance k' queries"""
+
+    def __init__(self, words=()):
+        # Node = [word, {distance: child_node}]
+        self._root = None
+        self._size = 0
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, word):
+        """Insert a word, ignoring duplicates"""
+        if self._root is None:
+            self._root = [word, {}]
+            self._size = 1
+            return
+
+        masks = _pattern_masks(word)
+        node = self._root
+        while True:
+            distance = _bit_parallel_distance(masks, len(word), node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                self._size += 1
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """Return [(distance, word)] for every word within max_distance, closest first"""
+        if self._root is None:
+            return []
+
+        masks = _pattern_masks(word)
+        length = len(word)
+        results = []
+        stack = [self._root]
+        while stack:
+            node_word, children = stack.pop()
+            distance = _bit_parallel_distance(masks, length, node_word)
+            if distance <= max_distance:
+                results.append((distance, node_word))
+
+            # Triangle inequality: only subtrees in [d - k, d + k] can hold matches
+            low = distance - max_distance
+            high = distance + max_distance
+            for child_distance, child in children.items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+
+        results.sort()
+        return results
+
+
+def normalize_model(text):
+    """Uppercase and drop spaces/hyphens ('CX-5' -> 'CX5')"""
+    return str(text).upper().strip().replace(' ', '').replace('-', '')
+
+
+class ModelIndex:
+    """
+    Normalized-name lookup over a set of model names, plus the structures the matchers need,
+    each built on first use: code matrix and histograms (match_many), BK-tree (fuzzy_match_model)
+    """
+
+    def __init__(self, models=()):
+        self.normalized = {}  # normalized name -> model
+        self.tokens = {}  # normalized name / word -> set of models
+
+        for model in models:
+            normalized = normalize_model(model)
+            self.normalized.setdefault(normalized, model)
+
+            # Index the full name and each word (>= 3 chars) so 'COROLIA' finds 'COROLLA ALTIS'
+            keys = {normalized}
+            keys.update(normalize_model(word) for word in re.split(r'[\s\-]+', model)
+                        if len(word) >= 3)
+            for key in keys:
+                if key:
+                    self.tokens.setdefault(key, set()).add(model)
+
+        self._tree = None
+        self._encoded = None
+        self._histograms = None
+
+    def __len__(self):
+        return len(self.normalized)
+
+    def exact(self, normalized):
+        return self.normalized.get(normalized)
+
+    def tree(self):
+        """BK-tree over names and words, built once"""
+        if self._tree is None:
+            self._tree = BKTree(self.tokens)
+        return self._tree
+
+    def encoded(self):
+        """(models, normalized names, codes, lengths) for levenshtein_matrix, built once"""
+        if self._encoded is None:
+            models = sorted(set(self.normalized.values()))
+            names = [normalize_model(m) for m in models]
+            self._encoded = (models, names) + encode_words(names)
+        return self._encoded
+
+    def histograms(self):
+        """(alphabet, per-model character counts) for near(), built once"""
+        if self._histograms is None:
+            _, _, codes, _ = self.encoded()
+            alphabet = np.unique(codes[codes > 0])
+            self._histograms = (alphabet, char_histograms(codes, alphabet))
+        return self._histograms
+
+    def near(self, queries, max_ratio):
+        """
+        Positions (in encoded() order) of the models that may be within
+        max_ratio * max(len(query), len(model)) edits of some query. Bag distance over
+        character counts never exceeds the edit distance, so nothing in range is dropped.
+        """
+        _, _, _, lengths = self.encoded()
+        alphabet, histograms = self.histograms()
+        query_codes, query_lengths = encode_words(queries)
+        query_histograms = char_histograms(query_codes, alphabet)
+        keep = np.zeros(len(lengths), dtype=bool)
+        for query_histogram, query_length in zip(query_histograms, query_lengths):
+            diff = histograms - query_histogram
+            bound = np.maximum(np.clip(diff, 0, None).sum(axis=1), np.clip(-diff, 0, None).sum(axis=1))
+            keep |= bound <= max_ratio * np.maximum(lengths, query_length)
+        return np.flatnonzero(keep)
+
+    def candidates(self, normalized, max_distance):
+        """Models having a name or word within max_distance edits"""
+        models = set()
+        for _, key in self.tree().search(normalized, max_distance):
+            models.update(self.tokens[key])
+        return models
+
+
+def encode_words(words):
+    """Pad words into an (N, max_len) int32 code matrix plus their lengths"""
+    max_len = max((len(w) for w in words), default=0)
+    codes = np.zeros((len(words), max(max_len, 1)), dtype=np.int32)
+    lengths = np.zeros(len(words), dtype=np.int32)
+    for i, word in enumerate(words):
+        codes[i, :len(word)] = [ord(c) for c in word]
+        lengths[i] = len(word)
+    return codes, lengths
+
+
+def char_histograms(codes, alphabet):
+    """
+    Per-row counts of each alphabet code in an encode_words() matrix; the last column
+    counts characters outside the alphabet, padding is not counted
+    """
+    size = len(alphabet)
+    columns = np.searchsorted(alphabet, codes)
+    known = (columns < size) & (alphabet[np.minimum(columns, max(size - 1, 0))] == codes) if size else \
+        np.zeros(codes.shape, dtype=bool)
+    columns = np.where(known, columns, size)
+    columns[codes == 0] = size + 1
+    histograms = np.zeros((codes.shape[0], size + 2), dtype=np.int16)
+    np.add.at(histograms, (np.repeat(np.arange(codes.shape[0]), codes.shape[1]), columns.ravel()), 1)
+    return histograms[:, :size + 1]
+
+
+def levenshtein_matrix(queries, words, word_codes=None, word_lengths=None, chunk_words=MATRIX_CHUNK_WORDS):
+    """
+    Edit distance of every query against every word, as a (len(queries), len(words)) array.
+    The DP runs once over the longest query/word with numpy ops on the whole
+    queries x words grid, instead of one Python loop per pair. Words are taken
+    chunk_words at a time so the (queries, words, word length) DP arrays stay small.
+    """
+    if word_codes is None:
+        word_codes, word_lengths = encode_words(words)
+    if len(words) > chunk_words:
+        return np.concatenate([
+            levenshtein_matrix(queries, words[start:start + chunk_words],
+                               word_codes[start:start + chunk_words], word_lengths[start:start + chunk_words],
+                               chunk_words)
+            for start in range(0, len(words), chunk_words)
+        ], axis=1)
+    query_codes, query_lengths = encode_words(queries)
+    n_queries, n_words = len(queries), len(words)
+    word_max = word_codes.shape[1]
+
+    # prev[q, w, j] = distance(query[:i], word[:j])
+    prev = np.broadcast_to(np.arange(word_max + 1, dtype=np.int32),
+                           (n_queries, n_words, word_max + 1)).copy()
+    result = np.zeros((n_queries, n_words), dtype=np.int32)
+    word_index = np.minimum(word_lengths, word_max)[None, :]
+
+    done = query_lengths == 0
+    result[done] = word_lengths[None, :]
+
+    for i in range(query_codes.shape[1]):
+        current = np.empty_like(prev)
+        current[:, :, 0] = i + 1
+        # (Q, W, word_max): 0 where query[i] == word[j]
+        cost = (query_codes[:, i][:, None, None] != word_codes[None, :, :]).astype(np.int32)
+        substitution = prev[:, :, :-1] + cost
+        deletion = prev[:, :, 1:] + 1
+        best = np.minimum(substitution, deletion)
+        # insertions run left to right along the word
+        for j in range(word_max):
+            current[:, :, j + 1] = np.minimum(best[:, :, j], current[:, :, j] + 1)
+        prev = current
+
+        finished = query_lengths == i + 1
+        if finished.any():
+            result[finished] = np.take_along_axis(
+                prev[finished], np.broadcast_to(word_index, (finished.sum(), n_words))[:, :, None], axis=2
+            )[:, :, 0]
+
+    return result
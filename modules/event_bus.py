@@ -0,0 +1,86 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+HISTORY_SIZE = 1000  # events kept for clients reconnecting with Last-Event-ID
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for occupancy changes. Every event gets an increasing
+    id; the last HISTORY_SIZE events are kept so a reconnecting client can replay
+    what it missed instead of reloading everything. Clients see ids as 'token-N'
+    (event_id()): the token changes every run, so an id from before a restart resyncs.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE, token=None):
+        self._history = deque(maxlen=history_size)
+        self._condition = threading.Condition()
+        self.token = token or uuid.uuid4().hex[:8]
+        self.last_id = 0
+        self.subscribers = 0
+
+    def event_id(self, event):
+        """Id sent to clients (SSE 'id:' field, echoed back as Last-Event-ID)"""
+        return f"{self.token}-{event['id']}"
+
+    def _parse_id(self, event_id):
+        """'token-N' -> N; -1 (always resyncs) for another run's id or garbage"""
+        token, _, number = str(event_id).rpartition('-')
+        if token != self.token or not number.isdigit():
+            return -1
+        return int(number)
+
+    def publish(self, event_type, data):
+        with self._condition:
+            self.last_id += 1
+            event = {'id': self.last_id, 'type': event_type, 'data': data, 'time': time.time()}
+            self._history.append(event)
+            self._condition.notify_all()
+        return event
+
+    def _events_after(self, last_id):
+        """Buffered events newer than last_id, or None if some were already dropped"""
+        if last_id >= self.last_id:
+            return []
+        if not self._history or self._history[0]['id'] > last_id + 1:
+            return None
+        return [event for event in self._history if event['id'] > last_id]
+
+    def subscribe(self, last_id=None, heartbeat=15.0):
+        """
+        Yield events as they are published, None every `heartbeat` seconds of silence.
+        With last_id (an event_id()), missed events are replayed first; if they fell out of
+        the history, or the id is from another run, a single 'resync' event tells the client
+        to reload the full state.
+        """
+        if last_id is not None:
+            last_id = self._parse_id(last_id)
+        with self._condition:
+            pending = [] if last_id is None else self._events_after(last_id)
+            if pending is None or (last_id or 0) > self.last_id:
+                # Too far behind, or an id from a previous server run
+                pending = [{'id': self.last_id, 'type': 'resync', 'data': {}, 'time': time.time()}]
+            cursor = self.last_id
+            self.subscribers += 1
+
+        try:
+            for event in pending:
+                yield event
+            while True:
+                with self._condition:
+                    if self.last_id == cursor:
+                        self._condition.wait(heartbeat)
+                    events = self._events_after(cursor)
+                    if events is None:
+                        events = [{'id': self.last_id, 'type': 'resync', 'data': {}, 'time': time.time()}]
+                    cursor = self.last_id
+
+                if not events:
+                    yield None  # heartbeat
+                for event in events:
+                    yield event
+        finally:
+            with self._condition:
+                self.subscribers -= 1
@@ -1,76 +1,186 @@
 import difflib
-import csv
 import re
-from fuzzywuzzy import fuzz, process  # THÊM IMPORT NÀY
-import pandas as pd  # THÊM IMPORT NÀY
+import numpy as np
+from bisect import bisect_right
+from modules.aho_corasick import AhoCorasick
+from modules.car_catalog import CarCatalog, DEFAULT_FLOOR_CLASSES, DEFAULT_WEIGHT, floor_for_weight, parse_range
+from modules.edit_index import ModelIndex, levenshtein_matrix, normalize_model
+
+MATRIX_MAX_MODELS = 2000  # larger indexes (the whole catalog) are pre-filtered before the matrix
+
 
 class FuzzyMatcher:
-    def __init__(self, csv_path='static/models/inforcar.csv'):
+    normalize_model = staticmethod(normalize_model)
+
+    def __init__(self, csv_path='static/models/inforcar.csv', floor_classes=DEFAULT_FLOOR_CLASSES):
         self.csv_path = csv_path
-        self.cars_data = []
+        self.floor_classes = floor_classes
+        self.catalog = None  # CarCatalog (column-oriented, interned strings)
+        self.version = None  # short content hash of the loaded CSV
         self.brands = []
         self.models = []
-        self.df = None  # THÊM dataframe
         self.all_models = []  # THÊM danh sách models cho fuzzy matching
+        self.model_index = ModelIndex()
+        self.brand_model_indexes = {}  # BRAND -> ModelIndex of that brand's models
+        self.cars_by_brand = {}  # BRAND -> [catalog row ids] (CSV order)
+        self.car_by_brand_model = {}  # (BRAND, MODEL) -> first catalog row id
+        self._brand_aliases = {}  # YOLO brand -> catalog BRAND (cache)
+        self.keyword_automaton = AhoCorasick()  # model names + spacing/hyphen variants
         
         self.load_database()
     
     def load_database(self):
-        """Load database from CSV file"""
+        """Load database from CSV file (or its binary snapshot)"""
         print(f"📂 Loading car database from {self.csv_path}...")
         try:
-            with open(self.csv_path, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file, delimiter=';')
-                
-                for row in reader:
-                    brand = row.get('Brand', '').strip()
-                    model = row.get('Model', '').strip()
-                    
-                    # Save car info
-                    car_info = {
-                        'Brand': brand,
-                        'Model': model,
-                        'Year': row.get('Year', '').strip(),
-                        'Length (mm)': row.get('Length (mm)', '').strip(),
-                        'Width (mm)': row.get('Width (mm)', '').strip(),
-                        'Height (mm)': row.get('Height (mm)', '').strip(),
-                        'Kerb Weight (kg)': row.get('Kerb Weight (kg)', '').strip()
-                    }
-                    self.cars_data.append(car_info)
-                    
-                    # Add to lists for matching
-                    if brand and brand.lower() not in [b.lower() for b in self.brands]:
-                        self.brands.append(brand)
-                    if model and model.lower() not in [m.lower() for m in self.models]:
-                        self.models.append(model)
-            
-            print(f"✅ Loaded {len(self.cars_data)} vehicles, {len(self.brands)} brands, {len(self.models)} models")
-            
-            # Tạo DataFrame từ cars_data
-            self.df = pd.DataFrame(self.cars_data)
-            # Chuẩn hóa DataFrame
-            if 'Brand' in self.df.columns:
-                self.df['Brand'] = self.df['Brand'].astype(str).str.strip().str.upper()
-            if 'Model' in self.df.columns:
-                self.df['Model'] = self.df['Model'].astype(str).str.strip().str.upper()
-            
-            # Trích xuất all_models
-            self._extract_all_models()
-            
+            self.catalog = CarCatalog.load(self.csv_path, floor_classes=self.floor_classes)
         except Exception as e:
             print(f"❌ Error loading CSV: {e}")
-            # Tạo DataFrame rỗng nếu lỗi
-            self.df = pd.DataFrame()
-    
-    def _extract_all_models(self):
-        """Trích xuất tất cả các model từ database"""
-        if not self.df.empty and 'Model' in self.df.columns:
-            models = set(self.df['Model'].dropna().unique())
-            self.all_models = list(models)
-            print(f"📊 Extracted {len(self.all_models)} unique models for fuzzy matching")
-        else:
-            self.all_models = []
-            print("⚠️ No models extracted from database")
+            self.catalog = None
+
+        self.version = self.catalog.sha256[:12] if self.catalog else 'empty'
+        self._build_lookup_tables()
+        print(f"✅ Loaded {len(self.catalog or ())} vehicles, {len(self.brands)} brands, {len(self.models)} models")
+        print(f"📊 Extracted {len(self.all_models)} unique models for fuzzy matching")
+
+    def close(self):
+        """Unmap the catalog snapshot; the matcher can't look up cars afterwards"""
+        if self.catalog:
+            self.catalog.close()
+
+    @property
+    def cars_data(self):
+        """All catalog rows with their original casing"""
+        return list(self.catalog.iter_rows()) if self.catalog else []
+
+    def car_row(self, row_id):
+        """Catalog row with Brand/Model uppercased, plus the precomputed weight_kg and floor"""
+        car = self.catalog.row(row_id)
+        car['Brand'] = car['Brand'].upper()
+        car['Model'] = car['Model'].upper()
+        car['weight_kg'] = self.catalog.weight(row_id)
+        car['floor'] = self.catalog.floor(row_id)
+        return car
+
+    def floor_for_weight(self, weight):
+        return floor_for_weight(weight, self.floor_classes)
+
+    def models_in_weight_range(self, min_kg=None, max_kg=None, stat='mid'):
+        """Catalog rows whose kerb weight (min/max/mid) lies in [min_kg, max_kg]"""
+        if not self.catalog:
+            return []
+        return [self.car_row(row_id)
+                for row_id in self.catalog.range_query('weight', min_kg, max_kg, stat)]
+
+    def _build_lookup_tables(self):
+        """Build brand-keyed dictionaries and model indexes once at load time"""
+        self.cars_by_brand = {}
+        self.car_by_brand_model = {}
+        self._brand_aliases = {}
+        brands = {}  # lowercase -> original casing, first wins
+        models = {}
+        brand_models = {}
+
+        if self.catalog:
+            brand_ids = self.catalog.columns['Brand']
+            model_ids = self.catalog.columns['Model']
+            strings = self.catalog.strings
+            upper = {}  # string id -> uppercased (strings are interned, so compute once)
+
+            for row_id in range(len(self.catalog)):
+                brand_id, model_id = brand_ids[row_id], model_ids[row_id]
+                for sid in (brand_id, model_id):
+                    if sid not in upper:
+                        upper[sid] = strings[sid].upper()
+                brand, model = upper[brand_id], upper[model_id]
+
+                if strings[brand_id]:
+                    brands.setdefault(brand.lower(), strings[brand_id])
+                if strings[model_id]:
+                    models.setdefault(model.lower(), strings[model_id])
+
+                self.cars_by_brand.setdefault(brand, []).append(row_id)
+                self.car_by_brand_model.setdefault((brand, model), row_id)
+                if model:
+                    brand_models.setdefault(brand, set()).add(model)
+
+        self.brands = list(brands.values())
+        self.models = list(models.values())
+        self.all_models = list({m for group in brand_models.values() for m in group})
+        self.model_index = ModelIndex(self.all_models)
+        self.brand_model_indexes = {
+            brand: ModelIndex(sorted(group)) for brand, group in brand_models.items()
+        }
+        self.keyword_automaton = self._build_keyword_automaton(brand_models)
+
+    @staticmethod
+    def model_variants(model):
+        """'CX-5' -> {'CX-5', 'CX5', 'CX 5'}; 'COROLLA ALTIS' -> {..., 'COROLLAALTIS', 'COROLLA-ALTIS'}"""
+        words = [w for w in re.split(r'[\s\-]+', model.upper().strip()) if w]
+        if not words:
+            return set()
+        return {model.upper().strip()} | {sep.join(words) for sep in ('', ' ', '-')}
+
+    def _build_keyword_automaton(self, brand_models):
+        automaton = AhoCorasick()
+        for brand, group in brand_models.items():
+            for model in group:
+                for variant in self.model_variants(model):
+                    if len(variant) >= 2:
+                        automaton.add(variant, model)
+        return automaton.build()
+
+    def keyword_match(self, texts, brand=None):
+        """
+        Scan all OCR texts for catalog model names in one Aho-Corasick pass.
+        Preference: model of `brand`, then earlier text, then longer keyword.
+        Returns: {'model', 'keyword', 'candidate'} hoặc None
+        """
+        texts = [str(t).upper() for t in texts if t]
+        if not texts or not len(self.keyword_automaton):
+            return None
+
+        # One pass over all texts joined by a separator that no pattern contains
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        haystack = '\n'.join(texts)
+
+        brand_models = set()
+        brand_index = self.brand_model_indexes.get(self.resolve_brand(brand)) if brand else None
+        if brand_index:
+            brand_models = set(brand_index.normalized.values())
+
+        best = None
+        for start, end, keyword, model in self.keyword_automaton.search(haystack):
+            # Short keywords ('K3') must stand alone, not inside 'K300' or 'SK3'
+            if len(keyword) <= 2:
+                before = haystack[start - 1] if start > 0 else ' '
+                after = haystack[end] if end < len(haystack) else ' '
+                if before.isalnum() or after.isalnum():
+                    continue
+            text_index = bisect_right(starts, start) - 1
+            key = (model not in brand_models, text_index, -len(keyword))
+            if best is None or key < best[0]:
+                best = (key, keyword, model, texts[text_index])
+
+        if not best:
+            return None
+        _, keyword, model, candidate = best
+        return {'model': model, 'keyword': keyword, 'candidate': candidate}
+
+    def resolve_brand(self, brand):
+        """Map a (possibly misspelled) YOLO brand to a catalog brand, e.g. 'Huyndai' -> 'HYUNDAI'"""
+        brand_clean = str(brand).upper().strip() if brand else ""
+        if not brand_clean or brand_clean in self.cars_by_brand:
+            return brand_clean
+
+        if brand_clean not in self._brand_aliases:
+            matches = difflib.get_close_matches(brand_clean, list(self.cars_by_brand), n=1, cutoff=0.75)
+            self._brand_aliases[brand_clean] = matches[0] if matches else brand_clean
+        return self._brand_aliases[brand_clean]
 
     # def fuzzy_match_model(self, ocr_text, threshold=70):
     #     """
@@ -128,9 +238,13 @@ class FuzzyMatcher:
     #     print(f"   ❌ No match found for '{ocr_text_clean}'")
     #     return None
     
-    def fuzzy_match_model(self, ocr_text, threshold=0.5):  # threshold 0.8 = 80%
+    def fuzzy_match_model(self, ocr_text, threshold=0.5, max_distance=None, brand=None):  # threshold 0.8 = 80%
         """
-        Fuzzy match một OCR text với các model trong database (dùng difflib)
+        Fuzzy match một OCR text với các model trong database
+        Searches the models of `brand` first (when given and known), then all models.
+        Candidates come from the BK-tree (edit distance <= max_distance),
+        then are ranked with difflib like before. Kept for the legacy single-text API:
+        the recognition pipeline uses match_many(), so the tree is only built on first call.
         Returns: {'model': matched_model, 'score': match_score} hoặc None
         """
         if not self.all_models:
@@ -138,24 +252,38 @@ class FuzzyMatcher:
         
         # Chuẩn hóa OCR text
         ocr_clean = ocr_text.upper().strip()
-        ocr_normalized = ocr_clean.replace(' ', '').replace('-', '')
+        ocr_normalized = self.normalize_model(ocr_clean)
+        if max_distance is None:
+            max_distance = max(1, len(ocr_normalized) // 3)
         
         print(f"🔍 Matching: '{ocr_clean}' -> '{ocr_normalized}'")
+
+        indexes = []
+        brand_index = self.brand_model_indexes.get(self.resolve_brand(brand)) if brand else None
+        if brand_index:
+            indexes.append(brand_index)
+        indexes.append(self.model_index)
+
+        for index in indexes:
+            result = self._match_in_index(index, ocr_normalized, threshold, max_distance)
+            if result:
+                return result
         
+        return None
+
+    def _match_in_index(self, index, ocr_normalized, threshold, max_distance):
         # 1. Tìm EXACT MATCH sau khi chuẩn hóa (quan trọng!)
-        for model in self.all_models:
-            model_normalized = model.replace(' ', '').replace('-', '')
-            
-            if model_normalized == ocr_normalized:
-                print(f"   ✅ Exact match: '{model}'")
-                return {'model': model, 'score': 100}
+        exact = index.exact(ocr_normalized)
+        if exact:
+            print(f"   ✅ Exact match: '{exact}'")
+            return {'model': exact, 'score': 100}
         
-        # 2. Tìm best match với difflib
+        # 2. Lấy candidates trong bán kính edit distance, rồi xếp hạng với difflib
         best_match = None
         best_score = 0
         
-        for model in self.all_models:
-            model_normalized = model.replace(' ', '').replace('-', '')
+        for model in sorted(index.candidates(ocr_normalized, max_distance)):
+            model_normalized = self.normalize_model(model)
             
             # Tính similarity
             similarity = difflib.SequenceMatcher(
@@ -176,58 +304,97 @@ class FuzzyMatcher:
         print(f"   ❌ No good match (best: {best_match}, score: {score_percent:.1f})")
         return None
 
+    def match_many(self, candidates, top_k=3, threshold=0.5, brand=None):
+        """
+        Score every OCR candidate against the models in one matrix operation
+        (normalized edit-distance similarity, 100 = exact after normalization).
+        Models of `brand` are tried first, then all models (pre-filtered by character counts).
+        Returns: [(candidate, model, score)] best first, at most top_k
+        """
+        texts = list(dict.fromkeys(c.upper().strip() for c in candidates if c and c.strip()))
+        if not texts or not self.all_models:
+            return []
+
+        indexes = []
+        brand_index = self.brand_model_indexes.get(self.resolve_brand(brand)) if brand else None
+        if brand_index:
+            indexes.append(brand_index)
+        indexes.append(self.model_index)
+
+        for index in indexes:
+            ranked = self._rank_matrix(index, texts, top_k, threshold)
+            if ranked:
+                return ranked
+        return []
+
+    def _rank_matrix(self, index, texts, top_k, threshold):
+        normalized = [self.normalize_model(t) for t in texts]
+        models, names, codes, lengths = index.encoded()
+        if len(models) > MATRIX_MAX_MODELS:
+            # Whole catalog: drop models no candidate can reach the threshold with
+            # (character-count lower bound), score only the rest
+            near = index.near(normalized, 1.0 - threshold)
+            models, names = [models[i] for i in near], [names[i] for i in near]
+            codes, lengths = codes[near], lengths[near]
+        if not models:
+            return []
+
+        distances = levenshtein_matrix(normalized, names, codes, lengths)
+        query_lengths = np.array([len(n) for n in normalized], dtype=np.int32)
+        longest = np.maximum(np.maximum(query_lengths[:, None], lengths[None, :]), 1)
+        scores = 100.0 * (1.0 - distances / longest)
+
+        # Stable sort keeps OCR order (confidence order) among equal scores
+        order = np.argsort(-scores, axis=None, kind='stable')[:top_k]
+        ranked = []
+        for flat in order:
+            row, col = divmod(int(flat), len(models))
+            score = float(scores[row, col])
+            if score < threshold * 100:
+                break
+            ranked.append((texts[row], models[col], score))
+        return ranked
+
     def find_car_info_by_brand_model(self, brand, model):
         """Tìm thông tin xe bằng brand và model"""
-        brand_clean = str(brand).upper().strip() if brand else ""
+        brand_clean = self.resolve_brand(brand)
         model_clean = str(model).upper().strip() if model else ""
         
         print(f"🔍 Searching database: Brand='{brand_clean}', Model='{model_clean}'")
         
-        if self.df.empty:
+        if not self.cars_by_brand:
             print("   ⚠️ Database is empty, using default info")
             return self.get_default_info(brand_clean, model_clean)
         
         # Tìm exact match trước
-        if 'Brand' in self.df.columns and 'Model' in self.df.columns:
-            exact_match = self.df[
-                (self.df['Brand'].str.upper() == brand_clean) & 
-                (self.df['Model'].str.upper() == model_clean)
-            ]
-            
-            if not exact_match.empty:
-                print(f"   ✅ Exact match found in database")
-                return exact_match.iloc[0].to_dict()
-            
+        exact_match = self.car_by_brand_model.get((brand_clean, model_clean))
+        if exact_match is not None:
+            print(f"   ✅ Exact match found in database")
+            return self.car_row(exact_match)
+        
+        brand_cars = self.cars_by_brand.get(brand_clean)
+        if brand_cars:
             # Tìm partial match cho model
-            partial_match = self.df[
-                (self.df['Brand'].str.upper() == brand_clean) & 
-                (self.df['Model'].str.upper().str.contains(model_clean))
-            ]
-            
-            if not partial_match.empty:
-                print(f"   ✅ Partial match found (brand exact, model contains)")
-                return partial_match.iloc[0].to_dict()
+            for row_id in brand_cars:
+                if model_clean in self.catalog.value('Model', row_id).upper():
+                    print(f"   ✅ Partial match found (brand exact, model contains)")
+                    return self.car_row(row_id)
             
             # Tìm bằng brand only (lấy model đầu tiên)
-            brand_match = self.df[self.df['Brand'].str.upper() == brand_clean]
-            if not brand_match.empty:
-                print(f"   ℹ️  Brand match found, using first model")
-                return brand_match.iloc[0].to_dict()
+            print(f"   ℹ️  Brand match found, using first model")
+            return self.car_row(brand_cars[0])
         
         print(f"   ⚠️ No match in database, using default info")
         return self.get_default_info(brand_clean, model_clean)
     
     def find_car_info_by_brand(self, brand):
         """Tìm thông tin xe chỉ bằng brand"""
-        brand_clean = str(brand).upper().strip() if brand else ""
-        
-        if self.df.empty or 'Brand' not in self.df.columns:
-            return self.get_default_info(brand_clean, "")
+        brand_clean = self.resolve_brand(brand)
         
         # Lấy xe đầu tiên của brand đó
-        brand_cars = self.df[self.df['Brand'].str.upper() == brand_clean]
-        if not brand_cars.empty:
-            return brand_cars.iloc[0].to_dict()
+        brand_cars = self.cars_by_brand.get(brand_clean)
+        if brand_cars:
+            return self.car_row(brand_cars[0])
         
         return self.get_default_info(brand_clean, "")
     
@@ -253,7 +420,9 @@ class FuzzyMatcher:
             'Year': '2023',
             'Length (mm)': '4500',
             'Width (mm)': '1800',
-            'Height (mm)': '1500'
+            'Height (mm)': '1500',
+            'weight_kg': int(weight),
+            'floor': self.floor_for_weight(int(weight))
         }
     
     def normalize_text(self, text, search_list, cutoff=0.3):
@@ -287,7 +456,7 @@ class FuzzyMatcher:
     
     def find_car_info(self, brand_input, model_input):
         """Find car information from brand and model (phương thức cũ)"""
-        if not self.cars_data:
+        if not self.catalog:
             print("❌ Car database is empty")
             return None
         
@@ -309,7 +478,7 @@ class FuzzyMatcher:
         
         # Find matching cars
         matched_cars = []
-        for car in self.cars_data:
+        for car in self.catalog.iter_rows():
             brand_match = car['Brand'].lower() == normalized_brand.lower()
             
             # If model is provided, check model match
@@ -325,7 +494,7 @@ class FuzzyMatcher:
         # If no exact match, try fuzzy matching
         if not matched_cars:
             print("   No exact match, trying fuzzy search...")
-            for car in self.cars_data:
+            for car in self.catalog.iter_rows():
                 brand_similar = difflib.SequenceMatcher(
                     None, 
                     car['Brand'].lower(), 
@@ -363,22 +532,7 @@ class FuzzyMatcher:
     
     def parse_weight(self, weight_str):
         """Parse weight from string (handles ranges like '2600-2866')"""
-        if not weight_str or weight_str == 'Unknown':
-            return 1500  # Default weight
-        
-        try:
-            # Remove non-numeric characters except dash
-            weight_str = re.sub(r'[^0-9\-]', '', str(weight_str))
-            
-            if '-' in weight_str:
-                parts = weight_str.split('-')
-                if len(parts) >= 2:
-                    min_w = int(parts[0])
-                    max_w = int(parts[1])
-                    return (min_w + max_w) // 2  # Return average
-                else:
-                    return int(parts[0])
-            else:
-                return int(weight_str)
-        except:
-            return 1500  # Default if parsing fails
\ No newline at end of file
+        bounds = parse_range(weight_str)
+        if not bounds:
+            return DEFAULT_WEIGHT  # Default weight
+        return (bounds[0] + bounds[1]) // 2  # Return average
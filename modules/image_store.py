@@ -0,0 +1,88 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+DEFAULT_IMAGE_DIR = 'static/uploads'
+CHUNK_BYTES = 1024 * 1024  # hashed while copied, never read whole into memory
+UNREFERENCED_GRACE_SECONDS = 3600  # an image with no vehicle is kept this long before collection
+INCOMING_DIR = '.incoming'  # partial uploads, same filesystem as the store (atomic rename)
+
+# 'ab/cd/<sha256>.jpg'; anything else under the upload dir is a legacy 'uuid_name.jpg'
+STORE_KEY = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+$')
+
+
+def is_store_key(image_path):
+    return bool(image_path) and STORE_KEY.match(str(image_path)) is not None
+
+
+class ImageStore:
+    """
+    Uploaded images by content: sha256 of the bytes, sharded two levels deep
+    (ab/cd/abcd....jpg) so no directory grows past a few thousand files. Identical
+    uploads share one file; the DB keeps how many vehicles reference each (images table).
+    """
+
+    def __init__(self, root=DEFAULT_IMAGE_DIR):
+        self.root = root
+        # save() refreshing an existing file vs remove() deleting it: one or the other wins whole
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(digest, filename):
+        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'bin'
+        return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def save(self, source, filename):
+        """
+        Copy a file object into the store; returns its key. An image already stored is
+        not written again, only its mtime refreshed (keeps it out of an ongoing collection).
+        """
+        incoming = os.path.join(self.root, INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=incoming, delete=False) as tmp:
+            try:
+                while True:
+                    chunk = source.read(CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+
+        key = self.key(digest.hexdigest(), filename)
+        path = self.path(key)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(tmp.name)
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp.name, path)
+        return key
+
+    def remove(self, key, older_than=None, unused=None):
+        """
+        Delete the file; with older_than (seconds), only if it wasn't saved again since, and
+        with unused, only if unused(key) still holds. Both are checked under the save() lock.
+        """
+        path = self.path(key)
+        with self._lock:
+            try:
+                if older_than is not None and time.time() - os.path.getmtime(path) < older_than:
+                    return False
+                if unused is not None and not unused(key):
+                    return False
+                os.remove(path)
+                return True
+            except FileNotFoundError:
+                return True
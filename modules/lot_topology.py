@@ -0,0 +1,99 @@
+import json
+import os
+
+DEFAULT_TOPOLOGY_PATH = 'database/lot_topology.json'
+
+# Same lot the system always had: 3 floors x 20 slots (I.A .. III.T)
+DEFAULT_TOPOLOGY = {
+    'floors': [
+        {'floor': 1, 'name': 'Tầng 1', 'prefix': 'I', 'max_weight': 999,
+         'zones': [{'zone': '', 'slots': 20, 'labels': 'letters'}]},
+        {'floor': 2, 'name': 'Tầng 2', 'prefix': 'II', 'max_weight': 2000,
+         'zones': [{'zone': '', 'slots': 20, 'labels': 'letters'}]},
+        {'floor': 3, 'name': 'Tầng 3', 'prefix': 'III', 'max_weight': None,
+         'zones': [{'zone': '', 'slots': 20, 'labels': 'letters'}]},
+    ]
+}
+
+
+def slot_label(index, labels='letters', width=2):
+    """0 -> 'A', 25 -> 'Z', 26 -> 'AA' (letters) or 0 -> '01' (numbers)"""
+    if labels == 'numbers':
+        return str(index + 1).zfill(width)
+    label = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        label = chr(65 + rest) + label
+    return label
+
+
+class LotTopology:
+    """Floors, zones, slots and per-floor weight limits of the parking lot"""
+
+    def __init__(self, config=None, source=None):
+        config = config or DEFAULT_TOPOLOGY
+        self.source = source
+        self.floors = []
+        for floor in sorted(config['floors'], key=lambda f: f['floor']):
+            number = int(floor['floor'])
+            zones = floor.get('zones') or [{'zone': '', 'slots': floor.get('slots', 0)}]
+            self.floors.append({
+                'floor': number,
+                'name': floor.get('name', f"Tầng {number}"),
+                'prefix': floor.get('prefix', str(number)),
+                'max_weight': floor.get('max_weight'),
+                'zones': [{'zone': str(z.get('zone', '')), 'slots': int(z['slots']),
+                           'labels': z.get('labels', 'numbers' if z.get('zone') else 'letters')}
+                          for z in zones],
+            })
+        if not self.floors:
+            raise ValueError('Lot topology has no floors')
+        self._by_floor = {floor['floor']: floor for floor in self.floors}
+
+    @classmethod
+    def load(cls, path=DEFAULT_TOPOLOGY_PATH):
+        """Read the JSON config; the built-in 3 x 20 lot when the file is missing"""
+        if not path or not os.path.exists(path):
+            print(f"⚠️ {path} not found, using the default 3 x 20 lot")
+            return cls(DEFAULT_TOPOLOGY)
+        with open(path, encoding='utf-8') as f:
+            topology = cls(json.load(f), source=path)
+        print(f"🏢 Lot topology: {len(topology.floors)} floors, {topology.total_slots()} slots ({path})")
+        return topology
+
+    def floor_numbers(self):
+        return [floor['floor'] for floor in self.floors]
+
+    def floor(self, number):
+        return self._by_floor.get(number)
+
+    def slots(self):
+        """Yield (slot_code, floor, zone) for every slot, in allocation order"""
+        for floor in self.floors:
+            for zone in floor['zones']:
+                width = len(str(zone['slots']))
+                for i in range(zone['slots']):
+                    code = f"{floor['prefix']}.{zone['zone']}{slot_label(i, zone['labels'], width)}"
+                    yield code, floor['floor'], zone['zone']
+
+    def total_slots(self):
+        return sum(zone['slots'] for floor in self.floors for zone in floor['zones'])
+
+    def floor_classes(self):
+        """((max_weight, floor), ..., (None, last_floor)) for the catalog's weight -> floor mapping"""
+        limited = sorted((f for f in self.floors if f['max_weight'] is not None),
+                         key=lambda f: f['max_weight'])
+        classes = [(f['max_weight'], f['floor']) for f in limited]
+        unlimited = [f['floor'] for f in self.floors if f['max_weight'] is None]
+        classes.append((None, unlimited[-1] if unlimited else self.floors[-1]['floor']))
+        return tuple(classes)
+
+    def floors_for_weight(self, weight):
+        """Floors whose weight limit fits the vehicle (all floors when weight is unknown)"""
+        if weight is None:
+            return self.floor_numbers()
+        return [f['floor'] for f in self.floors if f['max_weight'] is None or weight <= f['max_weight']]
+
+    def to_dict(self):
+        return {'floors': [dict(floor, total=sum(z['slots'] for z in floor['zones'])) for floor in self.floors]}
@@ -3,6 +3,8 @@ import sys
 import os
 import re
 
+from modules.plate_engine import get_plate_engine
+
 class TextDetectionOCR:
     def __init__(self):
         def __init__(self):
@@ -131,6 +133,6 @@ class TextDetectionOCR:
         return {
             'texts': texts,
             'model': model,
-            'license_plate': None,  # Nếu cần thêm sau
+            'license_plate': get_plate_engine().extract(texts),
             'raw_result': result  # Giữ nguyên kết quả gốc
         }
\ No newline at end of file
@@ -3,6 +3,8 @@ from paddleocr import PaddleOCR
 import cv2
 import numpy as np
 
+from modules.plate_engine import get_plate_engine
+
 class OCRProcessor:
     def __init__(self):
         """Khởi tạo PaddleOCR"""
@@ -77,23 +79,4 @@ class OCRProcessor:
     
     def extract_license_plate(self, ocr_results):
         """Trích xuất biển số xe"""
-        if not ocr_results:
-            return None
-        
-        # Pattern cho biển số Việt Nam
-        plate_patterns = [
-            r'[0-9]{2}[A-Z]{1,2}[-\s]?[0-9]{4,5}',  # 51A-12345
-            r'[0-9]{2}[A-Z]{1,2}[0-9]{4,5}',         # 51A12345
-            r'[A-Z]{2}[-\s]?[0-9]{3,5}[-\s]?[A-Z]{1,2}',  # AB-123-CD
-            r'\b\d{2}[A-Z]\d{4,5}\b'  # 51A12345
-        ]
-        
-        for detection in ocr_results:
-            text = detection['text'].upper().replace(' ', '')
-            
-            for pattern in plate_patterns:
-                match = re.search(pattern, text)
-                if match:
-                    return match.group()
-        
-        return None
\ No newline at end of file
+        return get_plate_engine().extract(ocr_results)
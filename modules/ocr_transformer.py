@@ -5,6 +5,8 @@ import torch
 import sys
 import os
 
+from modules.plate_engine import get_plate_engine
+
 class TextDetectionOCR:
     def __init__(self, craft_path='craft_pytorch'):
         print("🚀 Initializing Transformer OCR System...")
@@ -278,26 +280,9 @@ class TextDetectionOCR:
     
     def extract_license_plate(self, ocr_texts):
         """Extract license plate from OCR results"""
-        if not ocr_texts:
-            return None
-        
-        import re
-        
-        patterns = [
-            r'\b\d{2}[A-Z]{1,2}\d{4,5}\b',  # 51A12345
-            r'\b\d{2}[A-Z]{1,2}[-]?\d{4,5}\b',  # 51A-12345
-            r'\b[A-Z]{2}\d{3,5}[A-Z]?\b'  # AB12345
-        ]
-        
-        for item in ocr_texts:
-            text = item['text'].upper().replace(' ', '')
-            
-            for pattern in patterns:
-                match = re.search(pattern, text)
-                if match:
-                    plate = match.group()
-                    print(f"✅ Found license plate: '{plate}'")
-                    return plate
-        
-        print("⚠️ No license plate pattern found")
-        return None
\ No newline at end of file
+        plate = get_plate_engine().extract(ocr_texts)
+        if plate:
+            print(f"✅ Found license plate: '{plate}'")
+        else:
+            print("⚠️ No license plate pattern found")
+        return plate
\ No newline at end of file
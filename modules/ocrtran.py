@@ -22,6 +22,30 @@ craft_path = os.path.join(PROJECT_DIR, "CRAFT-pytorch")
 # Thêm vào sys.path
 sys.path.insert(0, craft_path)
 
+# Vùng chữ có dạng biển số (process_plates): VN plate 520 x 110 mm (≈4.7:1) or
+# 330 x 165 mm read as two rows ('51A', '123.45'), each row roughly 1.2:1 .. 3:1
+PLATE_MIN_ASPECT = 1.2
+PLATE_MAX_ASPECT = 7.0
+PLATE_MIN_HEIGHT = 12  # px; smaller text is unreadable anyway
+MAX_PLATE_REGIONS = 6  # largest plate-shaped regions sent to TrOCR
+TROCR_BATCH_SIZE = 16  # text regions per TrOCR generate call (process_image_batch)
+
+
+def plate_shaped_boxes(boxes):
+    """CRAFT boxes whose width / height fits a plate row, largest first (at most MAX_PLATE_REGIONS)"""
+    shaped = []
+    for box in boxes:
+        box = np.asarray(box)
+        width = box[:, 0].max() - box[:, 0].min()
+        height = box[:, 1].max() - box[:, 1].min()
+        if height >= PLATE_MIN_HEIGHT and PLATE_MIN_ASPECT <= width / height <= PLATE_MAX_ASPECT:
+            shaped.append((width * height, box))
+    shaped.sort(key=lambda item: -item[0])
+    # Back to top-to-bottom order so the two rows of a 2-line plate stay adjacent
+    regions = [box for _, box in shaped[:MAX_PLATE_REGIONS]]
+    regions.sort(key=lambda box: (box[:, 1].min(), box[:, 0].min()))
+    return regions
+
 
 
 # CRAFT model imports và utilities
@@ -126,6 +150,23 @@ class TextDetectionOCR:
             print(f"❌ Transformer OCR error: {e}")
             return "", 0.0
 
+    def recognize_batch_with_trocr(self, image_regions):
+        """Nhận dạng nhiều vùng trong một lần generate (một forward pass cho cả batch)"""
+        if self.trocr_processor is None or self.trocr_model is None or not image_regions:
+            return [("", 0.0) for _ in image_regions]
+        
+        try:
+            pil_images = [Image.fromarray(region) for region in image_regions]
+            pixel_values = self.trocr_processor(images=pil_images, return_tensors="pt").pixel_values
+            with torch.no_grad():
+                generated_ids = self.trocr_model.generate(pixel_values)
+            texts = self.trocr_processor.batch_decode(generated_ids, skip_special_tokens=True)
+            return [(text, 0.9) for text in texts]
+            
+        except Exception as e:
+            print(f"❌ Transformer OCR batch error: {e}")
+            return [("", 0.0) for _ in image_regions]
+
     def preprocess_image(self, image):
         """Tiền xử lý ảnh để cải thiện OCR"""
         try:
@@ -240,6 +281,77 @@ class TextDetectionOCR:
             'detections': results
         }
 
+    def process_image_batch(self, image_paths):
+        """
+        process_image cho nhiều ảnh (batch ingest): CRAFT từng ảnh, rồi TrOCR gom vùng chữ
+        của tất cả ảnh thành batch TROCR_BATCH_SIZE. Không vẽ box / heatmap.
+        Trả về [{'detections': [...]} hoặc None] theo thứ tự image_paths.
+        """
+        results = []
+        crops = []  # (image index, box, coordinates, enhanced region)
+        for index, image_path in enumerate(image_paths):
+            image = cv2.imread(image_path)
+            if image is None:
+                results.append(None)
+                continue
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            results.append({'detections': []})
+            
+            boxes, _, _ = self.craft_detector.detect_text_regions(image)
+            for box in boxes:
+                box = box.astype(np.int32)
+                x_min, y_min = box[:, 0].min(), box[:, 1].min()
+                x_max, y_max = box[:, 0].max(), box[:, 1].max()
+                margin_w = max(15, (x_max - x_min) // 3)
+                margin_h = max(15, (y_max - y_min) // 3)
+                x_min, y_min = max(0, x_min - margin_w), max(0, y_min - margin_h)
+                x_max, y_max = min(image.shape[1], x_max + margin_w), min(image.shape[0], y_max + margin_h)
+                region = image[y_min:y_max, x_min:x_max]
+                if region.size > 0:
+                    coordinates = {'x_min': x_min, 'y_min': y_min, 'x_max': x_max, 'y_max': y_max}
+                    crops.append((index, box, coordinates, self.enhance_image_quality(region)))
+        
+        for start in range(0, len(crops), TROCR_BATCH_SIZE):
+            chunk = crops[start:start + TROCR_BATCH_SIZE]
+            texts = self.recognize_batch_with_trocr([region for _, _, _, region in chunk])
+            for (index, box, coordinates, _), (text, confidence) in zip(chunk, texts):
+                results[index]['detections'].append({
+                    'bbox': box.tolist(), 'text': text, 'confidence': confidence, 'coordinates': coordinates
+                })
+        return results
+
+    def process_plates(self, image_path):
+        """
+        Chỉ đọc biển số (cổng ra): CRAFT một lần, chỉ nhận dạng các vùng có dạng biển số,
+        TrOCR theo batch, không vẽ box. Trả về {'detections': [...]} như process_image.
+        """
+        image = self.load_image(image_path)
+        if image is None:
+            return None
+        
+        boxes, _, _ = self.craft_detector.detect_text_regions(image)
+        regions = plate_shaped_boxes(boxes)
+        print(f"🔍 {len(regions)}/{len(boxes)} vùng văn bản có dạng biển số")
+        
+        crops, coordinates = [], []
+        for box in regions:
+            box = box.astype(np.int32)
+            x_min, y_min = box[:, 0].min(), box[:, 1].min()
+            x_max, y_max = box[:, 0].max(), box[:, 1].max()
+            margin_w = max(8, (x_max - x_min) // 10)
+            margin_h = max(8, (y_max - y_min) // 4)
+            x_min, y_min = max(0, x_min - margin_w), max(0, y_min - margin_h)
+            x_max, y_max = min(image.shape[1], x_max + margin_w), min(image.shape[0], y_max + margin_h)
+            region = image[y_min:y_max, x_min:x_max]
+            if region.size > 0:
+                crops.append(self.enhance_image_quality(region))
+                coordinates.append((box, {'x_min': x_min, 'y_min': y_min, 'x_max': x_max, 'y_max': y_max}))
+        
+        results = []
+        for (box, coords), (text, confidence) in zip(coordinates, self.recognize_batch_with_trocr(crops)):
+            results.append({'bbox': box.tolist(), 'text': text, 'confidence': confidence, 'coordinates': coords})
+        return {'detections': results}
+
     def enhance_image_quality(self, image):
         """Nâng cao chất lượng ảnh cho OCR"""
         try:
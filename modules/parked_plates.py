@@ -0,0 +1,112 @@
+import threading
+
+from modules.edit_index import levenshtein
+from modules.plate_engine import PLATE_FOLD, canonical_plate
+
+# Edits tolerated between the read plate and a parked one. 0 by default: a read of a car
+# that already left ('30A12346') must not release its neighbour ('30A12345').
+MAX_EXIT_DISTANCE = 0
+
+
+class ParkedPlateIndex:
+    """
+    Plates of the vehicles currently parked, for matching an exit camera read.
+    Exact plate, then the plate with OCR lookalikes folded (O/0, I/1, S/5 ...), then
+    (when max_distance > 0) the single closest plate within that many edits. Kept in step with the vehicles
+    table by the DB layer after each commit; rebuild() reloads it. Entries are per vehicle: two
+    parked rows with the same plate both stay indexed until each one exits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id = {}  # vehicle_id -> (canonical plate, stored license_plate)
+        self._by_plate = {}  # canonical plate -> {vehicle_id}
+        self._by_folded = {}  # folded plate -> {canonical plate}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def rebuild(self, conn):
+        rows = conn.execute("SELECT id, license_plate FROM vehicles WHERE status = 'parked'").fetchall()
+        with self._lock:
+            self._by_id, self._by_plate, self._by_folded = {}, {}, {}
+            for vehicle_id, license_plate in rows:
+                self._add(vehicle_id, license_plate)
+        return self
+
+    def _add(self, vehicle_id, license_plate):
+        plate = canonical_plate(license_plate)
+        if not plate or str(license_plate).startswith('UNK_'):
+            return  # checked in without a readable plate
+        self._by_id[vehicle_id] = (plate, license_plate)
+        self._by_plate.setdefault(plate, set()).add(vehicle_id)
+        self._by_folded.setdefault(plate.translate(PLATE_FOLD), set()).add(plate)
+
+    def add(self, vehicle_id, license_plate):
+        with self._lock:
+            self._add(vehicle_id, license_plate)
+
+    def remove(self, vehicle_id):
+        with self._lock:
+            entry = self._by_id.pop(vehicle_id, None)
+            if entry is None:
+                return
+            plate = entry[0]
+            ids = self._by_plate[plate]
+            ids.discard(vehicle_id)
+            if ids:
+                return  # another parked vehicle still carries this plate
+            del self._by_plate[plate]
+            folded = plate.translate(PLATE_FOLD)
+            plates = self._by_folded.get(folded, set())
+            plates.discard(plate)
+            if not plates:
+                self._by_folded.pop(folded, None)
+
+    def _found(self, plate, match, distance=0):
+        """Earliest parked vehicle with the plate (duplicate rows of one plate leave in check-in order)"""
+        vehicle_id = min(self._by_plate[plate])
+        return {'vehicle_id': vehicle_id, 'license_plate': self._by_id[vehicle_id][1],
+                'match': match, 'distance': distance}
+
+    def lookup(self, text, max_distance=MAX_EXIT_DISTANCE):
+        """
+        {'vehicle_id', 'license_plate', 'match', 'distance'} for the parked vehicle the
+        text reads as, or None when nothing (or more than one plate equally) matches
+        """
+        plate = canonical_plate(text)
+        if not plate:
+            return None
+        with self._lock:
+            if plate in self._by_plate:
+                return self._found(plate, 'exact')
+
+            folded = plate.translate(PLATE_FOLD)
+            plates = self._by_folded.get(folded, ())
+            if len(plates) == 1:
+                return self._found(next(iter(plates)), 'lookalike')
+            if plates or not max_distance:
+                return None  # ambiguous lookalikes: don't guess which car is leaving
+
+            # A handful to a few thousand parked plates: one bit-parallel pass each
+            best, best_distance, tied = None, max_distance + 1, False
+            for candidate in self._by_folded:
+                if abs(len(candidate) - len(folded)) > max_distance:
+                    continue
+                distance = levenshtein(folded, candidate)
+                if distance < best_distance:
+                    best, best_distance, tied = candidate, distance, False
+                elif distance == best_distance:
+                    tied = True
+            if best is None or tied or len(self._by_folded[best]) != 1:
+                return None
+            return self._found(next(iter(self._by_folded[best])), 'fuzzy', best_distance)
+
+    def match(self, candidates, max_distance=MAX_EXIT_DISTANCE):
+        """First lookup() hit over plate readings ordered best first (strings or plate engine dicts)"""
+        for candidate in candidates:
+            text = candidate.get('plate') if isinstance(candidate, dict) else candidate
+            found = self.lookup(text, max_distance)
+            if found:
+                return dict(found, read=text)
+        return None
@@ -0,0 +1,364 @@
+import queue
+import threading
+import uuid
+import zipfile
+from contextlib import nullcontext
+from datetime import datetime
+
+BATCH_SIZE = 8  # images per YOLO / OCR call and per slot-allocation transaction
+MAX_BATCH_IMAGES = 500  # per request (files + zip members)
+MAX_IMAGE_BYTES = 16 * 1024 * 1024  # per image, zip members included
+QUEUE_BATCHES = 2  # batches buffered between stages (decode -> detect -> park)
+
+
+def quiet(*args, **kwargs):
+    """log= for identify_vehicle when processing in bulk"""
+
+
+def read_ocr_texts(ocr_result):
+    """[{'text', 'confidence'}] of the non-empty OCR detections"""
+    ocr_texts = []
+    if ocr_result and isinstance(ocr_result, dict) and 'detections' in ocr_result:
+        for detection in ocr_result['detections']:
+            text = detection.get('text', '').strip()
+            confidence = detection.get('confidence', 0)
+            if text:
+                ocr_texts.append({'text': text, 'confidence': confidence})
+    return ocr_texts
+
+
+def identify_vehicle(fuzzy, plate_engine, yolo_result, ocr_result, log=print):
+    """
+    Brand (YOLO) + model (OCR fuzzy / keyword match) -> catalog info, weight, floor and plate.
+    Shared by /api/process and the batch pipeline; `log` gets the step-by-step trace.
+    """
+    brand_yolo = yolo_result.get('brand', 'unknown').capitalize()
+    yolo_confidence = yolo_result.get('confidence', 0)
+    log(f"🎯 YOLO Detection: {brand_yolo} (confidence: {yolo_confidence:.2%})")
+
+    # 3. Process OCR results
+    ocr_texts = read_ocr_texts(ocr_result)
+    log(f"📝 OCR Raw Results: {[t['text'] for t in ocr_texts]}")
+
+    # 4. Fuzzy match các OCR texts với database để tìm model
+    selected_model = None
+    log(f"🔍 Fuzzy matching OCR texts with database (models of {brand_yolo} first):")
+
+    candidate_texts = []
+    for text_item in ocr_texts:
+        text = text_item['text'].upper().strip()
+        confidence = text_item['confidence']
+        candidate_texts.append(text)
+        log(f"   Candidate: '{text}' (OCR confidence: {confidence:.2f})")
+
+    # Fuzzy match tất cả candidates với database trong một lần (ma trận candidates x models)
+    all_matches = [
+        (match_score, model_name, candidate)
+        for candidate, model_name, match_score in fuzzy.match_many(candidate_texts, top_k=3, brand=brand_yolo)
+    ]
+    for match_score, model_name, candidate in all_matches:
+        log(f"   '{candidate}' → Matched: {model_name} (score: {match_score:.2f})")
+
+    if all_matches:
+        # match_many đã sắp xếp theo score giảm dần
+        best_score, selected_model, best_candidate = all_matches[0]
+
+        log(f"\n📊 Top matches:")
+        for i, (score, model, candidate) in enumerate(all_matches[:3]):  # Top 3
+            log(f"   {i+1}. '{candidate}' → {model} (score: {score:.2f})")
+
+        log(f"\n🎯 Selected: '{best_candidate}' → {selected_model} (score: {best_score:.2f})")
+    else:
+        log("   No matches found from fuzzy matching")
+
+    # 5. Nếu không tìm được model bằng fuzzy match, thử tìm bằng keyword matching
+    if not selected_model:
+        log(f"⚠️ No fuzzy match found, trying keyword matching...")
+
+        # Quét tất cả OCR texts với automaton (mọi model trong catalog + biến thể CX5/CX-5/CX 5)
+        keyword = fuzzy.keyword_match(candidate_texts, brand=brand_yolo)
+        if keyword:
+            selected_model = keyword['model']
+            log(f"   Keyword match: '{keyword['candidate']}' contains '{keyword['keyword']}' -> {selected_model}")
+
+    # 6. Kết hợp brand từ YOLO và model từ OCR
+    final_brand = brand_yolo
+    final_model = selected_model
+
+    log(f"\n🎯 FINAL RESULT:")
+    log(f"   Brand (from YOLO): {final_brand}")
+    log(f"   Model (from OCR fuzzy): {final_model}")
+
+    # 7. Tìm thông tin xe đầy đủ từ database
+    if final_model:
+        car_info = fuzzy.find_car_info_by_brand_model(final_brand, final_model)
+    else:
+        # Nếu không có model, chỉ tìm bằng brand
+        car_info = fuzzy.find_car_info_by_brand(final_brand)
+
+    if not car_info:
+        log("❌ No match found in database, trying fallback...")
+
+        # Fallback 1: Thử tìm chỉ bằng brand
+        car_info = fuzzy.find_car_info_by_brand(final_brand)
+
+        # Fallback 2: Dùng thông tin mặc định
+        if not car_info:
+            log("⚠️ Using default car info")
+            car_info = {
+                'Brand': final_brand if final_brand != 'unknown' else 'Unknown',
+                'Model': final_model or 'Unknown',
+                'Kerb Weight (kg)': '000',  # Trọng lượng trung bình
+                'Year': 'Unknown',
+                'Length (mm)': 'Unknown',
+                'Width (mm)': 'Unknown',
+                'Height (mm)': 'Unknown'
+            }
+
+    log(f"✅ Database Match Found:")
+    log(f"   Brand: {car_info.get('Brand', 'Unknown')}")
+    log(f"   Model: {car_info.get('Model', 'Unknown')}")
+    log(f"   Weight: {car_info.get('Kerb Weight (kg)', 'Unknown')} kg")
+
+    # 8. Trọng lượng và tầng đã được tính sẵn khi load catalog
+    weight = car_info.get('weight_kg')
+    if weight is None:
+        weight = fuzzy.parse_weight(car_info['Kerb Weight (kg)'])
+    floor = car_info.get('floor') or fuzzy.floor_for_weight(weight)
+
+    log(f"⚖️ Weight Analysis:")
+    log(f"   Raw weight: {car_info['Kerb Weight (kg)']}")
+    log(f"   Parsed weight: {weight}")
+    log(f"   Assigned floor: {floor}")
+
+    # 10. Extract license plate (if present)
+    plate_match = plate_engine.best(ocr_texts)
+    license_plate = plate_match['plate'] if plate_match else None
+    if plate_match:
+        log(f"🔢 License plate: {plate_match['display']} (score {plate_match['score']}, from '{plate_match['source']}')")
+
+    # 11. model_raw: OCR text gốc của model đã chọn
+    model_raw = None
+    if all_matches and selected_model:
+        for score, matched_model, ocr_text in all_matches:
+            if matched_model == selected_model:
+                model_raw = ocr_text  # Lấy OCR text gốc
+                break
+
+        # Nếu không tìm thấy, lấy candidate đầu tiên
+        if not model_raw and all_matches:
+            model_raw = all_matches[0][2]  # candidate từ match đầu tiên
+
+    log(f"📝 OCR → Fuzzy matching:")
+    log(f"   '{model_raw}' → '{selected_model}'")
+
+    return {
+        'brand_yolo': brand_yolo,
+        'yolo_confidence': yolo_confidence,
+        'ocr_texts': ocr_texts,
+        'model_raw': model_raw,
+        'car_info': car_info,
+        'weight': weight,
+        'floor': floor,
+        'license_plate': license_plate,
+    }
+
+
+def vehicle_record(identified, image_filename):
+    """vehicle_data for DatabaseManager.allocate_and_park"""
+    car_info = identified['car_info']
+    return {
+        'license_plate': identified['license_plate'] or f"UNK_{str(uuid.uuid4())[:6]}",
+        'brand_raw': identified['brand_yolo'],
+        'brand_corrected': car_info.get('Brand', 'Unknown'),
+        'model_raw': identified['model_raw'] or 'Unknown',
+        'model_corrected': car_info.get('Model', 'Unknown'),
+        'weight': identified['weight'],
+        'image_path': image_filename,
+        'entry_time': datetime.now()
+    }
+
+
+def process_result(identified, vehicle_data, slot, image_filename, catalog_version):
+    """The 'data' object returned by /api/process (and per image by the batch endpoint)"""
+    car_info = identified['car_info']
+    return {
+        'detection': {
+            'brand_before': identified['brand_yolo'],
+            'brand_after': car_info.get('Brand', 'Unknown'),
+            'model_before': identified['model_raw'] or 'Unknown',
+            'model_after': car_info.get('Model', 'Unknown'),
+            'yolo_confidence': identified['yolo_confidence'],
+            'ocr_texts': [t['text'] for t in identified['ocr_texts']],
+            'catalog_version': catalog_version
+        },
+        'vehicle': {
+            'license_plate': vehicle_data['license_plate'],
+            'weight': f"{car_info['Kerb Weight (kg)']} kg",
+            'weight_range': car_info.get('Kerb Weight (kg)', 'Unknown')
+        },
+        'parking': {
+            'floor': slot['floor'],
+            'slot': slot['slot_code'],
+            'slot_code': slot['slot_code']
+        },
+        'image_url': f'/static/uploads/{image_filename}',
+        'entry_time': vehicle_data['entry_time'].strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def _allowed(filename, extensions):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions
+
+
+def iter_uploads(files, store, extensions):
+    """
+    Save uploaded images one by one into the ImageStore, unpacking .zip uploads member by
+    member (never the whole archive in memory). Yields (source name, store key or None, error or None).
+    """
+    count = 0
+    for file in files:
+        if file.filename.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile:
+                yield file.filename, None, 'Invalid zip file'
+                continue
+        else:
+            archive = None
+
+        with archive or nullcontext():  # the zip is closed even if the consumer stops early
+            if archive is None:
+                members = [(file.filename, file)]
+            else:
+                members = [(f"{file.filename}/{m.filename}", m) for m in archive.infolist() if not m.is_dir()]
+
+            for name, member in members:
+                count += 1
+                if count > MAX_BATCH_IMAGES:
+                    yield name, None, f'Batch limited to {MAX_BATCH_IMAGES} images'
+                    return
+                if not _allowed(name, extensions):
+                    yield name, None, 'Invalid file type'
+                    continue
+                if archive is not None and member.file_size > MAX_IMAGE_BYTES:
+                    yield name, None, 'Image too large'
+                    continue
+
+                if archive is None:
+                    key = store.save(member.stream, name)
+                else:
+                    with archive.open(member) as source:
+                        key = store.save(source, name)
+                yield name, key, None
+
+class BatchPipeline:
+    """
+    decode -> detect -> identify + park, one thread per stage joined by bounded queues,
+    so images are being unpacked while the previous batch is in YOLO / OCR and the one
+    before that is being parked. YOLO and OCR run on BATCH_SIZE images per call and every
+    batch gets its slots in a single DB transaction.
+    """
+
+    def __init__(self, yolo, ocr, fuzzy, plate_engine, db, store, extensions, batch_size=BATCH_SIZE):
+        self.yolo = yolo
+        self.ocr = ocr
+        self.fuzzy = fuzzy
+        self.plate_engine = plate_engine
+        self.db = db
+        self.store = store
+        self.extensions = extensions
+        self.batch_size = batch_size
+        self._stopped = threading.Event()  # consumer gone (client disconnected)
+
+    def _put(self, out, batch):
+        """Blocking put that gives up once the consumer has stopped"""
+        while not self._stopped.is_set():
+            try:
+                out.put(batch, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode(self, files, out):
+        batch = []
+        try:
+            for index, (name, filename, error) in enumerate(iter_uploads(files, self.store, self.extensions)):
+                batch.append({'index': index, 'file': name, 'filename': filename, 'error': error})
+                if len(batch) == self.batch_size:
+                    if not self._put(out, batch):
+                        return
+                    batch = []
+        except Exception as e:
+            batch.append({'index': -1, 'file': None, 'filename': None, 'error': f'Upload error: {e}'})
+        if batch and not self._put(out, batch):
+            return
+        self._put(out, None)
+
+    def _detect(self, inbox, out):
+        while not self._stopped.is_set():
+            try:
+                batch = inbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if batch is None:
+                break
+            items = [item for item in batch if item['filename']]
+            paths = [self.store.path(item['filename']) for item in items]
+            try:
+                yolo_results = self.yolo.detect_batch(paths)
+                ocr_results = self.ocr.process_image_batch(paths)
+                for item, yolo_result, ocr_result in zip(items, yolo_results, ocr_results):
+                    item['yolo'], item['ocr'] = yolo_result, ocr_result
+            except Exception as e:
+                for item in items:
+                    item['error'] = f'Detection error: {e}'
+            if not self._put(out, batch):
+                return
+        self._put(out, None)
+
+    def run(self, files):
+        """Yield one result dict per image, in upload order"""
+        decoded = queue.Queue(maxsize=QUEUE_BATCHES)
+        detected = queue.Queue(maxsize=QUEUE_BATCHES)
+        threading.Thread(target=self._decode, args=(files, decoded), name='batch-decode', daemon=True).start()
+        threading.Thread(target=self._detect, args=(decoded, detected), name='batch-detect', daemon=True).start()
+
+        try:
+            while True:
+                batch = detected.get()
+                if batch is None:
+                    return
+                for result in self._park(batch):
+                    yield result
+        finally:
+            self._stopped.set()
+
+    def _park(self, batch):
+        results, pending = {}, []
+        for item in batch:
+            if item['error']:
+                if item['filename']:
+                    self.db.release_image(item['filename'])  # stored, but failed detection
+                results[item['index']] = {'success': False, 'error': item['error']}
+                continue
+            try:
+                identified = identify_vehicle(self.fuzzy, self.plate_engine, item['yolo'], item['ocr'], log=quiet)
+                vehicle_data = vehicle_record(identified, item['filename'])
+                pending.append((item, identified, vehicle_data))
+            except Exception as e:
+                self.db.release_image(item['filename'])
+                results[item['index']] = {'success': False, 'error': str(e)}
+
+        slots = self.db.allocate_and_park_many([(data, identified['floor']) for _, identified, data in pending])
+        for (item, identified, vehicle_data), slot in zip(pending, slots):
+            if slot is None:
+                self.db.release_image(item['filename'])
+                results[item['index']] = {'success': False, 'error': 'Parking lot is full'}
+            else:
+                data = process_result(identified, vehicle_data, slot, item['filename'], self.fuzzy.version)
+                results[item['index']] = {'success': True, 'data': data}
+
+        for item in batch:
+            yield dict({'record': 'image', 'index': item['index'], 'file': item['file']}, **results[item['index']])
@@ -0,0 +1,180 @@
+import re
+
+# Ký tự OCR hay nhầm: đọc ra chữ ở vị trí số / số ở vị trí chữ
+DIGIT_LOOKALIKES = {'O': '0', 'D': '0', 'Q': '0', 'I': '1', 'L': '1', 'T': '1',
+                    'Z': '2', 'S': '5', 'G': '6', 'B': '8'}
+LETTER_LOOKALIKES = {'0': 'D', '1': 'T', '2': 'Z', '4': 'A', '5': 'S', '6': 'G', '8': 'B'}
+# Position-free comparison of plates: every lookalike read as its digit
+PLATE_FOLD = str.maketrans(DIGIT_LOOKALIKES)
+
+# Vietnamese plate grammars: D = digit, L = series letter
+#   car   51A-123.45 / 51LD-123.45 / 30A-1234
+#   moto  59X1-123.45
+#   army  KA-12-34 / TM-123-45
+PLATE_GRAMMARS = (
+    ('car', (('DDL' + 'D' * 5, 1.0), ('DDL' + 'D' * 4, 0.95),
+             ('DDLL' + 'D' * 5, 0.9), ('DDLL' + 'D' * 4, 0.85))),
+    ('moto', (('DDLD' + 'D' * 5, 0.9), ('DDLD' + 'D' * 4, 0.85))),
+    ('army', (('LL' + 'D' * 5, 0.6), ('LL' + 'D' * 4, 0.6))),
+)
+
+SEPARATORS = re.compile(r'[\s\-.·:_]+')
+MAX_CORRECTIONS = 3
+CORRECTION_PENALTY = 0.8  # score multiplier per lookalike fixed (O/0, I/L/1, B/8, S/5)
+RARE_CORRECTION_PENALTY = 0.65  # the less common ones (D/0, T/1, Z/2, G/6, A/4, Q/0)
+COMMON_LOOKALIKES = frozenset('O0IL1B8S5')
+NEIGHBOR_PENALTY = 0.5  # window glued to other letters/digits ('CIVIC2024', '59X11234|5')
+PAIR_PENALTY = 0.9  # plate split over two detections (2-line plates)
+MIN_SCORE = 0.35
+
+
+def _position_class(kind):
+    if kind == 'D':
+        return '[0-9' + ''.join(DIGIT_LOOKALIKES) + ']'
+    return '[A-Z' + ''.join(LETTER_LOOKALIKES) + ']'
+
+
+def _compile_template(template):
+    # Lookahead so finditer reports overlapping windows at every start position
+    return re.compile('(?=(' + ''.join(_position_class(kind) for kind in template) + '))')
+
+
+def _compile_strict(template):
+    return re.compile(''.join('[0-9]' if kind == 'D' else '[A-Z]' for kind in template))
+
+
+def canonical_plate(text):
+    """'51a-123.45' -> '51A12345'"""
+    return SEPARATORS.sub('', str(text or '').upper())
+
+
+def format_plate(plate, kind='car'):
+    """'51A12345' -> '51A-123.45', '51A1234' -> '51A-1234'"""
+    prefix_length = {'car': 4 if plate[3:4].isalpha() else 3, 'moto': 4, 'army': 2}.get(kind, 3)
+    prefix, number = plate[:prefix_length], plate[prefix_length:]
+    if len(number) == 5:
+        number = f"{number[:3]}.{number[3:]}"
+    return f"{prefix}-{number}"
+
+
+class PlateEngine:
+    """
+    Compiled Vietnamese license-plate extractor shared by every OCR backend.
+    All detections (and pairs of adjacent detections, for 2-line plates) are scored
+    in one call; lookalike characters are fixed according to their position.
+    """
+
+    def __init__(self, grammars=PLATE_GRAMMARS, max_corrections=MAX_CORRECTIONS, min_score=MIN_SCORE):
+        self.max_corrections = max_corrections
+        self.min_score = min_score
+        self._digit_table = str.maketrans(DIGIT_LOOKALIKES)
+        self._letter_table = str.maketrans(LETTER_LOOKALIKES)
+        self._digit_chars = frozenset('0123456789' + ''.join(DIGIT_LOOKALIKES))
+        # (kind, prior, template, loose pattern, strict pattern), longest templates first
+        self.grammars = sorted(
+            ((kind, prior, template, _compile_template(template), _compile_strict(template))
+             for kind, templates in grammars for template, prior in templates),
+            key=lambda grammar: -len(grammar[2]),
+        )
+
+    def _normalize(self, window, template):
+        """Fix lookalikes position by position; returns (plate, corrections, score factor)"""
+        chars = []
+        corrections = 0
+        factor = 1.0
+        for char, kind in zip(window, template):
+            if kind == 'D':
+                fixed = char.translate(self._digit_table)
+            else:
+                fixed = char.translate(self._letter_table)
+            if fixed != char:
+                corrections += 1
+                factor *= CORRECTION_PENALTY if char in COMMON_LOOKALIKES else RARE_CORRECTION_PENALTY
+            chars.append(fixed)
+        return ''.join(chars), corrections, factor
+
+    def _score_text(self, text, confidence, source, results):
+        compact = canonical_plate(text)
+        if len(compact) < 6:
+            return
+        for kind, prior, template, pattern, strict in self.grammars:
+            for match in pattern.finditer(compact):
+                window = match.group(1)
+                start, end = match.start(1), match.end(1)
+                if strict.fullmatch(window):
+                    plate, corrections, factor = window, 0, 1.0  # clean read, nothing to fix
+                else:
+                    plate, corrections, factor = self._normalize(window, template)
+                if corrections > self.max_corrections:
+                    continue
+                # Plates that fill the whole detection beat plates buried in longer text
+                coverage = len(window) / len(compact)
+                score = confidence * prior * factor * (0.5 + 0.5 * coverage)
+                if (start and compact[start - 1].isalpha() == template[0].isalpha()) or \
+                        (end < len(compact) and compact[end] in self._digit_chars):
+                    score *= NEIGHBOR_PENALTY
+                if kind != 'army' and not 11 <= int(plate[:2]) <= 99:
+                    score *= 0.5  # no province code below 11
+                current = results.get(plate)
+                if current is None or score > current['score']:
+                    results[plate] = {
+                        'plate': plate,
+                        'display': format_plate(plate, kind),
+                        'kind': kind,
+                        'score': round(score, 4),
+                        'corrections': corrections,
+                        'source': source,
+                    }
+
+    @staticmethod
+    def _items(detections):
+        """Accept ['51A..'] or [{'text': .., 'confidence': ..}]"""
+        items = []
+        for detection in detections or ():
+            if isinstance(detection, dict):
+                text = detection.get('text') or ''
+                confidence = detection.get('confidence')
+            else:
+                text, confidence = detection, None
+            text = str(text).strip()
+            if text:
+                items.append((text, float(confidence) if confidence is not None else 1.0))
+        return items
+
+    def candidates(self, detections):
+        """Every plate reading found in the detections, best first"""
+        items = self._items(detections)
+        results = {}
+        for text, confidence in items:
+            self._score_text(text, confidence, text, results)
+        for (first, first_conf), (second, second_conf) in zip(items, items[1:]):
+            self._score_text(f"{first} {second}", min(first_conf, second_conf) * PAIR_PENALTY,
+                             f"{first} | {second}", results)
+        return sorted(results.values(), key=lambda result: -result['score'])
+
+    def best(self, detections):
+        """Best plate match (dict) scoring at least min_score, or None"""
+        candidates = self.candidates(detections)
+        if candidates and candidates[0]['score'] >= self.min_score:
+            return candidates[0]
+        return None
+
+    def extract(self, detections):
+        """Canonical plate string ('51A12345') or None"""
+        best = self.best(detections)
+        return best['plate'] if best else None
+
+
+_default_engine = None
+
+
+def get_plate_engine():
+    """Shared engine (grammars compiled once per process)"""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = PlateEngine()
+    return _default_engine
+
+
+def extract_license_plate(detections):
+    return get_plate_engine().extract(detections)
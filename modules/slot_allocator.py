@@ -0,0 +1,123 @@
+import threading
+
+
+class FloorBitmap:
+    """Free slots of one floor as bits of an int (bit i = i-th slot by id is free)"""
+
+    def __init__(self, slots):
+        self.slots = slots  # [(slot_id, slot_code)] sorted by id
+        self.position = {slot_id: i for i, (slot_id, _) in enumerate(slots)}
+        self.free_bits = 0
+        self.free_count = 0
+
+    @property
+    def total(self):
+        return len(self.slots)
+
+    def set_free(self, slot_id, free):
+        """Returns True when the slot actually changed state"""
+        bit = 1 << self.position[slot_id]
+        if bool(self.free_bits & bit) == free:
+            return False
+        self.free_bits ^= bit
+        self.free_count += 1 if free else -1
+        return True
+
+    def first_free(self, exclude=()):
+        """(slot_id, slot_code) of the lowest free slot not in `exclude` (slot ids), or None"""
+        free_bits = self.free_bits
+        for slot_id in exclude:
+            position = self.position.get(slot_id)
+            if position is not None:
+                free_bits &= ~(1 << position)
+        if not free_bits:
+            return None
+        lowest = (free_bits & -free_bits).bit_length() - 1
+        return self.slots[lowest]
+
+
+class OccupancyMap:
+    """
+    In-process copy of parking_slots occupancy: next free slot and per-floor counts
+    without touching SQLite. The table stays the source of truth: callers change the
+    map only after their transaction commits, and rebuild() reloads it from the table.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()  # held across "pick slot -> write -> mark" by the DB layer
+        self.floors = {}  # floor -> FloorBitmap
+        self.slot_floor = {}  # slot_id -> floor
+        self.slot_ids = {}  # slot_code -> slot_id
+        self.version = 0  # bumped on every occupancy change (status snapshot / ETag)
+
+    def rebuild(self, conn):
+        """Reload from parking_slots (startup, after a crash or a bulk reset)"""
+        rows = conn.execute(
+            "SELECT id, slot_code, floor, is_occupied FROM parking_slots WHERE active = 1 ORDER BY floor, id"
+        ).fetchall()
+
+        by_floor = {}
+        for slot_id, slot_code, floor, _ in rows:
+            by_floor.setdefault(floor, []).append((slot_id, slot_code))
+
+        floors = {floor: FloorBitmap(slots) for floor, slots in by_floor.items()}
+        for slot_id, _, floor, is_occupied in rows:
+            floors[floor].set_free(slot_id, not is_occupied)
+
+        with self.lock:
+            self.floors = floors
+            self.slot_floor = {row[0]: row[2] for row in rows}
+            self.slot_ids = {row[1]: row[0] for row in rows}
+            self.version += 1
+        return self
+
+    def next_free(self, floor, exclude=()):
+        """{'id', 'slot_code', 'floor'} of the first free slot on the floor, or None"""
+        bitmap = self.floors.get(floor)
+        slot = bitmap.first_free(exclude) if bitmap else None
+        if slot is None:
+            return None
+        return {'id': slot[0], 'slot_code': slot[1], 'floor': floor}
+
+    def next_free_any(self, preferred_floor=None, floors=None, exclude=()):
+        """
+        Preferred floor first, then the other floors (optionally only `floors`) in order.
+        `exclude`: slot ids already claimed by the caller's uncommitted transaction.
+        """
+        candidates = self.floors if floors is None else [f for f in floors if f in self.floors]
+        order = sorted(candidates, key=lambda floor: (floor != preferred_floor, floor))
+        for floor in order:
+            slot = self.next_free(floor, exclude)
+            if slot:
+                return slot
+        return None
+
+    def mark(self, slot_id, occupied):
+        # set_free / version are read-modify-writes: exits and deletes race with check-ins
+        with self.lock:
+            floor = self.slot_floor.get(slot_id)
+            if floor is not None and self.floors[floor].set_free(slot_id, not occupied):
+                self.version += 1
+
+    def touch(self):
+        """Bump the version without an occupancy change (details of an occupied slot changed)"""
+        with self.lock:
+            self.version += 1
+
+    def mark_code(self, slot_code, occupied):
+        slot_id = self.slot_ids.get(slot_code)
+        if slot_id is not None:
+            self.mark(slot_id, occupied)
+
+    def counts(self, floor):
+        """(total, occupied, available) for a floor"""
+        bitmap = self.floors.get(floor)
+        if bitmap is None:
+            return 0, 0, 0
+        return bitmap.total, bitmap.total - bitmap.free_count, bitmap.free_count
+
+    def total(self):
+        return sum(bitmap.total for bitmap in self.floors.values())
+
+    def available(self):
+        return sum(bitmap.free_count for bitmap in self.floors.values())
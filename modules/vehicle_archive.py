@@ -0,0 +1,113 @@
+import os
+from contextlib import contextmanager
+from datetime import date
+
+DEFAULT_ARCHIVE_DIR = 'database/archive'
+ARCHIVE_AFTER_DAYS = 30  # exited vehicles older than this leave the hot table
+ATTACH_LIMIT = 8  # SQLite allows 10 attached databases per connection by default
+
+VEHICLE_COLUMNS = (
+    'id', 'license_plate', 'brand_raw', 'brand_corrected', 'model_raw', 'model_corrected',
+    'weight', 'detected_floor', 'assigned_slot', 'image_path', 'entry_time', 'exit_time', 'status',
+)
+
+# Same columns as vehicles (ids kept), no AUTOINCREMENT: rows only arrive from the hot table
+ARCHIVE_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.vehicles (
+        id INTEGER PRIMARY KEY,
+        license_plate TEXT,
+        brand_raw TEXT,
+        brand_corrected TEXT,
+        model_raw TEXT,
+        model_corrected TEXT,
+        weight INTEGER,
+        detected_floor INTEGER,
+        assigned_slot TEXT,
+        image_path TEXT,
+        entry_time DATETIME,
+        exit_time DATETIME,
+        status TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_vehicles_entry_time ON vehicles (entry_time)',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_vehicles_plate ON vehicles (license_plate)',
+)
+
+
+def month_start(month):
+    """'2024-03' -> '2024-03-01'"""
+    return f"{month}-01"
+
+
+def next_month_start(month):
+    """'2024-12' -> '2025-01-01'"""
+    year, number = map(int, month.split('-'))
+    return date(year + number // 12, number % 12 + 1, 1).isoformat()
+
+
+class VehicleArchive:
+    """
+    Per-month SQLite files (vehicles_YYYY_MM.db) holding exited vehicles, partitioned by
+    entry month. Files are attached to a pooled connection only while a query needs them.
+    """
+
+    def __init__(self, archive_dir=DEFAULT_ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+
+    def path(self, month):
+        return os.path.join(self.archive_dir, f"vehicles_{month.replace('-', '_')}.db")
+
+    @contextmanager
+    def attached(self, conn, months):
+        """Attach the months as a0, a1 ...; yields [(schema, month)], detached on exit"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        schemas = []
+        try:
+            for i, month in enumerate(months):
+                schema = f"a{i}"
+                conn.execute(f"ATTACH DATABASE ? AS {schema}", (self.path(month),))
+                schemas.append((schema, month))
+            yield schemas
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            for schema, _ in schemas:
+                conn.execute(f"DETACH DATABASE {schema}")
+
+    @staticmethod
+    def create_schema(conn, schema):
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement.format(schema=schema))
+
+    def remove(self, month):
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            try:
+                os.remove(self.path(month) + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def months_in_range(catalog, start=None, end=None):
+    """Archived months (sorted) holding entries in [start, end), from the catalog's entry bounds"""
+    return [month for month, entry in sorted(catalog.items())
+            if (not start or str(entry['last_entry']) >= str(start)) and
+            (not end or str(entry['first_entry']) < str(end))]
+
+
+def history_windows(months, start=None, end=None, limit=ATTACH_LIMIT):
+    """
+    Split [start, end) into consecutive (lo, hi, months) windows with at most `limit`
+    archive months each. Archives are partitioned by entry month, so rows of a window
+    never fall in another one and windows can be read one after the other in order.
+    `months` must be sorted (see months_in_range); lo / hi of None mean unbounded.
+    """
+    if not months:
+        return [(start, end, [])]
+    groups = [months[i:i + limit] for i in range(0, len(months), limit)]
+    windows = []
+    for i, group in enumerate(groups):
+        lo = start if i == 0 else month_start(group[0])
+        hi = end if i == len(groups) - 1 else month_start(groups[i + 1][0])
+        windows.append((lo, hi, group))
+    return windows
@@ -0,0 +1,95 @@
+import queue
+import threading
+import time
+
+BATCH_SIZE = 64  # items per write transaction
+MAX_DELAY_SECONDS = 0.05  # an item waits at most this long for its batch to fill
+QUEUE_SIZE = 10000  # producers block (back-pressure) when the writer falls this far behind
+
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """
+    Background thread that drains a queue into `persist(items)`, one call (one transaction)
+    per batch of up to BATCH_SIZE items or MAX_DELAY_SECONDS, whichever comes first.
+    flush() waits until everything queued so far is persisted (later puts don't extend the
+    wait); close() drains and stops, so a clean shutdown loses nothing.
+    """
+
+    def __init__(self, persist, batch_size=BATCH_SIZE, max_delay=MAX_DELAY_SECONDS,
+                 queue_size=QUEUE_SIZE, name='write-behind'):
+        self.persist = persist
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        # Items are numbered as they're queued; flush() waits for the number it saw on entry
+        self._put_lock = threading.Lock()
+        self._put_seq = 0
+        self._done = threading.Condition()
+        self._done_seq = 0
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def put(self, item):
+        if self._closed:
+            raise RuntimeError('write-behind writer is closed')
+        with self._put_lock:  # numbering and queue order must agree
+            self._put_seq += 1
+            self._queue.put((self._put_seq, item))
+
+    def flush(self):
+        """Block until every item put so far has been persisted (or failed)"""
+        target = self._put_seq
+        with self._done:
+            self._done.wait_for(lambda: self._done_seq >= target or not self._thread.is_alive())
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _next_batch(self):
+        """First item blocks; the rest are taken until the batch is full or its deadline passes"""
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # finish this batch, stop on the next round
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                with self._done:
+                    self._done.notify_all()
+                return
+            try:
+                self.persist([item for _, item in batch])
+                self.batches += 1
+                self.items += len(batch)
+            except Exception as e:
+                print(f"❌ Write-behind batch of {len(batch)} failed: {e}")
+            finally:
+                with self._done:
+                    self._done_seq = batch[-1][0]
+                    self._done.notify_all()
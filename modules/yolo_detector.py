@@ -30,27 +30,52 @@ class YOLODetector:
             
             # Process results
             if len(results) > 0:
-                boxes = results[0].boxes
-                
-                if boxes is not None and len(boxes) > 0:
-                    # Get detection with highest confidence
-                    best_idx = torch.argmax(boxes.conf).item()
-                    best_box = boxes[best_idx]
-                    
-                    brand_id = int(best_box.cls.item())
-                    brand_name = results[0].names[brand_id]
-                    confidence = best_box.conf.item()
-                    
-                    print(f"✅ YOLO detected: {brand_name} (confidence: {confidence:.2f})")
-                    return {
-                        'brand': brand_name,
-                        'confidence': float(confidence),
-                        'box': best_box.xyxy.tolist()[0] if hasattr(best_box.xyxy, 'tolist') else []
-                    }
+                detection = self._best_detection(results[0])
+                if detection:
+                    print(f"✅ YOLO detected: {detection['brand']} (confidence: {detection['confidence']:.2f})")
+                    return detection
             
             print("⚠️ YOLO: No detection found")
             return {'brand': 'unknown', 'confidence': 0.0}
             
         except Exception as e:
             print(f"❌ YOLO detection error: {e}")
-            return {'brand': 'unknown', 'confidence': 0.0}
\ No newline at end of file
+            return {'brand': 'unknown', 'confidence': 0.0}
+
+    @staticmethod
+    def _best_detection(result):
+        """Highest-confidence box of one image's result, or None"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return None
+        
+        # Get detection with highest confidence
+        best_idx = torch.argmax(boxes.conf).item()
+        best_box = boxes[best_idx]
+        
+        brand_id = int(best_box.cls.item())
+        return {
+            'brand': result.names[brand_id],
+            'confidence': float(best_box.conf.item()),
+            'box': best_box.xyxy.tolist()[0] if hasattr(best_box.xyxy, 'tolist') else []
+        }
+    
+    def detect_batch(self, image_paths):
+        """detect() for several images in one forward pass; one result dict per path"""
+        unknown = {'brand': 'unknown', 'confidence': 0.0}
+        if not self.model:
+            return [dict(unknown) for _ in image_paths]
+        
+        images = [cv2.imread(path) for path in image_paths]
+        readable = [i for i, img in enumerate(images) if img is not None]
+        detections = [dict(unknown) for _ in image_paths]
+        if not readable:
+            return detections
+        
+        try:
+            results = self.model([images[i] for i in readable], verbose=False)
+            for i, result in zip(readable, results):
+                detections[i] = self._best_detection(result) or dict(unknown)
+        except Exception as e:
+            print(f"❌ YOLO batch detection error: {e}")
+        return detections
@@ -1,6 +1,13 @@
 // Configuration
 const API_BASE = 'http://localhost:5000/api';
 let currentVehicle = null;
+let lotTopology = null;  // floors + slot codes from /api/topology (loaded once)
+let lastStatusEtag = null;  // skip re-rendering when /api/status hasn't changed
+let floorCounts = {};  // floor -> {occupied, total}, kept current by status loads and events
+let eventSource = null;
+let pollTimers = [];  // fallback polling while the event stream is down
+let refreshTimer = null;  // pending event-driven reload of recent activity + stats
+const EVENT_REFRESH_MS = 1000;  // at most one such reload per second (batch ingest = many events)
 
 // DOM Elements
 const fileInput = document.getElementById('fileInput');
@@ -121,74 +128,109 @@ function displayResults(data) {
     document.getElementById('parkingSlot').textContent = parking.slot || '-';
 }
 
+// Load lot topology (floors, slot codes) once
+async function loadTopology() {
+    if (lotTopology) return lotTopology;
+    try {
+        const response = await fetch(`${API_BASE}/topology`);
+        const result = await response.json();
+        if (result && result.success) {
+            lotTopology = {};
+            result.data.floors.forEach(floor => { lotTopology[floor.floor] = floor; });
+        }
+    } catch (error) {
+        console.error('Error loading topology:', error);
+    }
+    return lotTopology;
+}
+
 // Update parking status
 async function updateParkingStatus() {
     try {
+        await loadTopology();
         const response = await fetch(`${API_BASE}/status`);
+        const etag = response.headers.get('ETag');
+        if (etag && etag === lastStatusEtag) return;
         const result = await response.json();
         
         if (result && result.success) {
+            lastStatusEtag = etag;
             const status = result.data;
             
-            // Update floor stats
-            for (let floor = 1; floor <= 3; floor++) {
+            // Update floor stats (every floor the server reports)
+            floorCounts = {};
+            Object.keys(status).forEach(floor => {
                 const floorData = status[floor];
-                if (!floorData) continue;
-                
-                document.getElementById(`floor${floor}Occupied`).textContent = floorData.occupied;
-                document.getElementById(`floor${floor}Available`).textContent = floorData.available;
-                
-                // Update progress bars
-                const percentage = floorData.total > 0 ? (floorData.occupied / floorData.total) * 100 : 0;
-                document.getElementById(`floor${floor}Progress`).style.width = `${percentage}%`;
-                document.getElementById(`floor${floor}Percent`).textContent = `${Math.round(percentage)}%`;
+                updateFloorStats(floor, floorData);
                 
                 // Update slots grid
                 updateFloorSlots(floor, floorData.occupied_slots || []);
-            }
-            
-            // Update total count
-            const totalOccupied = (status[1].occupied || 0) + (status[2].occupied || 0) + (status[3].occupied || 0);
-            document.getElementById('parkingCount').innerHTML = `
-                <i class="fas fa-car"></i>
-                <span>${totalOccupied}/60 Parked</span>
-            `;
+            });
+            updateParkingCount();
         }
     } catch (error) {
         console.error('Error updating status:', error);
     }
 }
 
+// Update one floor's counters and progress bar
+function updateFloorStats(floor, floorData) {
+    floorCounts[floor] = {occupied: floorData.occupied || 0, total: floorData.total || 0};
+    
+    const occupiedEl = document.getElementById(`floor${floor}Occupied`);
+    if (!occupiedEl) return;
+    
+    occupiedEl.textContent = floorData.occupied;
+    document.getElementById(`floor${floor}Available`).textContent = floorData.available;
+    
+    // Update progress bars
+    const percentage = floorData.total > 0 ? (floorData.occupied / floorData.total) * 100 : 0;
+    document.getElementById(`floor${floor}Progress`).style.width = `${percentage}%`;
+    document.getElementById(`floor${floor}Percent`).textContent = `${Math.round(percentage)}%`;
+}
+
+// Update total count
+function updateParkingCount() {
+    let totalOccupied = 0;
+    let totalSlots = 0;
+    Object.values(floorCounts).forEach(counts => {
+        totalOccupied += counts.occupied;
+        totalSlots += counts.total;
+    });
+    document.getElementById('parkingCount').innerHTML = `
+        <i class="fas fa-car"></i>
+        <span>${totalOccupied}/${totalSlots} Parked</span>
+    `;
+}
+
+// Render one slot cell (empty or occupied)
+function renderSlot(slotDiv, slotCode, slotData) {
+    slotDiv.className = `slot-item ${slotData ? 'occupied' : 'empty'}`;
+    slotDiv.dataset.slot = slotCode;
+    slotDiv.innerHTML = `
+        <div class="slot-code">${slotCode}</div>
+        <div class="slot-info">${slotData ? (slotData.license_plate || 'Occupied') : 'Empty'}</div>
+    `;
+}
+
 // Update floor slots
 function updateFloorSlots(floor, occupiedSlots) {
     const slotGrid = document.getElementById(`slotsFloor${floor}`);
     if (!slotGrid) return;
     
-    const floorPrefix = ['I', 'II', 'III'][floor - 1];
+    const floorInfo = lotTopology && lotTopology[floor];
+    const slotCodes = floorInfo ? floorInfo.slot_codes : [];
+    const occupiedByCode = {};
+    (occupiedSlots || []).forEach(slot => { occupiedByCode[slot.slot_code] = slot; });
     slotGrid.innerHTML = '';
     
-    // Create 20 slots
-    for (let i = 0; i < 20; i++) {
-        const slotCode = `${floorPrefix}.${String.fromCharCode(65 + i)}`;
-        const slotData = (occupiedSlots || []).find(slot => slot.slot_code === slotCode);
+    slotCodes.forEach(slotCode => {
+        const slotData = occupiedByCode[slotCode];
         
         const slotDiv = document.createElement('div');
-        slotDiv.className = `slot-item ${slotData ? 'occupied' : 'empty'}`;
-        
-        if (slotData) {
-            slotDiv.innerHTML = `
-                <div class="slot-code">${slotCode}</div>
-                <div class="slot-info">${slotData.license_plate || 'Occupied'}</div>
-            `;
-        } else {
-            slotDiv.innerHTML = `
-                <div class="slot-code">${slotCode}</div>
-                <div class="slot-info">Empty</div>
-            `;
-        }
-        
+        renderSlot(slotDiv, slotCode, slotData);
         slotGrid.appendChild(slotDiv);
-    }
+    });
 }
 
 // Update recent activity
@@ -328,13 +370,74 @@ function showNotification(message, type = 'info') {
     }, 3000);
 }
 
-// Auto-refresh parking status every 10 seconds
-setInterval(updateParkingStatus, 10000);
+// Apply one occupancy delta from /api/events without reloading the whole status
+function applyOccupancyEvent(type, data) {
+    if (data.floor === undefined) {
+        updateParkingStatus();
+        return;
+    }
+    lastStatusEtag = null;  // our rendered state no longer matches any ETag
+    updateFloorStats(data.floor, data);
+    updateParkingCount();
+    
+    const slotDiv = document.querySelector(`#slotsFloor${data.floor} [data-slot="${data.slot_code}"]`);
+    if (slotDiv) {
+        renderSlot(slotDiv, data.slot_code, type === 'vehicle_entry' ? data : null);
+    }
+}
+
+function startPolling() {
+    if (pollTimers.length) return;
+    pollTimers.push(setInterval(updateParkingStatus, 10000));
+    pollTimers.push(setInterval(updateSystemStats, 30000));
+}
+
+function stopPolling() {
+    pollTimers.forEach(timer => clearInterval(timer));
+    pollTimers = [];
+}
+
+// Coalesce the reloads events trigger: one fetch pair per EVENT_REFRESH_MS, not per event
+function scheduleRefresh() {
+    if (refreshTimer) return;
+    refreshTimer = setTimeout(() => {
+        refreshTimer = null;
+        updateRecentActivity();
+        updateSystemStats();
+    }, EVENT_REFRESH_MS);
+}
+
+// Live updates over server-sent events; falls back to polling while disconnected.
+// EventSource reconnects by itself and sends Last-Event-ID, so missed events are replayed.
+function subscribeToEvents() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    eventSource = new EventSource(`${API_BASE}/events`);
+    
+    eventSource.onopen = () => stopPolling();
+    eventSource.onerror = () => startPolling();
+    
+    ['vehicle_entry', 'vehicle_exit', 'vehicle_deleted'].forEach(type => {
+        eventSource.addEventListener(type, (event) => {
+            applyOccupancyEvent(type, JSON.parse(event.data));
+            scheduleRefresh();
+        });
+    });
+    ['reset', 'resync'].forEach(type => {
+        eventSource.addEventListener(type, () => {
+            updateParkingStatus();
+            scheduleRefresh();
+        });
+    });
+}
 
 // Initialize on load
 document.addEventListener('DOMContentLoaded', () => {
     updateParkingStatus();
     updateRecentActivity();
+    subscribeToEvents();
     
     // Check if server is running
     fetch(`${API_BASE}/status`)
@@ -405,36 +508,30 @@ document.getElementById('resetSystemBtn').addEventListener('click', () => {
 });
 
 // Export Data
-document.getElementById('exportDataBtn').addEventListener('click', async () => {
-    try {
-        const response = await fetch('/api/export-data');
-        const blob = await response.blob();
-        
-        // Create download link
-        const url = window.URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = `parking_data_${new Date().toISOString().split('T')[0]}.json`;
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        window.URL.revokeObjectURL(url);
-        
-        showNotification('Data exported successfully', 'success');
-    } catch (error) {
-        console.error('Error exporting data:', error);
-        showNotification('Failed to export data', 'error');
-    }
+document.getElementById('exportDataBtn').addEventListener('click', () => {
+    // Let the browser stream the file straight to disk instead of buffering a Blob
+    const a = document.createElement('a');
+    a.href = '/api/export-data';
+    a.download = '';
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+    
+    showNotification('Export started', 'success');
 });
 
 // View All Vehicles
-document.getElementById('viewAllVehiclesBtn').addEventListener('click', async () => {
+document.getElementById('viewAllVehiclesBtn').addEventListener('click', () => loadVehiclesPage());
+
+// Load one page of parked vehicles (cursor = next_cursor of the previous page)
+async function loadVehiclesPage(cursor = null) {
     try {
-        const response = await fetch('/api/all-vehicles');
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const response = await fetch(`/api/all-vehicles${query}`);
         const result = await response.json();
         
         if (result.success) {
-            showAllVehiclesModal(result.data);
+            showAllVehiclesModal(result.data, result.next_cursor, Boolean(cursor));
         } else {
             showNotification(result.error || 'Failed to load vehicles', 'error');
         }
@@ -442,7 +539,7 @@ document.getElementById('viewAllVehiclesBtn').addEventListener('click', async ()
         console.error('Error loading vehicles:', error);
         showNotification('Server error', 'error');
     }
-});
+}
 
 // Update System Stats
 async function updateSystemStats() {
@@ -454,7 +551,7 @@ async function updateSystemStats() {
             const stats = result.data;
             document.getElementById('totalProcessed').textContent = stats.total_processed || 0;
             document.getElementById('currentParked').textContent = stats.current_parked || 0;
-            document.getElementById('availableSlots').textContent = stats.available_slots || 60;
+            document.getElementById('availableSlots').textContent = stats.available_slots ?? 0;
             document.getElementById('todayEntries').textContent = stats.today_entries || 0;
         }
     } catch (error) {
@@ -501,14 +598,17 @@ function showConfirmationModal(title, message, confirmCallback) {
 }
 
 // Show All Vehicles Modal
-function showAllVehiclesModal(vehicles) {
+function showAllVehiclesModal(vehicles, nextCursor = null, append = false) {
     const modal = document.getElementById('allVehiclesModal');
     const listContainer = document.getElementById('allVehiclesList');
     
-    if (!vehicles || vehicles.length === 0) {
+    const loadMoreBtn = listContainer.querySelector('.load-more-btn');
+    if (loadMoreBtn) loadMoreBtn.remove();
+    
+    if (!append && (!vehicles || vehicles.length === 0)) {
         listContainer.innerHTML = '<p class="empty-state">No vehicles in parking</p>';
     } else {
-        listContainer.innerHTML = vehicles.map(vehicle => `
+        const html = vehicles.map(vehicle => `
             <div class="vehicle-list-item" data-vehicle-id="${vehicle.id}">
                 <div class="vehicle-list-header">
                     <div class="vehicle-list-slot">${vehicle.assigned_slot}</div>
@@ -522,14 +622,28 @@ function showAllVehiclesModal(vehicles) {
                 </div>
             </div>
         `).join('');
+        if (append) {
+            listContainer.insertAdjacentHTML('beforeend', html);
+        } else {
+            listContainer.innerHTML = html;
+        }
         
-        // Add click event to each vehicle item
-        listContainer.querySelectorAll('.vehicle-list-item').forEach(item => {
+        // Add click event to each new vehicle item
+        listContainer.querySelectorAll('.vehicle-list-item:not([data-bound])').forEach(item => {
+            item.dataset.bound = '1';
             item.addEventListener('click', () => {
                 const vehicleId = item.dataset.vehicleId;
                 showVehicleDetailsModal(vehicleId);
             });
         });
+        
+        if (nextCursor) {
+            const button = document.createElement('button');
+            button.className = 'btn btn-secondary load-more-btn';
+            button.textContent = 'Load more';
+            button.onclick = () => loadVehiclesPage(nextCursor);
+            listContainer.appendChild(button);
+        }
     }
     
     modal.style.display = 'flex';
@@ -671,9 +785,6 @@ async function showVehicleDetailsModal(vehicleId) {
 
 // Initialize management features
 document.addEventListener('DOMContentLoaded', () => {
-    // Update stats on load
+    // Update stats on load (later updates arrive via subscribeToEvents)
     updateSystemStats();
-    
-    // Update stats every 30 seconds
-    setInterval(updateSystemStats, 30000);
 });
\ No newline at end of file